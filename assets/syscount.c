@@ -0,0 +1,372 @@
+/*
+ * Syscall counter for `pb152tools profile`, loaded into a task binary with
+ * LD_PRELOAD. Calls to the libc syscall wrappers below are counted per process
+ * and per call stack in a table mmap'ed from $PB152_SYSCOUNT_DIR/<pid>-<n>.bin,
+ * so the counts survive a process that is killed at the syscall limit. A copy
+ * of /proc/self/maps (<pid>-<n>.maps) lets the profiler resolve the addresses.
+ *
+ * Built on first use by src/syscall_profile.py:
+ *     cc -shared -fPIC -O2 -o syscount.so syscount.c -ldl
+ */
+#define _GNU_SOURCE
+#include <dlfcn.h>
+#include <errno.h>
+#include <execinfo.h>
+#include <fcntl.h>
+#include <poll.h>
+#include <stdarg.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/mman.h>
+#include <sys/socket.h>
+#include <sys/syscall.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#define MAGIC "PBSYSC1"
+#define CAPACITY 2048
+#define FRAMES 8
+
+struct entry
+{
+    char name[ 16 ];
+    uint32_t count;
+    uint32_t nframes;
+    uint64_t frames[ FRAMES ];
+};
+
+struct table
+{
+    char magic[ 8 ];
+    int32_t pid;
+    int32_t ppid;
+    uint32_t total;
+    uint32_t dropped;    /* calls that did not fit in the table */
+    struct entry entries[ CAPACITY ];
+};
+
+static struct table *table;
+static __thread int busy;
+
+/* Internal I/O goes straight to the kernel so it is neither wrapped nor counted. */
+static int raw_open( const char *path, int flags, int mode )
+{
+    return ( int ) syscall( SYS_openat, AT_FDCWD, path, flags, mode );
+}
+
+static void copy_maps( const char *path )
+{
+    char buf[ 4096 ];
+    int in = raw_open( "/proc/self/maps", O_RDONLY | O_CLOEXEC, 0 );
+    int out = raw_open( path, O_WRONLY | O_CREAT | O_TRUNC | O_CLOEXEC, 0600 );
+    long n;
+    if ( in >= 0 && out >= 0 )
+        while ( ( n = syscall( SYS_read, in, buf, sizeof buf ) ) > 0 )
+            if ( syscall( SYS_write, out, buf, n ) != n )
+                break;
+    if ( in >= 0 )
+        syscall( SYS_close, in );
+    if ( out >= 0 )
+        syscall( SYS_close, out );
+}
+
+static void init( void )
+{
+    const char *dir = getenv( "PB152_SYSCOUNT_DIR" );
+    char path[ 4096 ];
+    int fd = -1;
+
+    if ( table )
+        munmap( table, sizeof *table );
+    table = NULL;
+    if ( !dir )
+        return;
+
+    /* exec keeps the pid, so number the files of one pid */
+    for ( int n = 0; n < 64 && fd < 0; ++n )
+    {
+        snprintf( path, sizeof path - 8, "%s/%d-%d", dir, ( int ) getpid(), n );
+        strcat( path, ".bin" );
+        fd = raw_open( path, O_RDWR | O_CREAT | O_EXCL | O_CLOEXEC, 0600 );
+    }
+    if ( fd < 0 || syscall( SYS_ftruncate, fd, sizeof( struct table ) ) != 0 )
+        return;
+
+    void *mem = mmap( NULL, sizeof( struct table ), PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0 );
+    syscall( SYS_close, fd );
+    if ( mem == MAP_FAILED )
+        return;
+
+    table = mem;
+    table->pid = getpid();
+    table->ppid = getppid();
+    memcpy( table->magic, MAGIC, sizeof MAGIC );
+    strcpy( path + strlen( path ) - 4, ".maps" );
+    copy_maps( path );
+}
+
+__attribute__(( constructor ))
+static void start( void )
+{
+    void *frames[ 2 ];
+    busy = 1;
+    backtrace( frames, 2 );    /* loads the unwinder now, not inside the first counted call */
+    init();
+    busy = 0;
+}
+
+__attribute__(( noinline ))
+static void count( const char *name )
+{
+    if ( !table || busy )
+        return;
+    busy = 1;
+    int saved_errno = errno;
+
+    void *frames[ FRAMES ];
+    int nframes = backtrace( frames, FRAMES );
+    uint64_t hash = 1469598103934665603ULL;
+    for ( const char *c = name; *c; ++c )
+        hash = ( hash ^ ( unsigned char ) *c ) * 1099511628211ULL;
+    for ( int i = 0; i < nframes; ++i )
+        hash = ( hash ^ ( uint64_t ) ( uintptr_t ) frames[ i ] ) * 1099511628211ULL;
+
+    __atomic_add_fetch( &table->total, 1, __ATOMIC_RELAXED );
+    for ( int probe = 0; probe < CAPACITY; ++probe )
+    {
+        struct entry *e = &table->entries[ ( hash + probe ) % CAPACITY ];
+        if ( !e->name[ 0 ] )
+        {
+            strncpy( e->name, name, sizeof e->name - 1 );
+            e->nframes = nframes;
+            for ( int i = 0; i < nframes; ++i )
+                e->frames[ i ] = ( uint64_t ) ( uintptr_t ) frames[ i ];
+        }
+        if ( strcmp( e->name, name ) == 0 && e->nframes == ( uint32_t ) nframes )
+        {
+            int same = 1;
+            for ( int i = 0; i < nframes && same; ++i )
+                same = e->frames[ i ] == ( uint64_t ) ( uintptr_t ) frames[ i ];
+            if ( same )
+            {
+                __atomic_add_fetch( &e->count, 1, __ATOMIC_RELAXED );
+                goto done;
+            }
+        }
+    }
+    __atomic_add_fetch( &table->dropped, 1, __ATOMIC_RELAXED );
+done:
+    errno = saved_errno;
+    busy = 0;
+}
+
+#define REAL( ret, name, ... ) \
+    static ret ( *real )( __VA_ARGS__ ); \
+    if ( !real ) \
+        real = ( ret ( * )( __VA_ARGS__ ) ) dlsym( RTLD_NEXT, #name ); \
+    count( #name )
+
+ssize_t read( int fd, void *buf, size_t n )
+{
+    REAL( ssize_t, read, int, void *, size_t );
+    return real( fd, buf, n );
+}
+
+ssize_t write( int fd, const void *buf, size_t n )
+{
+    REAL( ssize_t, write, int, const void *, size_t );
+    return real( fd, buf, n );
+}
+
+ssize_t pread( int fd, void *buf, size_t n, off_t offset )
+{
+    REAL( ssize_t, pread, int, void *, size_t, off_t );
+    return real( fd, buf, n, offset );
+}
+
+ssize_t pwrite( int fd, const void *buf, size_t n, off_t offset )
+{
+    REAL( ssize_t, pwrite, int, const void *, size_t, off_t );
+    return real( fd, buf, n, offset );
+}
+
+int open( const char *path, int flags, ... )
+{
+    va_list ap;
+    va_start( ap, flags );
+    mode_t mode = ( flags & ( O_CREAT | O_TMPFILE ) ) ? va_arg( ap, mode_t ) : 0;
+    va_end( ap );
+    REAL( int, open, const char *, int, mode_t );
+    return real( path, flags, mode );
+}
+
+int openat( int dirfd, const char *path, int flags, ... )
+{
+    va_list ap;
+    va_start( ap, flags );
+    mode_t mode = ( flags & ( O_CREAT | O_TMPFILE ) ) ? va_arg( ap, mode_t ) : 0;
+    va_end( ap );
+    REAL( int, openat, int, const char *, int, mode_t );
+    return real( dirfd, path, flags, mode );
+}
+
+int close( int fd )
+{
+    REAL( int, close, int );
+    return real( fd );
+}
+
+off_t lseek( int fd, off_t offset, int whence )
+{
+    REAL( off_t, lseek, int, off_t, int );
+    return real( fd, offset, whence );
+}
+
+int pipe( int fds[ 2 ] )
+{
+    REAL( int, pipe, int * );
+    return real( fds );
+}
+
+int dup( int fd )
+{
+    REAL( int, dup, int );
+    return real( fd );
+}
+
+int dup2( int fd, int fd2 )
+{
+    REAL( int, dup2, int, int );
+    return real( fd, fd2 );
+}
+
+int unlink( const char *path )
+{
+    REAL( int, unlink, const char * );
+    return real( path );
+}
+
+int socket( int domain, int type, int protocol )
+{
+    REAL( int, socket, int, int, int );
+    return real( domain, type, protocol );
+}
+
+int socketpair( int domain, int type, int protocol, int fds[ 2 ] )
+{
+    REAL( int, socketpair, int, int, int, int * );
+    return real( domain, type, protocol, fds );
+}
+
+int bind( int fd, const struct sockaddr *addr, socklen_t len )
+{
+    REAL( int, bind, int, const struct sockaddr *, socklen_t );
+    return real( fd, addr, len );
+}
+
+int connect( int fd, const struct sockaddr *addr, socklen_t len )
+{
+    REAL( int, connect, int, const struct sockaddr *, socklen_t );
+    return real( fd, addr, len );
+}
+
+int listen( int fd, int backlog )
+{
+    REAL( int, listen, int, int );
+    return real( fd, backlog );
+}
+
+int accept( int fd, struct sockaddr *addr, socklen_t *len )
+{
+    REAL( int, accept, int, struct sockaddr *, socklen_t * );
+    return real( fd, addr, len );
+}
+
+ssize_t send( int fd, const void *buf, size_t n, int flags )
+{
+    REAL( ssize_t, send, int, const void *, size_t, int );
+    return real( fd, buf, n, flags );
+}
+
+ssize_t sendto( int fd, const void *buf, size_t n, int flags, const struct sockaddr *addr, socklen_t len )
+{
+    REAL( ssize_t, sendto, int, const void *, size_t, int, const struct sockaddr *, socklen_t );
+    return real( fd, buf, n, flags, addr, len );
+}
+
+ssize_t recv( int fd, void *buf, size_t n, int flags )
+{
+    REAL( ssize_t, recv, int, void *, size_t, int );
+    return real( fd, buf, n, flags );
+}
+
+ssize_t recvfrom( int fd, void *buf, size_t n, int flags, struct sockaddr *addr, socklen_t *len )
+{
+    REAL( ssize_t, recvfrom, int, void *, size_t, int, struct sockaddr *, socklen_t * );
+    return real( fd, buf, n, flags, addr, len );
+}
+
+int poll( struct pollfd *fds, nfds_t nfds, int timeout )
+{
+    REAL( int, poll, struct pollfd *, nfds_t, int );
+    return real( fds, nfds, timeout );
+}
+
+pid_t fork( void )
+{
+    REAL( pid_t, fork, void );
+    pid_t pid = real();
+    if ( pid == 0 )
+    {
+        busy = 1;
+        init();    /* the child counts into a table of its own */
+        busy = 0;
+    }
+    return pid;
+}
+
+pid_t waitpid( pid_t pid, int *status, int options )
+{
+    REAL( pid_t, waitpid, pid_t, int *, int );
+    return real( pid, status, options );
+}
+
+pid_t wait( int *status )
+{
+    REAL( pid_t, wait, int * );
+    return real( status );
+}
+
+int kill( pid_t pid, int sig )
+{
+    REAL( int, kill, pid_t, int );
+    return real( pid, sig );
+}
+
+int execve( const char *path, char *const argv[], char *const envp[] )
+{
+    REAL( int, execve, const char *, char *const *, char *const * );
+    return real( path, argv, envp );
+}
+
+int vdprintf( int fd, const char *format, va_list ap )
+{
+    REAL( int, vdprintf, int, const char *, va_list );
+    return real( fd, format, ap );
+}
+
+int dprintf( int fd, const char *format, ... )
+{
+    static int ( *real )( int, const char *, va_list );
+    if ( !real )
+        real = ( int ( * )( int, const char *, va_list ) ) dlsym( RTLD_NEXT, "vdprintf" );
+    count( "dprintf" );
+    va_list ap;
+    va_start( ap, format );
+    int rv = real( fd, format, ap );
+    va_end( ap );
+    return rv;
+}
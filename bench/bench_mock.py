@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for the `exam` commands of src/mock.py.
+
+Every command runs in-process against synthetic trees from make_tree.py
+(small, medium and large histories). Mutating commands get a fresh copy of
+the tree before each run, outside of the timed section. Besides the best
+and median time, each command records how many stat, open and directory
+listing calls it made (counted at the Python level through an audit hook
+and an `os.stat` wrapper, so SQLite's own file I/O is not included).
+
+`exam test` is left out: it runs `make`, so its time is the compiler's.
+The interactive `pb152 update` of exam generation is skipped (offline mode).
+
+Usage: python bench/bench_mock.py [--sizes small,medium] [--repeat 5]
+           [--save baseline.json] [--compare baseline.json [--threshold 1.3]]
+"""
+import io
+import os
+import sys
+import json
+import shutil
+import timeit
+import logging
+import argparse
+import tempfile
+import contextlib
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from make_tree import REPO_DIR, TreeSpec, make_tree
+
+sys.path.insert(0, str(REPO_DIR / 'src'))
+import mock  # noqa: E402
+
+SIZES = {
+    'small': TreeSpec(weeks=4, tasks_per_week=4, archived_exams=5, attempts=40),
+    'medium': TreeSpec(weeks=12, tasks_per_week=8, archived_exams=40, attempts=400),
+    'large': TreeSpec(weeks=12, tasks_per_week=20, archived_exams=300, attempts=5000),
+}
+DEFAULT_THRESHOLD = 1.3
+
+
+class Command(NamedTuple):
+    name: str
+    argv: List[str]
+    mutates: bool
+    prepare: Optional[List[str]] = None  # run (untimed) on the fresh tree first
+
+
+COMMANDS = [
+    Command('progress', ['progress'], False),
+    Command('roulette', ['roulette', '-n', '5'], False),
+    Command('roulette --schedule', ['roulette', '-n', '5', '--schedule'], False),
+    Command('archives', ['archives'], False),
+    Command('search', ['search', 'recv', 'poll'], False),
+    Command('generate', ['-n', '5'], True),
+    Command('generate --schedule', ['-n', '5', '--schedule'], True),
+    Command('done', ['done'], True, prepare=['-n', '5']),
+    Command('hide', ['hide'], True, prepare=['-n', '5', '-s']),
+    Command('reveal', ['reveal'], True, prepare=['-n', '5']),
+    Command('trash', ['trash'], True, prepare=['-n', '5']),
+]
+
+
+# --- Syscall counting ---
+
+class CallCounter:
+    """Counts file system calls while `active`."""
+
+    def __init__(self):
+        self.active = False
+        self.counts = Counter()
+        self._stat = os.stat
+        self._lstat = os.lstat
+        sys.addaudithook(self._audit)
+        os.stat = self._wrap(os.stat, 'stat')
+        os.lstat = self._wrap(os.lstat, 'stat')
+
+    def _wrap(self, func: Callable, name: str) -> Callable:
+        def wrapper(*args, **kwargs):
+            if self.active:
+                self.counts[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def _audit(self, event: str, args):
+        if not self.active:
+            return
+        if event == 'open':
+            self.counts['open'] += 1
+        elif event in ('os.scandir', 'os.listdir'):
+            self.counts['listdir'] += 1
+
+    @contextlib.contextmanager
+    def count(self):
+        self.counts = Counter()
+        self.active = True
+        try:
+            yield self.counts
+        finally:
+            self.active = False
+
+
+# --- Running commands ---
+
+def run_mock(home: Path, argv: List[str]):
+    """Runs `exam <argv>` in-process with HOME pointing at `home`."""
+    old_argv = sys.argv
+    os.environ['HOME'] = str(home)
+    sys.argv = ['mock.py', *argv]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            mock.main()
+    finally:
+        sys.argv = old_argv
+
+
+def bench_command(template: Path, work: Path, command: Command, repeat: int, counter: CallCounter) -> dict:
+    def setup():
+        if command.mutates or not work.exists():
+            shutil.rmtree(work, ignore_errors=True)
+            shutil.copytree(template, work, symlinks=True)
+            if command.prepare:
+                run_mock(work, command.prepare)
+
+    def run():
+        run_mock(work, command.argv)
+
+    times = []
+    for _ in range(repeat):
+        setup()
+        times.extend(timeit.Timer(run).repeat(repeat=1, number=1))
+
+    setup()
+    with counter.count() as counts:
+        run()
+    times.sort()
+    return {
+        'best_ms': times[0] * 1000,
+        'median_ms': times[len(times) // 2] * 1000,
+        'calls': dict(counts),
+    }
+
+
+def run_suite(sizes: List[str], repeat: int, only: Optional[List[str]]) -> Dict[str, Dict[str, dict]]:
+    counter = CallCounter()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            template = Path(tmp) / f"{size}-template"
+            make_tree(template, SIZES[size])
+            work = Path(tmp) / f"{size}-work"
+            results[size] = {}
+            for command in COMMANDS:
+                if only and command.name not in only:
+                    continue
+                results[size][command.name] = bench_command(template, work, command, repeat, counter)
+                shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+# --- Reporting ---
+
+def format_calls(calls: Dict[str, int]) -> str:
+    return ' '.join(f"{k}={calls.get(k, 0)}" for k in ('stat', 'open', 'listdir'))
+
+
+def report(results: Dict[str, Dict[str, dict]], baseline: Optional[dict], threshold: float) -> bool:
+    """Prints the results, compared with `baseline` if given. Returns False on a regression."""
+    ok = True
+    for size, commands in results.items():
+        print(f"\n[{size}]")
+        for name, r in commands.items():
+            line = f"  {name:<22} best {r['best_ms']:8.2f} ms  median {r['median_ms']:8.2f} ms  {format_calls(r['calls'])}"
+            base = (baseline or {}).get(size, {}).get(name)
+            if base:
+                ratio = r['best_ms'] / base['best_ms'] if base['best_ms'] else 1.0
+                more_calls = sum(r['calls'].values()) > sum(base['calls'].values())
+                status = 'ok'
+                if ratio > threshold:
+                    status = 'SLOWER'
+                    ok = False
+                line += f"  x{ratio:.2f} {status}"
+                if more_calls:
+                    line += f" (calls were {format_calls(base['calls'])})"
+            print(line)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the exam commands against synthetic trees.")
+    parser.add_argument('--sizes', default='small,medium', help=f"Comma-separated tree sizes: {', '.join(SIZES)}")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per command")
+    parser.add_argument('--only', help="Comma-separated command names to run")
+    parser.add_argument('--save', type=Path, help="Write the results to this JSON file as a baseline")
+    parser.add_argument('--compare', type=Path, help="Compare with a baseline written by --save")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="Fail if a command's best time exceeds the baseline by this factor")
+    args = parser.parse_args()
+
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    logging.disable(logging.CRITICAL)
+    os.environ[mock.OFFLINE_ENV] = '1'  # never run the interactive pb152 update
+    results = run_suite(sizes, args.repeat, args.only.split(',') if args.only else None)
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    ok = report(results, baseline, args.threshold)
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=1) + '\n')
+        print(f"\nSaved results to {args.save}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
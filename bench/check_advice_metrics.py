@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Regression check for the advisor's metrics log.
+
+Runs `pb152tools.py advise` a few times against bench/fake_gemini.py with a
+throwaway HOME and checks the lines appended to advice.metrics.jsonl: a cache
+miss, then cache hits on the full prompt's answer (with and without a session
+follow-up pending), then a run with the cache off. A hit must be recorded as
+a hit, with the template of the answer that was served, so `advise stats`
+doesn't count it as a follow-up.
+
+Usage: python bench/check_advice_metrics.py
+"""
+import os
+import sys
+import json
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import List, NamedTuple
+
+from fake_gemini import start_server
+from make_tree import REPO_DIR
+
+ENTRY_POINT = REPO_DIR / 'src' / 'pb152tools.py'
+TASK_SOURCE = '#include <unistd.h>\nint main(void) { write(1, "1", 1); return 0; }\n'
+MAKEFILE = 'SRC_P = task_1.c\n\ntask_%:\n\t@echo OK\n'
+
+
+class Step(NamedTuple):
+    description: str
+    flags: List[str]
+    cache: str
+
+
+# Every step must be recorded with the template of the first call: the code never changes
+STEPS = [
+    Step("first call", ['--reset'], 'miss'),
+    Step("same code, follow-up pending", [], 'hit'),
+    Step("same code, no session", ['--no-session'], 'hit'),
+    Step("advice cache off", ['--no-cache', '--no-session'], 'off'),
+]
+
+
+def run_advise(home: Path, c_file: Path, base_url: str, flags: List[str]):
+    env = dict(os.environ, HOME=str(home), GEMINI_API_KEY='dummy', PB152TOOLS_GEMINI_BASE_URL=base_url)
+    proc = subprocess.run([sys.executable, str(ENTRY_POINT), 'advise', str(c_file), '--render', 'plain', *flags],
+                          env=env, cwd=c_file.parent, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"'advise {' '.join(flags)}' failed:\n{proc.stderr}")
+
+
+def main():
+    server = start_server(delay=0.0)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        exam_dir = home / 'exam'
+        exam_dir.mkdir()
+        (exam_dir / 'makefile').write_text(MAKEFILE)
+        c_file = exam_dir / 'task_1.c'
+        c_file.write_text(TASK_SOURCE)
+        metrics_file = home / '.pb152tools' / 'advice.metrics.jsonl'
+
+        expected = None
+        for step in STEPS:
+            run_advise(home, c_file, base_url, step.flags)
+            call = json.loads(metrics_file.read_text().splitlines()[-1])
+            expected = expected or call.get('template')
+            ok = call.get('cache') == step.cache and call.get('template') == expected
+            failed |= not ok
+            print(f"{'OK' if ok else 'FAIL':<4} {step.description:<30} cache={call.get('cache')} "
+                  f"template={call.get('template')} (expected cache={step.cache} template={expected})")
+
+    server.shutdown()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Gemini REST API, for testing the advisor offline.
+
+Implements just enough of `:generateContent` and `:streamGenerateContent`
+(SSE) and of the `cachedContents` context caching endpoints (create, get,
+update, delete; `cachedContent` in generate requests, with expiry) for
+google-genai to talk to it. Point the advisor at it with
+PB152TOOLS_GEMINI_BASE_URL=http://127.0.0.1:<port>/ and any GEMINI_API_KEY.
+Token counts are estimated as 4 characters per token.
+
+Usage: python bench/fake_gemini.py [--port 8765] [--delay 0.05] [--reply "text"]
+                                   [--no-caching] [--cache-min-tokens 1024]
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "## Nice work\n\n"
+    "Your code compiles. Think about **short reads** on pipes and what happens "
+    "when `write` returns less than requested.\n"
+)
+
+
+def _timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def make_handler(reply: str, delay: float, chunk_size: int, caching: bool = True, cache_min_tokens: int = 1024):
+    class FakeGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        requests_seen = []
+        # name -> {'model', 'displayName', 'tokens', 'created', 'expires'}
+        cached_contents = {}
+
+        def log_message(self, format, *args):
+            pass
+
+        def _read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b'{}'
+            return json.loads(body or b'{}')
+
+        def _send_json(self, payload: dict, status: int = 200):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        @staticmethod
+        def _candidate(text: str, finished: bool) -> dict:
+            candidate = {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}
+            if finished:
+                candidate['finishReason'] = 'STOP'
+            return candidate
+
+        def _error(self, status: int, state: str, message: str):
+            self._send_json({'error': {'code': status, 'message': message, 'status': state}}, status)
+
+        def _usage(self, request: dict, cached_tokens: int = 0) -> dict:
+            prompt_tokens = len(json.dumps(request.get('contents', ''))) // 4 + cached_tokens
+            usage = {
+                'promptTokenCount': prompt_tokens,
+                'candidatesTokenCount': len(reply) // 4,
+                'totalTokenCount': prompt_tokens + len(reply) // 4,
+            }
+            if cached_tokens:
+                usage['cachedContentTokenCount'] = cached_tokens
+            return usage
+
+        # --- Context caching ---
+
+        def _cache_name(self) -> str:
+            path = self.path.split('?')[0]
+            return path[path.index('cachedContents/'):]
+
+        def _live_cache(self, name: str):
+            entry = type(self).cached_contents.get(name)
+            if entry and entry['expires'] <= time.time():
+                del type(self).cached_contents[name]
+                entry = None
+            return entry
+
+        def _cache_resource(self, name: str, entry: dict) -> dict:
+            return {
+                'name': name, 'model': entry['model'], 'displayName': entry['displayName'],
+                'createTime': _timestamp(entry['created']), 'updateTime': _timestamp(entry['created']),
+                'expireTime': _timestamp(entry['expires']),
+                'usageMetadata': {'totalTokenCount': entry['tokens']},
+            }
+
+        @staticmethod
+        def _ttl(request: dict, default: float = 3600.0) -> float:
+            ttl = request.get('ttl')
+            return float(ttl.rstrip('s')) if ttl else default
+
+        def _create_cache(self, request: dict):
+            if not caching:
+                return self._error(400, 'FAILED_PRECONDITION', 'Context caching is not available for this model.')
+            tokens = len(json.dumps([request.get('contents', ''), request.get('systemInstruction', '')])) // 4
+            if tokens < cache_min_tokens:
+                return self._error(400, 'INVALID_ARGUMENT',
+                                   f'Cached content is too small. total_token_count={tokens}, min_total_token_count={cache_min_tokens}')
+            name = f"cachedContents/{uuid.uuid4().hex[:16]}"
+            now = time.time()
+            entry = {'model': request.get('model', ''), 'displayName': request.get('displayName', ''),
+                     'tokens': tokens, 'created': now, 'expires': now + self._ttl(request)}
+            type(self).cached_contents[name] = entry
+            self._send_json(self._cache_resource(name, entry))
+
+        def do_GET(self):
+            type(self).requests_seen.append((self.path, None))
+            entry = self._live_cache(self._cache_name()) if 'cachedContents/' in self.path else None
+            if entry is None:
+                return self._error(404, 'NOT_FOUND', f'Unknown path or cached content {self.path}')
+            self._send_json(self._cache_resource(self._cache_name(), entry))
+
+        def do_PATCH(self):
+            request = self._read_json()
+            type(self).requests_seen.append((self.path, request))
+            entry = self._live_cache(self._cache_name()) if 'cachedContents/' in self.path else None
+            if entry is None:
+                return self._error(404, 'NOT_FOUND', f'Unknown path or cached content {self.path}')
+            entry['expires'] = time.time() + self._ttl(request)
+            self._send_json(self._cache_resource(self._cache_name(), entry))
+
+        def do_DELETE(self):
+            type(self).requests_seen.append((self.path, None))
+            if 'cachedContents/' not in self.path or type(self).cached_contents.pop(self._cache_name(), None) is None:
+                return self._error(404, 'NOT_FOUND', f'Unknown path or cached content {self.path}')
+            self._send_json({})
+
+        def do_POST(self):
+            request = self._read_json()
+            type(self).requests_seen.append((self.path, request))
+
+            if self.path.split('?')[0].endswith('/cachedContents'):
+                return self._create_cache(request)
+
+            cached_tokens = 0
+            if request.get('cachedContent'):
+                entry = self._live_cache(request['cachedContent'])
+                if entry is None:
+                    return self._error(403, 'PERMISSION_DENIED',
+                                       f"CachedContent not found (or permission denied): {request['cachedContent']}")
+                cached_tokens = entry['tokens']
+
+            if ':streamGenerateContent' in self.path:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                chunks = [reply[i:i + chunk_size] for i in range(0, len(reply), chunk_size)] or ['']
+                for i, chunk in enumerate(chunks):
+                    time.sleep(delay)
+                    last = i == len(chunks) - 1
+                    event = {'candidates': [self._candidate(chunk, last)]}
+                    if last:
+                        event['usageMetadata'] = self._usage(request, cached_tokens)
+                    self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode())
+                    self.wfile.flush()
+                self.close_connection = True
+                return
+
+            if ':generateContent' in self.path:
+                time.sleep(delay)
+                self._send_json({
+                    'candidates': [self._candidate(reply, True)],
+                    'usageMetadata': self._usage(request, cached_tokens),
+                })
+                return
+
+            self._send_json({'error': {'code': 404, 'message': f'Unknown path {self.path}'}}, 404)
+
+    return FakeGeminiHandler
+
+
+def start_server(port: int = 0, reply: str = DEFAULT_REPLY, delay: float = 0.05, chunk_size: int = 16,
+                 caching: bool = True, cache_min_tokens: int = 1024) -> ThreadingHTTPServer:
+    """Starts the fake server on a background thread. Port 0 picks a free port."""
+    handler = make_handler(reply, delay, chunk_size, caching, cache_min_tokens)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Gemini API server.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.05, help="Seconds before each streamed chunk")
+    parser.add_argument('--reply', type=str, default=DEFAULT_REPLY)
+    parser.add_argument('--no-caching', action='store_true', help="Reject context cache creation, like a model without caching")
+    parser.add_argument('--cache-min-tokens', type=int, default=1024, help="Smallest cacheable content in (estimated) tokens")
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.reply, args.delay, caching=not args.no_caching,
+                          cache_min_tokens=args.cache_min_tokens)
+    print(f"Fake Gemini API listening on http://127.0.0.1:{server.server_address[1]}/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+Generator for synthetic ~/pb152 course trees.
+
+Creates week folders with intro files, P/R tasks and `.pristine` siblings,
+the support files, a makefile, an archive of finished exams and a progress
+store with attempt history, so the exam commands can be measured against
+histories of any size.
+
+Usage: python bench/make_tree.py <home dir> [--weeks 12] [--tasks 8]
+           [--pristine-ratio 0.3] [--archived 40] [--attempts 400] [--seen-ratio 0.6]
+           [--legacy-archive]
+"""
+import sys
+import random
+import argparse
+from pathlib import Path
+from typing import NamedTuple
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR / 'src'))
+
+from archive_store import ARCHIVE_DIR_NAME, ArchiveStore, exam_name  # noqa: E402
+from progress_store import (  # noqa: E402
+    OUTCOME_DONE, OUTCOME_FAILED, OUTCOME_PASSED, PROGRESS_DB_FILE, ProgressStore,
+)
+
+SYSCALLS = ['read', 'write', 'open', 'close', 'recv', 'send', 'poll', 'fork', 'waitpid', 'pipe', 'dup2', 'socket']
+DAY = 24 * 3600
+
+
+class TreeSpec(NamedTuple):
+    weeks: int = 12
+    tasks_per_week: int = 8
+    pristine_ratio: float = 0.3
+    archived_exams: int = 40
+    attempts: int = 400
+    seen_ratio: float = 0.6   # share of tasks that appear in the attempt history
+    legacy_archive: bool = False
+    seed: int = 0
+
+
+def task_source(rng: random.Random, name: str) -> str:
+    calls = rng.sample(SYSCALLS, 4)
+    body = '\n'.join(f"    if ( {call}( fd, buf, n ) == -1 ) /* {call} failed */\n        return -1;" for call in calls)
+    return (
+        f"/* {name}: solve the task using {', '.join(calls)} */\n"
+        "#define _POSIX_C_SOURCE 200809L\n#include <unistd.h>\n\n"
+        f"int solve_{name.split('.')[0]}( int fd, char *buf, int n )\n{{\n{body}\n    return 0;\n}}\n\n"
+        "int main( void ) { return 0; }\n"
+    )
+
+
+def make_tree(home: Path, spec: TreeSpec = TreeSpec()) -> Path:
+    """Creates `home/pb152` according to `spec` and returns its path."""
+    rng = random.Random(spec.seed)
+    root = home / 'pb152'
+    root.mkdir(parents=True)
+    (root / 'pb152.cpp').write_text("// test framework\n")
+    (root / 'pb152io.c').write_text("// io helpers\n")
+
+    task_ids = []
+    for w in range(1, spec.weeks + 1):
+        week = f"{w:02d}"
+        week_dir = root / week
+        week_dir.mkdir()
+        (week_dir / '00_intro.txt').write_text(f"# Topic {week}\n\nThis week is about {' '.join(rng.sample(SYSCALLS, 3))}.\n")
+        for t in range(1, spec.tasks_per_week + 1):
+            kind = 'p' if t <= (spec.tasks_per_week + 1) // 2 else 'r'
+            name = f"{kind}{t}_task{t}.c"
+            source = task_source(rng, name)
+            (week_dir / name).write_text(source)
+            if rng.random() < spec.pristine_ratio:
+                (week_dir / f"{name}.pristine").write_text(source)
+            task_ids.append(f"{week}/{name}")
+        (week_dir / 'makefile').write_text("SRC_P = \nSRC_R = \n\nall:\n\t@echo OK\n\n%: %.c\n\t@echo OK\n")
+
+    archive_root = root / ARCHIVE_DIR_NAME
+    archive = ArchiveStore(archive_root)
+    now = 1_700_000_000.0
+    for number in range(1, spec.archived_exams + 1):
+        chosen = rng.sample(task_ids, min(5, len(task_ids)))
+        generated_at = now - (spec.archived_exams - number + 1) * DAY
+        files = {
+            tid.replace('/', '.'): (task_source(rng, tid.split('/')[1]) if rng.random() < 0.5
+                                    else (root / tid).read_text()).encode()
+            for tid in chosen
+        }
+        if spec.legacy_archive:
+            exam_dir = archive_root / exam_name(number, generated_at)
+            exam_dir.mkdir(parents=True)
+            for filename, data in files.items():
+                (exam_dir / filename).write_bytes(data)
+            (exam_dir / 'exam.time.length.txt').write_text("Exam took 2h:10m from generation to archival.\n")
+        else:
+            archive.add_exam(files, {}, generated_at, generated_at + 2 * 3600)
+
+    seen = rng.sample(task_ids, max(1, int(len(task_ids) * spec.seen_ratio)))
+    store = ProgressStore(root / PROGRESS_DB_FILE)
+    with store.conn:
+        store.conn.executemany(
+            "INSERT INTO attempts (task_id, exam_id, generated_at, archived_at, outcome) VALUES (?, ?, ?, ?, ?)",
+            [
+                (rng.choice(seen), f"exam{i // 5}", now - i * 3600, now - i * 3600 + 7200,
+                 rng.choice([OUTCOME_PASSED, OUTCOME_FAILED, OUTCOME_DONE]))
+                for i in range(spec.attempts)
+            ]
+        )
+    store.close()
+    return root
+
+
+def main():
+    defaults = TreeSpec()
+    parser = argparse.ArgumentParser(description="Create a synthetic ~/pb152 tree for benchmarks.")
+    parser.add_argument('home', type=Path, help="Directory to create the pb152 tree in (used as HOME)")
+    parser.add_argument('--weeks', type=int, default=defaults.weeks)
+    parser.add_argument('--tasks', type=int, default=defaults.tasks_per_week, help="Tasks per week")
+    parser.add_argument('--pristine-ratio', type=float, default=defaults.pristine_ratio)
+    parser.add_argument('--archived', type=int, default=defaults.archived_exams, help="Number of archived exams")
+    parser.add_argument('--attempts', type=int, default=defaults.attempts, help="Rows in the progress store")
+    parser.add_argument('--seen-ratio', type=float, default=defaults.seen_ratio, help="Share of tasks with attempts")
+    parser.add_argument('--legacy-archive', action='store_true', help="Write archived exams in the old one-folder layout")
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    args = parser.parse_args()
+
+    root = make_tree(args.home, TreeSpec(args.weeks, args.tasks, args.pristine_ratio, args.archived,
+                                         args.attempts, args.seen_ratio, args.legacy_archive, args.seed))
+    print(f"Created {root}")
+
+
+if __name__ == "__main__":
+    main()
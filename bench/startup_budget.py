@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Cold-start regression check for the fast `exam` subcommands.
+
+Runs `pb152tools.py exam progress` and `exam roulette` under
+`python -X importtime` against a small synthetic ~/pb152 tree and fails if
+the total import time goes over the budget or if a heavy module (the AI SDKs)
+gets imported at all.
+
+Usage: python bench/startup_budget.py [--budget-ms 150] [--runs 5]
+"""
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Set
+
+from make_tree import REPO_DIR, TreeSpec, make_tree
+
+ENTRY_POINT = REPO_DIR / 'src' / 'pb152tools.py'
+
+COMMANDS = [
+    ['exam', 'progress'],
+    ['exam', 'roulette'],
+]
+# Packages that must never be imported by the fast commands, not even through one of our modules
+FORBIDDEN_MODULES = ['google', 'langchain_core', 'langchain_google_genai', 'asyncio', 'http']
+DEFAULT_BUDGET_MS = 150
+TREE = TreeSpec(weeks=3, tasks_per_week=3, archived_exams=2, attempts=5)
+
+
+class ImportTimes(NamedTuple):
+    top_level: Dict[str, int]   # cumulative microseconds of every top-level import
+    modules: Set[str]           # every imported module, nested ones included
+
+
+def parse_importtime(stderr: str) -> ImportTimes:
+    """Returns the cumulative import times of the top-level imports and the names of all imports."""
+    top_level = {}
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if name.startswith('  '):  # nested import, its time is already counted by its parent
+            continue
+        top_level[name.strip()] = int(cumulative)
+    return ImportTimes(top_level, modules)
+
+
+def measure(home: Path, command: List[str]) -> ImportTimes:
+    env = dict(os.environ, HOME=str(home))
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', str(ENTRY_POINT), *command],
+        env=env, cwd=home, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"'{' '.join(command)}' failed:\n{proc.stderr}")
+    return parse_importtime(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the cold-start import budget of fast commands.")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help="Maximum total import time per command")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per command, the fastest one counts")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        home = Path(tmp)
+        make_tree(home, TREE)
+        for command in COMMANDS:
+            runs = [measure(home, command) for _ in range(args.runs)]
+            best = min((r.top_level for r in runs), key=lambda times: sum(times.values()))
+            total_ms = sum(best.values()) / 1000
+            forbidden = sorted({m for r in runs for m in r.modules if m.split('.')[0] in FORBIDDEN_MODULES})
+
+            status = "OK"
+            if total_ms > args.budget_ms or forbidden:
+                status = "FAIL"
+                failed = True
+            print(f"{status:<4} {' '.join(command):<15} imports {total_ms:7.1f} ms (budget {args.budget_ms:.0f} ms)")
+            for name in forbidden:
+                print(f"     forbidden import: {name}")
+            if status == "FAIL":
+                slowest = sorted(best.items(), key=lambda kv: kv[1], reverse=True)[:5]
+                for name, us in slowest:
+                    print(f"     {us / 1000:7.1f} ms  {name}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,26 @@ if [ -f "$HOME/pb152/progress.json" ]; then
     mv "$HOME/pb152/progress.json" "$HOME/pb152/exams.progress.json"
 fi
 
+# --- Migration: v2.5 -> v2.6 ---
+# Reason: Progress moved from a JSON set to an SQLite store with attempt history.
+# Action: Import 'exams.progress.json' into 'exams.progress.db' and keep the JSON as '.bak'.
+if [ -f "$HOME/pb152/exams.progress.json" ]; then
+    echo "    [MIGRATE] Importing ~/pb152/exams.progress.json into ~/pb152/exams.progress.db"
+    MIGRATE_PYTHON="$HOME/.pb152tools/venv/bin/python"
+    [ -x "$MIGRATE_PYTHON" ] || MIGRATE_PYTHON="python3"
+    "$MIGRATE_PYTHON" "$HOME/.pb152tools/src/progress_store.py" --migrate || echo "    [MIGRATE] Failed. The import will be retried on the next 'pb152tools exam' run."
+fi
+
+# --- Migration: v2.5 -> v2.6 (archive) ---
+# Reason: Finished exams moved from one directory per exam to a deduplicated, compressed store.
+# Action: Import every 'exams_finished/examNN ...' directory into the store and remove it.
+if compgen -G "$HOME/pb152/exams_finished/exam[0-9]*" > /dev/null; then
+    echo "    [MIGRATE] Importing ~/pb152/exams_finished into the archive store"
+    MIGRATE_PYTHON="$HOME/.pb152tools/venv/bin/python"
+    [ -x "$MIGRATE_PYTHON" ] || MIGRATE_PYTHON="python3"
+    "$MIGRATE_PYTHON" "$HOME/.pb152tools/src/archive_store.py" --migrate || echo "    [MIGRATE] Failed. The import will be retried on the next 'pb152tools exam' run."
+fi
+
 # --- Add future migrations below this line ---
 
 echo "--> Migrations complete."
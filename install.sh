@@ -50,6 +50,7 @@ fi
 echo "--> Setting file permissions..."
 chmod +x "$INSTALL_DIR/bin/pb152tools"
 chmod +x "$INSTALL_DIR/bin/apply-migrations.sh"
+chmod +x "$INSTALL_DIR/assets/fast-bin/valgrind"
 chmod +x "$INSTALL_DIR/uninstall.sh"
 
 # 7. Symlink
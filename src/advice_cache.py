@@ -0,0 +1,107 @@
+"""
+Content-addressed cache of advisor responses.
+
+Entries live in ~/.pb152tools/cache/advice, one file per key. The key is a
+hash of everything that determines the answer (source, normalized build log,
+prompt template, model and temperature), so unchanged code gets its advice
+back without an API call. Reading an entry bumps its mtime, which is what the
+LRU eviction orders by.
+"""
+import os
+import re
+import time
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+# --- Configuration ---
+CACHE_DIR = Path.home() / '.pb152tools' / 'cache' / 'advice'
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_MAX_AGE = 30 * 24 * 3600
+ENTRY_SUFFIX = '.txt'
+
+# Parts of a build log that change between identical runs
+VOLATILE_PATTERNS = [
+    (re.compile(r'==\d+=='), '==PID=='),                # valgrind pid prefix
+    (re.compile(r'\b0x[0-9a-fA-F]+\b'), '0xADDR'),      # pointers
+    (re.compile(r'/tmp/[^\s:\'"]+'), '/tmp/TMP'),       # temporary files
+    (re.compile(r'\b\d+(\.\d+)?\s*(ms|s|sec|seconds)\b'), 'TIME'),
+    (re.compile(r'\bpid \d+\b'), 'pid PID'),
+]
+
+
+def normalize_make_output(make_output: str) -> str:
+    """Strips pids, addresses, temp paths and timings from a build log."""
+    for pattern, replacement in VOLATILE_PATTERNS:
+        make_output = pattern.sub(replacement, make_output)
+    return '\n'.join(line.rstrip() for line in make_output.strip().splitlines())
+
+
+def cache_key(*parts: str) -> str:
+    """Hashes the key parts. Each part is length-prefixed so boundaries can't collide."""
+    h = hashlib.sha256()
+    for part in parts:
+        data = part.encode('utf-8')
+        h.update(f"{len(data)}:".encode('ascii'))
+        h.update(data)
+    return h.hexdigest()
+
+
+class AdviceCache:
+    """Directory of cached responses with size- and age-based LRU eviction."""
+
+    def __init__(self, directory: Path = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (key + ENTRY_SUFFIX)
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            if time.time() - path.stat().st_mtime > self.max_age:
+                path.unlink()
+                return None
+            text = path.read_text(encoding='utf-8')
+            os.utime(path)  # mark as recently used
+            return text
+        except OSError:
+            return None
+
+    def put(self, key: str, text: str):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(text, encoding='utf-8')
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones until the size limit holds."""
+        now = time.time()
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(ENTRY_SUFFIX):
+                        continue
+                    st = entry.stat()
+                    if now - st.st_mtime > self.max_age:
+                        os.unlink(entry.path)
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
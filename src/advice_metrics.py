@@ -0,0 +1,167 @@
+"""
+Metrics of advisor calls and `pb152tools advise stats`.
+
+Every advisor call appends one JSON line to ~/.pb152tools/advice.metrics.jsonl:
+the prompt size, the token counts reported by the API, how long make, the
+first token and the whole answer took, whether the cache answered and which
+template was used. Lines are only ever appended, each with a single write,
+so batch mode and several terminals can log at once. `advise stats` reads the
+file back and prints percentiles and totals per day, task and template, which
+makes a prompt template that grew (or a slower model) easy to spot.
+"""
+import sys
+import json
+import math
+import time
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+# --- Configuration ---
+METRICS_FILE = Path.home() / '.pb152tools' / 'advice.metrics.jsonl'
+TEMPLATES = ('success', 'failure', 'followup')
+
+
+class AdviceCall(NamedTuple):
+    at: float
+    task: str
+    template: str                  # success, failure or followup
+    cache: str                     # hit, miss or off (--no-cache)
+    prompt_chars: int
+    prompt_tokens_est: int
+    make_s: Optional[float] = None
+    ttft_s: Optional[float] = None
+    total_s: Optional[float] = None
+    input_tokens: Optional[int] = None    # as counted by the API
+    output_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None   # of input_tokens, read from the provider's context cache
+    prefix_cache: Optional[str] = None    # hit, created, failed, unavailable or off; None for follow-ups
+    batch: bool = False
+    error: Optional[str] = None
+
+
+def record_call(call: AdviceCall, path: Path = METRICS_FILE):
+    """Appends one call to the metrics file."""
+    line = json.dumps({k: v for k, v in call._asdict().items() if v is not None}, separators=(',', ':'))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line + '\n')
+
+
+def try_record_call(call: AdviceCall):
+    try:
+        record_call(call)
+    except OSError as e:
+        print(f"Warning: Could not write advisor metrics: {e}", file=sys.stderr)
+
+
+def load_calls(path: Path = METRICS_FILE, since: float = 0.0) -> List[AdviceCall]:
+    """Reads the recorded calls, skipping lines that don't parse (e.g. a torn last line)."""
+    calls = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    data = json.loads(line)
+                    call = AdviceCall(**{k: v for k, v in data.items() if k in AdviceCall._fields})
+                except (ValueError, TypeError):
+                    continue
+                if call.at >= since:
+                    calls.append(call)
+    except FileNotFoundError:
+        pass
+    return calls
+
+
+# --- Statistics ---
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of `values`, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _fmt(value: Optional[float], unit: str = '') -> str:
+    if value is None:
+        return '-'
+    if unit == 's':
+        return f"{value:.2f}s"
+    return f"{value / 1000:.1f}k" if value >= 10000 else f"{value:.0f}"
+
+
+def summarize(calls: List[AdviceCall]) -> Dict[str, str]:
+    """One table row: counts, prompt size and latency percentiles, token totals."""
+    sent = [c for c in calls if c.cache != 'hit' and not c.error]
+    prompt_tokens = [c.prompt_tokens_est for c in sent]
+    ttft = [c.ttft_s for c in sent if c.ttft_s is not None]
+    total = [c.total_s for c in sent if c.total_s is not None]
+    make = [c.make_s for c in calls if c.make_s is not None]
+    input_tokens = [c.input_tokens for c in sent if c.input_tokens is not None]
+    output_tokens = [c.output_tokens for c in sent if c.output_tokens is not None]
+    cached_tokens = [c.cached_tokens for c in sent if c.cached_tokens is not None]
+    return {
+        'calls': str(len(calls)),
+        'hits': str(sum(1 for c in calls if c.cache == 'hit')),
+        'errors': str(sum(1 for c in calls if c.error)),
+        'prompt p50': _fmt(percentile(prompt_tokens, 50)),
+        'prompt p90': _fmt(percentile(prompt_tokens, 90)),
+        'make p50': _fmt(percentile(make, 50), 's'),
+        'ttft p50': _fmt(percentile(ttft, 50), 's'),
+        'ttft p90': _fmt(percentile(ttft, 90), 's'),
+        'total p50': _fmt(percentile(total, 50), 's'),
+        'total p90': _fmt(percentile(total, 90), 's'),
+        'in tokens': _fmt(sum(input_tokens)) if input_tokens else '-',
+        'cached in': _fmt(sum(cached_tokens)) if cached_tokens else '-',
+        'out tokens': _fmt(sum(output_tokens)) if output_tokens else '-',
+    }
+
+
+def print_table(title: str, calls: Iterable[AdviceCall], group: Callable[[AdviceCall], str],
+                order: Optional[Callable[[str], object]] = None):
+    groups: Dict[str, List[AdviceCall]] = defaultdict(list)
+    everything = []
+    for call in calls:
+        groups[group(call)].append(call)
+        everything.append(call)
+    rows = [(name, summarize(groups[name])) for name in sorted(groups, key=order)]
+    rows.append(('total', summarize(everything)))
+    columns = list(rows[0][1])
+    name_width = max(len(title), *(len(name) for name, _ in rows))
+    widths = {c: max(len(c), *(len(row[c]) for _, row in rows)) for c in columns}
+    print(f"{title:<{name_width}}  " + '  '.join(f"{c:>{widths[c]}}" for c in columns))
+    for name, row in rows:
+        if name == 'total':
+            print('-' * (name_width + sum(widths.values()) + 2 * len(columns)))
+        print(f"{name:<{name_width}}  " + '  '.join(f"{row[c]:>{widths[c]}}" for c in columns))
+    print()
+
+
+def stats_main(argv: List[str]):
+    """`pb152tools advise stats`: percentiles and totals of the recorded calls."""
+    parser = argparse.ArgumentParser(prog='pb152tools advise stats',
+                                     description="Show prompt sizes, token counts and latencies of advisor calls.")
+    parser.add_argument('--days', type=int, default=14, help="Only include calls from the last DAYS days (0: all)")
+    parser.add_argument('--by', choices=('day', 'task', 'template'), action='append',
+                        help="Which tables to print (default: all three); can be repeated")
+    args = parser.parse_args(argv)
+
+    since = time.time() - args.days * 86400 if args.days > 0 else 0.0
+    calls = load_calls(since=since)
+    if not calls:
+        print(f"No advisor calls recorded{f' in the last {args.days} days' if args.days > 0 else ''} ({METRICS_FILE}).")
+        return
+
+    print(f"{len(calls)} advisor calls; prompt sizes are estimated tokens of prompts sent to the API, "
+          f"latencies exclude cache hits.\n")
+    for by in args.by or ('day', 'task', 'template'):
+        if by == 'day':
+            print_table('day', calls, lambda c: datetime.fromtimestamp(c.at).strftime('%Y-%m-%d'))
+        elif by == 'task':
+            print_table('task', calls, lambda c: c.task)
+        else:
+            print_table('template', calls, lambda c: c.template,
+                        order=lambda t: TEMPLATES.index(t) if t in TEMPLATES else len(TEMPLATES))
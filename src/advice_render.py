@@ -0,0 +1,82 @@
+"""
+Terminal renderers for streamed advisor output.
+
+`PlainRenderer` writes chunks as they arrive. `MarkdownRenderer` buffers up
+to the end of each line and then prints it with ANSI styling for headings,
+bold text, inline code and code fences.
+"""
+import re
+import sys
+from typing import TextIO
+
+# --- ANSI Styles ---
+BOLD = '\033[1m'
+YELLOW = '\033[0;33m'
+CYAN = '\033[0;36m'
+DIM = '\033[2m'
+RESET = '\033[0m'
+
+HEADING = re.compile(r'^(#{1,6})\s+(.*)$')
+BOLD_SPAN = re.compile(r'\*\*(.+?)\*\*')
+CODE_SPAN = re.compile(r'`([^`]+)`')
+
+
+class PlainRenderer:
+    def __init__(self, out: TextIO = sys.stdout):
+        self.out = out
+        self.ends_with_newline = True
+
+    def write(self, chunk: str):
+        if chunk:
+            self.out.write(chunk)
+            self.out.flush()
+            self.ends_with_newline = chunk.endswith('\n')
+
+    def finish(self):
+        if not self.ends_with_newline:
+            self.out.write('\n')
+        self.out.flush()
+
+
+class MarkdownRenderer(PlainRenderer):
+    def __init__(self, out: TextIO = sys.stdout):
+        super().__init__(out)
+        self.pending = ''
+        self.in_fence = False
+
+    def _render_line(self, line: str) -> str:
+        if line.lstrip().startswith('```'):
+            self.in_fence = not self.in_fence
+            return f"{DIM}{line}{RESET}"
+        if self.in_fence:
+            return f"{CYAN}{line}{RESET}"
+        heading = HEADING.match(line)
+        if heading:
+            return f"{BOLD}{YELLOW}{heading.group(2)}{RESET}"
+        line = BOLD_SPAN.sub(lambda m: f"{BOLD}{m.group(1)}{RESET}", line)
+        line = CODE_SPAN.sub(lambda m: f"{CYAN}{m.group(1)}{RESET}", line)
+        return line
+
+    def write(self, chunk: str):
+        self.pending += chunk
+        *lines, self.pending = self.pending.split('\n')
+        for line in lines:
+            self.out.write(self._render_line(line) + '\n')
+        if lines:
+            self.out.flush()
+
+    def finish(self):
+        if self.pending:
+            self.out.write(self._render_line(self.pending) + '\n')
+            self.pending = ''
+        self.out.flush()
+
+
+RENDERERS = {
+    'plain': PlainRenderer,
+    'markdown': MarkdownRenderer,
+}
+
+
+def make_renderer(name: str, out: TextIO = sys.stdout) -> PlainRenderer:
+    return RENDERERS[name](out)
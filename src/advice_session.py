@@ -0,0 +1,140 @@
+"""
+Per-file advisor sessions.
+
+A session remembers, for one C file, the source and build summary the last
+advice was based on and a short summary of every earlier answer. A follow-up
+call can then send a unified diff of the source, the new build summary and
+those summaries instead of the whole context. When the diff is too large,
+the session is old, or it has gone several turns without the full context,
+the advisor sends the full prompt again.
+
+Sessions live in ~/.pb152tools/cache/sessions, one JSON file per C file.
+"""
+import os
+import re
+import json
+import time
+import difflib
+import hashlib
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+# --- Configuration ---
+SESSION_DIR = Path.home() / '.pb152tools' / 'cache' / 'sessions'
+DEFAULT_DIFF_LIMIT = 4000      # bytes of diff above which the full prompt is sent
+MAX_CHANGED_RATIO = 0.5        # ... or when more than this share of the lines changed
+MIN_CHANGED_LINES = 10         # (checked only above this many changed lines)
+MAX_FOLLOWUPS = 4              # follow-ups in a row before the full context is sent again
+MAX_AGE = 12 * 3600
+MAX_TURNS = 6                  # earlier answers kept as summaries
+SUMMARY_CHARS = 400
+
+
+class Turn(NamedTuple):
+    at: float
+    passed: bool
+    followup: bool
+    summary: str
+
+
+def summarize_advice(advice: str, limit: int = SUMMARY_CHARS) -> str:
+    """A plain-text digest of an answer: code blocks and markup removed, cut at a sentence end."""
+    text = re.sub(r'```.*?```', ' ', advice, flags=re.DOTALL)
+    text = re.sub(r'^\s*#+\s*(.*?)[.:]?\s*$', r'\1.', text, flags=re.MULTILINE)
+    text = re.sub(r'^\s*(?:#+|[-*]|\d+\.)\s*', '', text, flags=re.MULTILINE)
+    text = re.sub(r'[*_`>]+', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    if len(text) <= limit:
+        return text
+    cut = text.rfind('. ', 0, limit)
+    return text[:cut + 1] if cut > limit // 2 else text[:limit].rstrip() + '...'
+
+
+class AdviceSession:
+    """The state of the conversation about one C file."""
+
+    def __init__(self, c_file_path: Path, directory: Path = SESSION_DIR):
+        self.c_file_path = c_file_path
+        key = hashlib.sha256(str(c_file_path.resolve()).encode('utf-8')).hexdigest()[:24]
+        self.path = directory / f"{key}.json"
+        self.source: Optional[str] = None
+        self.build_summary: Optional[str] = None
+        self.updated = 0.0
+        self.followups = 0
+        self.turns: List[Turn] = []
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return
+        self.source = data.get('source')
+        self.build_summary = data.get('build_summary')
+        self.updated = data.get('updated', 0.0)
+        self.followups = data.get('followups', 0)
+        self.turns = [Turn(*t) for t in data.get('turns', [])]
+
+    @property
+    def active(self) -> bool:
+        return self.source is not None and time.time() - self.updated < MAX_AGE
+
+    def diff(self, source: str) -> str:
+        """Unified diff of the source since the last advice."""
+        name = self.c_file_path.name
+        return ''.join(difflib.unified_diff(
+            (self.source or '').splitlines(keepends=True), source.splitlines(keepends=True),
+            fromfile=f"a/{name}", tofile=f"b/{name}"
+        ))
+
+    def followup_blocker(self, diff: str, source: str, diff_limit: int) -> Optional[str]:
+        """Why the next call needs the full prompt, or None if a follow-up will do."""
+        if not self.active:
+            return "no recent session"
+        if self.followups >= MAX_FOLLOWUPS:
+            return f"{self.followups} follow-ups since the full context was sent"
+        size = len(diff.encode('utf-8'))
+        if size > diff_limit:
+            return f"diff of {size} bytes exceeds {diff_limit}"
+        changed = sum(1 for line in diff.splitlines()
+                      if line[:1] in '+-' and not line.startswith(('+++', '---')))
+        if changed > MIN_CHANGED_LINES and changed > MAX_CHANGED_RATIO * max(1, len(source.splitlines())):
+            return "most of the file changed"
+        return None
+
+    def history(self) -> str:
+        if not self.turns:
+            return "None."
+        return '\n'.join(
+            f"{i}. ({'passed' if t.passed else 'failed'}) {t.summary}"
+            for i, t in enumerate(self.turns, 1)
+        )
+
+    def record(self, source: str, build_summary: str, passed: bool, advice: str, followup: bool):
+        self.source = source
+        self.build_summary = build_summary
+        self.updated = time.time()
+        self.followups = self.followups + 1 if followup else 0
+        self.turns = (self.turns + [Turn(self.updated, passed, followup, summarize_advice(advice))])[-MAX_TURNS:]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            'file': str(self.c_file_path.resolve()),
+            'source': self.source,
+            'build_summary': self.build_summary,
+            'updated': self.updated,
+            'followups': self.followups,
+            'turns': [list(t) for t in self.turns],
+        }
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data, indent=1), encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+        self.source = self.build_summary = None
+        self.updated = 0.0
+        self.followups = 0
+        self.turns = []
@@ -0,0 +1,269 @@
+"""
+Batch mode of the advisor: `pb152tools advise --all ~/pb152/exam`.
+
+Every task listed in the exam makefile's SRC_P is built in a process pool,
+then the prompts are sent through the async Gemini client with a
+concurrency limit, per-request timeouts and retries of transient errors
+(timeouts, network errors, 429 and 5xx) with exponential backoff. When the
+prompt prefix is in the provider's context cache, only the suffixes are
+sent. The answers are collected into one report.
+"""
+import re
+import sys
+import time
+import random
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from advisor import (
+    MODEL_NAME, AdvisorError, Answer, MakeResult, PreparedPrompt, generation_config,
+    get_api_key, make_client, make_context_cache, prepare_prompt, run_make, usage_counts,
+)
+from advice_cache import AdviceCache
+from advice_metrics import AdviceCall, try_record_call
+from context_cache import CachedPrefix, ContextCache, is_rejection
+from advice_render import make_renderer
+from reference_index import estimate_tokens
+from tracing import span
+
+# --- Configuration ---
+SRC_P_LINE = re.compile(r'^SRC_P\s*=(.*)$', re.MULTILINE)
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 20.0
+
+
+class RequestFailed(AdvisorError):
+    """An API request that failed for good, after `attempts` tries."""
+    def __init__(self, message: str, attempts: int):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class TaskAdvice(NamedTuple):
+    c_file_path: Path
+    passed: Optional[bool]
+    advice: Optional[str]
+    error: Optional[str]
+    cached: bool = False
+    attempts: int = 0
+
+
+def read_task_list(exam_dir: Path) -> List[Path]:
+    """The C files of the exam, in the order the makefile lists them in SRC_P."""
+    makefile = exam_dir / 'makefile'
+    try:
+        content = makefile.read_text()
+    except OSError as e:
+        raise AdvisorError(f"Cannot read {makefile}: {e}")
+    match = SRC_P_LINE.search(content)
+    if not match or not match.group(1).split():
+        raise AdvisorError(f"No SRC_P task list found in {makefile}")
+    return [exam_dir / name for name in match.group(1).split()]
+
+
+def _run_make_safe(c_file_path: Path):
+    """Process pool worker: returns a MakeResult or the error message."""
+    try:
+        return run_make(c_file_path)
+    except AdvisorError as e:
+        return str(e)
+
+
+def build_all(files: List[Path], jobs: int) -> List[object]:
+    """
+    Builds every task. The first build runs alone so shared framework objects
+    (pb152.cpp, pb152io.c) are compiled once instead of by every worker at once.
+    """
+    if not files:
+        return []
+    print(f"Building {len(files)} tasks with {jobs} parallel jobs...", file=sys.stderr)
+    results = [_run_make_safe(files[0])]
+    if len(files) > 1:
+        with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+            results.extend(pool.map(_run_make_safe, files[1:]))
+    return results
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a request may succeed if retried: a timeout, a network error, 429 (rate limit) or a 5xx."""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import httpx
+    except ImportError:
+        return False
+    return isinstance(error, httpx.TransportError)
+
+
+async def _generate(client, p: PreparedPrompt, timeout: float, retries: int, semaphore: asyncio.Semaphore,
+                    context: Optional[ContextCache] = None, cached: Optional[CachedPrefix] = None):
+    """
+    One API request with a timeout; timeouts, network errors, 429 and 5xx are retried
+    with exponential backoff and jitter, other errors fail the task at once.
+    With a cached prefix only the suffix is sent; if that fails, the full prompt is sent right away.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            async with semaphore:
+                start = time.monotonic()
+                with span('api request', attempt=attempt, cached_prefix=cached is not None):
+                    response = await asyncio.wait_for(
+                        client.aio.models.generate_content(
+                            model=MODEL_NAME,
+                            contents=p.suffix if cached else p.prompt,
+                            config=generation_config(cached.name if cached else None),
+                        ),
+                        timeout=timeout,
+                    )
+            answer = Answer(response.text or '', None, time.monotonic() - start,
+                            *usage_counts(response.usage_metadata))
+            return answer, attempt, cached is not None
+        except Exception as e:
+            if cached:
+                if is_rejection(e):
+                    context.forget(cached.name)
+                print(f"  {p.c_file_path.name}: context cache not accepted ({type(e).__name__}), sending the full prompt",
+                      file=sys.stderr)
+                cached = None
+                attempt -= 1    # the fallback is not a retry
+                continue
+            if attempt > retries or not _is_transient(e):
+                raise RequestFailed(f"{type(e).__name__}: {e}" if str(e) else type(e).__name__, attempt)
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * (0.5 + random.random())
+            print(f"  retrying in {delay:.1f}s after {type(e).__name__}", file=sys.stderr)
+            await asyncio.sleep(delay)
+
+
+async def _advise_prepared(prepared: List[PreparedPrompt], make_seconds: List[float],
+                           args: argparse.Namespace) -> List[TaskAdvice]:
+    cache = AdviceCache()
+    results: List[Optional[TaskAdvice]] = [None] * len(prepared)
+    pending = []
+    metrics = [
+        AdviceCall(time.time(), p.c_file_path.name, p.template, 'off' if args.no_cache else 'miss',
+                   len(p.prompt), estimate_tokens(p.prompt), make_s=round(seconds, 3), batch=True)
+        for p, seconds in zip(prepared, make_seconds)
+    ]
+
+    for i, p in enumerate(prepared):
+        cached = None if args.no_cache else cache.get(p.cache_key)
+        if cached is not None:
+            results[i] = TaskAdvice(p.c_file_path, p.passed, cached, None, cached=True)
+            try_record_call(metrics[i]._replace(cache='hit'))
+        else:
+            pending.append(i)
+
+    print(f"Advice cache: {len(prepared) - len(pending)} hits, {len(pending)} misses", file=sys.stderr)
+    if pending:
+        client = make_client(get_api_key())
+        semaphore = asyncio.Semaphore(max(1, args.concurrency))
+        context, cached = None, None
+        if not args.no_context_cache:
+            context = make_context_cache()
+            with span('context cache'):
+                cached, reason = await asyncio.to_thread(context.ensure, client)
+            print(f"Context cache: {reason}", file=sys.stderr)
+
+        async def run(i: int):
+            p = prepared[i]
+            try:
+                with span('advise task', task=p.c_file_path.name):
+                    answer, attempts, used_prefix = await _generate(
+                        client, p, args.timeout, args.retries, semaphore, context, cached
+                    )
+                advice = answer.text
+                results[i] = TaskAdvice(p.c_file_path, p.passed, advice, None, attempts=attempts)
+                sent = p.suffix if used_prefix else p.prompt
+                try_record_call(metrics[i]._replace(
+                    prompt_chars=len(sent), prompt_tokens_est=estimate_tokens(sent),
+                    total_s=round(answer.total_s, 3), input_tokens=answer.input_tokens,
+                    output_tokens=answer.output_tokens, cached_tokens=answer.cached_tokens,
+                    prefix_cache=_prefix_state(args, cached, used_prefix)
+                ))
+                if advice and not args.no_cache:
+                    try:
+                        cache.put(p.cache_key, advice)
+                    except OSError:
+                        pass
+            except RequestFailed as e:
+                results[i] = TaskAdvice(p.c_file_path, p.passed, None, str(e), attempts=e.attempts)
+                try_record_call(metrics[i]._replace(error=str(e).split(':')[0]))
+            print(f"  done: {p.c_file_path.name}", file=sys.stderr)
+
+        print(f"Veryfi Advisor is thinking about {len(pending)} tasks...", file=sys.stderr)
+        await asyncio.gather(*(run(i) for i in pending))
+
+    return results
+
+
+def _prefix_state(args: argparse.Namespace, cached: Optional[CachedPrefix], used: bool) -> str:
+    if args.no_context_cache:
+        return 'off'
+    if cached is None:
+        return 'unavailable'
+    if not used:
+        return 'failed'
+    return 'created' if cached.created else 'hit'
+
+
+def format_report(exam_dir: Path, results: List[TaskAdvice]) -> str:
+    lines = [f"# Advisor report for {exam_dir}", ""]
+    for r in results:
+        status = 'n/a' if r.passed is None else ('PASSED' if r.passed else 'FAILED')
+        notes = []
+        if r.cached:
+            notes.append('cached')
+        if r.attempts > 1:
+            notes.append(f'{r.attempts} attempts')
+        suffix = f" ({', '.join(notes)})" if notes else ''
+        lines.append(f"## {r.c_file_path.name}: {status}{suffix}")
+        lines.append("")
+        lines.append(r.advice.strip() if r.advice else f"Error: {r.error}")
+        lines.append("")
+    return '\n'.join(lines)
+
+
+def advise_all(exam_dir: Path, args: argparse.Namespace):
+    """Builds and advises on every task of an exam directory and prints one report."""
+    files = read_task_list(exam_dir)
+    missing = [f for f in files if not f.is_file()]
+    if missing:
+        raise AdvisorError(f"Files listed in the makefile are missing: {', '.join(f.name for f in missing)}")
+
+    results: List[Optional[TaskAdvice]] = [None] * len(files)
+    prepared, prepared_index, make_seconds = [], [], []
+    with span('build all', tasks=len(files)):
+        builds = build_all(files, args.jobs)
+    with span('prepare prompts'):
+        for i, (c_file_path, build) in enumerate(zip(files, builds)):
+            if isinstance(build, MakeResult):
+                prepared.append(prepare_prompt(c_file_path, build, args))
+                prepared_index.append(i)
+                make_seconds.append(build.seconds)
+            else:
+                results[i] = TaskAdvice(c_file_path, None, None, build)
+
+    with span('advice requests', tasks=len(prepared)):
+        advised = asyncio.run(_advise_prepared(prepared, make_seconds, args))
+    for i, advice in zip(prepared_index, advised):
+        results[i] = advice
+
+    report = format_report(exam_dir, results)
+    renderer = make_renderer(args.render)
+    renderer.write(report)
+    renderer.finish()
+
+    if args.report:
+        try:
+            args.report.write_text(report + '\n', encoding='utf-8')
+            print(f"Report written to {args.report}", file=sys.stderr)
+        except OSError as e:
+            raise AdvisorError(f"Cannot write report: {e}")
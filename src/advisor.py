@@ -2,30 +2,43 @@
 
 import os
 import sys
+import time
+import argparse
 import subprocess
 from pathlib import Path
-from google import genai
-from google.genai import types
+from typing import List, NamedTuple, Optional, Tuple
+
+from advice_render import RENDERERS, make_renderer
+from advice_cache import AdviceCache, cache_key, normalize_make_output
+from advice_metrics import AdviceCall, try_record_call
+from advice_session import DEFAULT_DIFF_LIMIT, AdviceSession
+from context_cache import ContextCache, is_rejection
+from build_log import DEFAULT_BYTE_BUDGET, parse_build_log
+from reference_index import DEFAULT_TOKEN_BUDGET, DEFAULT_TOP_K, ReferenceIndex, build_query, estimate_tokens, format_sections
+from static_checks import check_source, format_findings
+import tracing
+from tracing import span
 
 # --- Constants ---
 SCRIPT_DIR = Path(__file__).parent.resolve()
 ASSETS_DIR = SCRIPT_DIR.parent / "assets"
 PROCESS_CONTEXT_FILE = ASSETS_DIR / "pb152.process.txt"
 REFERENCE_CONTEXT_FILE = ASSETS_DIR / "pb152.reference.compressed.txt"
+MODEL_NAME = 'gemini-2.5-flash'
+TEMPERATURE = 0.2
+# Overrides the API endpoint, e.g. to point at bench/fake_gemini.py for offline testing
+BASE_URL_ENV = "PB152TOOLS_GEMINI_BASE_URL"
+MAKE_TIMEOUT = 30
 
 # --- Prompt Templates ---
 
-# Prompt for when the code runs successfully
-SUCCESS_PROMPT_TEMPLATE = """
-You are an expert C programming tutor for the PB152 course. The student's code has passed all visible tests. Your task is to provide guidance on potential improvements, edge cases, and hidden tests.
+# The stable start of every full prompt: the tutor's role and the course environment.
+# With provider-side context caching (see context_cache.py) it is registered once and each call sends
+# only the rest: the selected reference sections and one of the suffixes below.
+PROMPT_PREFIX_TEMPLATE = """
+You are an expert C programming tutor for the PB152 course. Do not provide a direct solution or complete code. Instead, act as a helpful guide.
 
-Do not provide a direct solution or complete code. Instead, act as a helpful guide. Your advice should be based on the provided context, which includes the student's current code, the successful output from the `make` command, a description of the course's build environment, and a reference manual.
-
-**Guiding Principles:**
-- **Code Quality:** Suggest improvements related to style, clarity, and efficiency.
-- **Edge Cases:** Encourage the student to think about inputs or conditions their code might not be handling (e.g., empty input, large values, specific character sequences).
-- **Hidden Tests:** The PB152 environment runs additional hidden tests. Based on the problem (inferred from the C file's `main` function), what kind of hidden tests might exist? What aspects of the solution are likely to be stressed further?
-- **Robustness:** How could the code be made more robust against unexpected or invalid inputs?
+Your advice should be based on the provided context: a description of the course's build environment and the relevant sections of a reference manual (below), then the student's current code, the build and test summary from the `make` command and the findings of a local static checker (after them).
 
 **Context:**
 
@@ -33,61 +46,146 @@ Do not provide a direct solution or complete code. Instead, act as a helpful gui
     ```
     {process_context}
     ```
+"""
 
-2.  **C/POSIX Reference Manual (`pb152.reference.compressed.txt`):**
+# The reference manual sections picked for this code and build log; they vary per call, so they are not cached
+REFERENCE_TEMPLATE = """
+2.  **C/POSIX Reference Manual (`pb152.reference.compressed.txt`, relevant sections):**
     ```
     {reference_context}
     ```
+"""
+
+# Suffix for when the code runs successfully
+SUCCESS_SUFFIX_TEMPLATE = """
+The student's code has passed all visible tests. Your task is to provide guidance on potential improvements, edge cases, and hidden tests.
+
+**Guiding Principles:**
+- **Code Quality:** Suggest improvements related to style, clarity, and efficiency.
+- **Edge Cases:** Encourage the student to think about inputs or conditions their code might not be handling (e.g., empty input, large values, specific character sequences).
+- **Hidden Tests:** The PB152 environment runs additional hidden tests. Based on the problem (inferred from the C file's `main` function), what kind of hidden tests might exist? What aspects of the solution are likely to be stressed further?
+- **Robustness:** How could the code be made more robust against unexpected or invalid inputs?
 
 3.  **Student's C Code (`{c_file_path}`):**
     ```c
     {c_code}
     ```
 
-4.  **Successful `make` Output:**
+4.  **Build and Test Summary (parsed from the `make` output):**
     ```
     {make_output}
     ```
 
+5.  **Static Pre-check Findings (from a local pattern checker, already shown to the student; may contain false positives):**
+    ```
+    {static_findings}
+    ```
+
 **Your Task:**
 The student's code works for the basic tests. Congratulate them briefly. Then, challenge them to think deeper. Prompt them with questions about potential edge cases and what hidden tests might be evaluating. Suggest areas for code refinement without rewriting it for them.
+Do not re-explain the static findings; confirm the ones that matter in a sentence each and say which are false positives.
 """
 
-# Prompt for when the code fails or has issues
-FAILURE_PROMPT_TEMPLATE = """
-You are an expert C programming tutor for the PB152 course. Your task is to provide guidance to a student on how to proceed with their coding assignment based on the errors from their last run.
-
-Do not provide a direct solution or complete code. Instead, act as a helpful guide who points the student in the right direction. Your advice should be based on the provided context, which includes the student's current code, the `make` output, a description of the course's build environment, and a reference manual.
+# Suffix for when the code fails or has issues
+FAILURE_SUFFIX_TEMPLATE = """
+The student's last run failed. Your task is to point them in the right direction based on the errors.
 
 Analyze the student's code in light of the execution log from `make`. Your guidance should help the student understand the error, suggest relevant functions from the reference manual, and give them a strategy for the next steps.
 
-**Context:**
-
-1.  **Course Environment Description (`pb152.process.txt`):**
-    ```
-    {process_context}
-    ```
-
-2.  **C/POSIX Reference Manual (`pb152.reference.compressed.txt`):**
-    ```
-    {reference_context}
-    ```
-
 3.  **Student's C Code (`{c_file_path}`):**
     ```c
     {c_code}
     ```
 
-4.  **Execution Log (from `make` stdout and stderr):**
+4.  **Build and Test Summary (parsed from `make` stdout and stderr):**
     ```
     {make_output}
     ```
 
+5.  **Static Pre-check Findings (from a local pattern checker, already shown to the student; may contain false positives):**
+    ```
+    {static_findings}
+    ```
+
 **Your Task:**
 Based on the error messages, provide a clear, encouraging, and actionable guide for the student. Focus on what they should try next. Explain what the error means in this context and what part of the code is likely causing it.
+If a static finding explains the failure, build on it instead of repeating it; otherwise leave the findings out.
+"""
+
+# Full prompts; with a cached prefix the same text is sent, split between the cache and the request
+SUCCESS_PROMPT_TEMPLATE = PROMPT_PREFIX_TEMPLATE + REFERENCE_TEMPLATE + SUCCESS_SUFFIX_TEMPLATE
+FAILURE_PROMPT_TEMPLATE = PROMPT_PREFIX_TEMPLATE + REFERENCE_TEMPLATE + FAILURE_SUFFIX_TEMPLATE
+
+# Prompt for a follow-up in an advisor session: the changes since the last advice instead of the full context
+FOLLOWUP_PROMPT_TEMPLATE = """
+You are an expert C programming tutor for the PB152 course, continuing a session with a student about `{c_file_path}`. As before, do not provide a direct solution or complete code.
+
+**Your earlier advice in this session (summaries, oldest first):**
+{history}
+
+**Changes the student made since your last advice (unified diff):**
+```diff
+{diff}
+```
+
+**Build and Test Summary now (parsed from the `make` output):**
+```
+{make_output}
+```
+
+**Static Pre-check Findings now (from a local pattern checker; may contain false positives):**
+```
+{static_findings}
+```
+
+**Your Task:**
+Say briefly whether the changes address your earlier advice and what the new build result means, then give the next step. Refer to the changed lines and keep it shorter than a first answer.
 """
 
 
+class AdvisorError(Exception):
+    pass
+
+
+class CachedPrefixFailed(Exception):
+    """A request referring to the cached prompt prefix failed before any answer arrived."""
+    def __init__(self, error: Exception):
+        super().__init__(str(error))
+        self.error = error
+
+
+class MakeResult(NamedTuple):
+    stdout: str
+    stderr: str
+    returncode: int
+    seconds: float = 0.0
+
+    @property
+    def output(self) -> str:
+        return self.stdout + self.stderr
+
+
+class PreparedPrompt(NamedTuple):
+    c_file_path: Path
+    prompt: str
+    cache_key: str
+    passed: bool
+    static_findings: str
+    c_code: str
+    make_summary: str
+    template: str    # success, failure or followup
+    suffix: str      # the prompt without the prefix, sent when the prefix is cached
+
+
+class Answer(NamedTuple):
+    text: str
+    first_token_s: Optional[float]
+    total_s: float
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+
+
 def read_file_or_default(path: Path, default: str) -> str:
     """Reads a file's content, returning a default string if it doesn't exist."""
     try:
@@ -95,99 +193,357 @@ def read_file_or_default(path: Path, default: str) -> str:
     except FileNotFoundError:
         return default
 
-def main():
-    """Main function to generate and print the advisor's guidance."""
-    # 1. Check for API Key
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        print("Error: The GEMINI_API_KEY environment variable is not set.", file=sys.stderr)
-        sys.exit(1)
-
-    # 2. Get File Path from Arguments
-    if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} <path_to_c_file>", file=sys.stderr)
-        sys.exit(1)
-    
-    c_file_path = Path(sys.argv[1]).resolve()
-
-    if not c_file_path.is_file():
-        print(f"Error: File not found at '{c_file_path}'", file=sys.stderr)
-        sys.exit(1)
-
-    # Touch the file to update its modification time, forcing make to recompile.
+def run_make(c_file_path: Path) -> MakeResult:
+    """Builds and tests the task belonging to `c_file_path` with `make <stem>`."""
+    # Touch the file so make re-runs the build and the tests. The compile cache in
+    # the exam makefile restores unchanged objects, so this doesn't cost a full rebuild.
     c_file_path.touch()
-
-    c_file_dir = c_file_path.parent
-    c_file_name = c_file_path.name
     make_target = c_file_path.stem
-
-    # 3. Run `make` command
-    print(f"Running 'make {make_target}' in {c_file_dir}...", file=sys.stderr)
+    start = time.monotonic()
     try:
-        make_process = subprocess.run(
-            ["make", make_target],
-            cwd=c_file_dir,
-            capture_output=True,
-            text=True,
-            timeout=30 # 30-second timeout for safety
-        )
-        make_output = make_process.stdout + make_process.stderr
-        print("---", "make output", "---", file=sys.stderr)
-        print(make_output, file=sys.stderr)
-        print("---", "end make output", "---", "\n", file=sys.stderr)
-
+        with span('make', target=make_target):
+            make_process = subprocess.run(
+                ["make", make_target],
+                cwd=c_file_path.parent,
+                capture_output=True,
+                text=True,
+                timeout=MAKE_TIMEOUT # timeout for safety
+            )
     except FileNotFoundError:
-        print("Error: 'make' command not found. Is it installed and in your PATH?", file=sys.stderr)
-        sys.exit(1)
+        raise AdvisorError("'make' command not found. Is it installed and in your PATH?")
     except subprocess.TimeoutExpired:
-        print(f"Error: 'make {make_target}' timed out after 30 seconds.", file=sys.stderr)
-        sys.exit(1)
+        raise AdvisorError(f"'make {make_target}' timed out after {MAKE_TIMEOUT} seconds.")
+    return MakeResult(make_process.stdout, make_process.stderr, make_process.returncode, time.monotonic() - start)
+
+def make_client(api_key: str):
+    """Creates the Gemini client, honouring the base URL override."""
+    # Imported here so usage errors and the other subcommands don't pay for the SDK import
+    from google import genai
+    from google.genai import types
+
+    base_url = os.environ.get(BASE_URL_ENV)
+    http_options = types.HttpOptions(base_url=base_url) if base_url else None
+    return genai.Client(api_key=api_key, http_options=http_options)
 
-    # 4. Read Context
+def get_api_key() -> str:
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        raise AdvisorError("The GEMINI_API_KEY environment variable is not set.")
+    return api_key
+
+def generation_config(cached_content: Optional[str] = None):
+    from google.genai import types
+    return types.GenerateContentConfig(temperature=TEMPERATURE, cached_content=cached_content)
+
+def make_context_cache() -> ContextCache:
+    """The provider-side cache of the prompt prefix (instructions and course environment)."""
+    prefix = PROMPT_PREFIX_TEMPLATE.format(
+        process_context=read_file_or_default(PROCESS_CONTEXT_FILE, "Process context not found.")
+    )
+    return ContextCache(prefix, MODEL_NAME, PROMPT_PREFIX_TEMPLATE, (PROCESS_CONTEXT_FILE,))
+
+def usage_counts(usage) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """Prompt, answer and cached token counts from a response's usage metadata, if the API sent any."""
+    if usage is None:
+        return None, None, None
+    return usage.prompt_token_count, usage.candidates_token_count, usage.cached_content_token_count
+
+def stream_advice(client, prompt: str, renderer, verbose: bool, cached_content: Optional[str] = None) -> Answer:
+    """Streams the model's answer through `renderer` and returns it with its timings."""
+    start = time.monotonic()
+    first_token_at = None
+    parts = []
+    usage = None
+    with span('api request', model=MODEL_NAME, cached_prefix=bool(cached_content)) as request:
+        try:
+            for chunk in client.models.generate_content_stream(
+                model=MODEL_NAME,
+                contents=prompt,
+                config=generation_config(cached_content)
+            ):
+                usage = chunk.usage_metadata or usage
+                text = chunk.text
+                if not text:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.monotonic()
+                    if request is not None:
+                        request.args['first_token_s'] = f"{first_token_at - start:.3f}"
+                parts.append(text)
+                renderer.write(text)
+        except Exception as e:
+            # Nothing was shown yet, so the caller can still retry with the full prompt
+            if cached_content and not parts:
+                raise CachedPrefixFailed(e)
+            raise
+        renderer.finish()
+
+    total = time.monotonic() - start
+    first_token_s = first_token_at - start if first_token_at is not None else None
+    if verbose:
+        ttft = f"{first_token_s:.2f}s" if first_token_s is not None else "n/a"
+        print(f"\n[advisor] time to first token: {ttft}, total latency: {total:.2f}s", file=sys.stderr)
+    return Answer(''.join(parts), first_token_s, total, *usage_counts(usage))
+
+def select_reference_context(c_code: str, make_output: str, top_k: int, token_budget: int, show: bool) -> str:
+    """Picks the reference manual sections relevant to the code and build log."""
+    try:
+        with span('load reference index'):
+            index = ReferenceIndex.from_file(REFERENCE_CONTEXT_FILE)
+    except FileNotFoundError:
+        return "Reference context not found."
+
+    with span('rank sections'):
+        chosen = index.select(build_query(c_code, make_output), top_k=top_k, token_budget=token_budget)
+    if show:
+        print("--- reference sections ---", file=sys.stderr)
+        for ranked in chosen:
+            print(f"  {ranked.section.number:>2}. {ranked.section.title} "
+                  f"(score {ranked.score:.2f}, ~{ranked.section.tokens} tokens)", file=sys.stderr)
+        if not chosen:
+            print("  (none matched)", file=sys.stderr)
+        print("---", "end reference sections", "---", "\n", file=sys.stderr)
+    return format_sections(chosen)
+
+def prepare_prompt(c_file_path: Path, make_result: MakeResult, args: argparse.Namespace) -> PreparedPrompt:
+    """Reads the context, picks the template and builds the prompt and its cache key."""
     c_code = read_file_or_default(c_file_path, "")
     process_context = read_file_or_default(PROCESS_CONTEXT_FILE, "Process context not found.")
-    reference_context = read_file_or_default(REFERENCE_CONTEXT_FILE, "Reference context not found.")
-
-    # 5. Choose Prompt and Construct
-    tests_passed = make_process.stdout.strip().endswith("OK")
-
-    if tests_passed:
-        prompt = SUCCESS_PROMPT_TEMPLATE.format(
-            process_context=process_context,
-            reference_context=reference_context,
-            c_file_path=c_file_name,
-            c_code=c_code,
-            make_output=make_output
-        )
-    else:
-        prompt = FAILURE_PROMPT_TEMPLATE.format(
-            process_context=process_context,
-            reference_context=reference_context,
-            c_file_path=c_file_name,
-            c_code=c_code,
-            make_output=make_output
-        )
-
-    # 6. Call the Gemini API
+    reference_context = select_reference_context(
+        c_code, make_result.output, args.top_k, args.reference_budget, args.show_sections
+    )
+
+    with span('parse build log'):
+        build_report = parse_build_log(make_result.stdout, make_result.stderr, make_result.returncode)
+    template = SUCCESS_PROMPT_TEMPLATE if build_report.passed else FAILURE_PROMPT_TEMPLATE
+    suffix_template = SUCCESS_SUFFIX_TEMPLATE if build_report.passed else FAILURE_SUFFIX_TEMPLATE
+
+    with span('static checks'):
+        static_findings = format_findings(check_source(c_code), c_file_path.name)
+    make_summary = build_report.summary(args.log_budget)
+    suffix = REFERENCE_TEMPLATE.format(reference_context=reference_context) + suffix_template.format(
+        c_file_path=c_file_path.name,
+        c_code=c_code,
+        make_output=make_summary,
+        static_findings=static_findings or "No findings."
+    )
+    prompt = PROMPT_PREFIX_TEMPLATE.format(process_context=process_context) + suffix
+    # The cached-prefix and full variants send the same text, so they share the key
+    key = cache_key(
+        c_code, normalize_make_output(make_result.output), template, process_context,
+        reference_context, static_findings, MODEL_NAME, str(TEMPERATURE)
+    )
+    return PreparedPrompt(c_file_path, prompt, key, build_report.passed, static_findings, c_code, make_summary,
+                          'success' if build_report.passed else 'failure', suffix)
+
+def prepare_followup(prepared: PreparedPrompt, session: AdviceSession, diff_limit: int) -> Tuple[Optional[PreparedPrompt], str]:
+    """The follow-up prompt for an ongoing session, or None and the reason to send the full prompt."""
+    diff = session.diff(prepared.c_code)
+    blocker = session.followup_blocker(diff, prepared.c_code, diff_limit)
+    if blocker:
+        return None, blocker
+    prompt = FOLLOWUP_PROMPT_TEMPLATE.format(
+        c_file_path=prepared.c_file_path.name,
+        history=session.history(),
+        diff=diff.rstrip('\n') or "(no changes to the code)",
+        make_output=prepared.make_summary,
+        static_findings=prepared.static_findings or "No findings."
+    )
+    key = cache_key(prompt, MODEL_NAME, str(TEMPERATURE))
+    reason = f"{diff.count(chr(10))} diff lines, {len(session.turns)} earlier answers"
+    return prepared._replace(prompt=prompt, cache_key=key, template='followup', suffix=prompt), reason
+
+def precheck_files(files: List[Path]) -> int:
+    """Prints the static pre-check findings of each file; returns how many were found."""
+    total = 0
+    for c_file_path in files:
+        try:
+            c_code = c_file_path.read_text(encoding='utf-8', errors='replace')
+        except OSError as e:
+            raise AdvisorError(f"Cannot read '{c_file_path}': {e}")
+        with span('static checks', file=c_file_path.name):
+            findings = check_source(c_code)
+        total += len(findings)
+        print(f"{c_file_path.name}: {len(findings) or 'no'} finding{'' if len(findings) == 1 else 's'}")
+        if findings:
+            print(format_findings(findings, c_file_path.name))
+    return total
+
+def advise_file(c_file_path: Path, args: argparse.Namespace):
+    """Builds one C file, then prints the (cached or streamed) advice."""
+    if not c_file_path.is_file():
+        raise AdvisorError(f"File not found at '{c_file_path}'")
+
+    # 1. Run `make` command
+    print(f"Running 'make {c_file_path.stem}' in {c_file_path.parent}...", file=sys.stderr)
+    make_result = run_make(c_file_path)
+    print("---", "make output", "---", file=sys.stderr)
+    print(make_result.output, file=sys.stderr)
+    print("---", "end make output", "---", "\n", file=sys.stderr)
+
+    # 2. Read context and construct the prompt
+    with span('prepare prompt'):
+        prepared = prepare_prompt(c_file_path, make_result, args)
+    if prepared.static_findings:
+        print("---", "static pre-checks", "---", file=sys.stderr)
+        print(prepared.static_findings, file=sys.stderr)
+        print("---", "end static pre-checks", "---", "\n", file=sys.stderr)
+
+    # 3. Continue the file's session with a diff, or send the full context
+    session = AdviceSession(c_file_path)
+    if args.reset:
+        session.reset()
+        print("Advisor session reset.", file=sys.stderr)
+    request, followup = prepared, False
+    if not args.no_session:
+        followup_request, reason = prepare_followup(prepared, session, args.diff_limit)
+        if followup_request:
+            request, followup = followup_request, True
+        print(f"Advisor session: {'follow-up' if followup else 'full prompt'} ({reason})", file=sys.stderr)
+    if args.verbose:
+        print(f"[advisor] prompt: {len(request.prompt)} characters (full prompt: {len(prepared.prompt)})", file=sys.stderr)
+
+    # 4. Look up the advice cache; the same code and build output get the same answer
+    metrics = AdviceCall(
+        time.time(), c_file_path.name, request.template, 'off' if args.no_cache else 'miss',
+        len(request.prompt), estimate_tokens(request.prompt), make_s=round(make_result.seconds, 3)
+    )
+    cache = AdviceCache()
+    if not args.no_cache:
+        with span('cache lookup'):
+            # An answer to the full prompt is preferred, even when a follow-up would be sent
+            served = prepared
+            cached_advice = cache.get(prepared.cache_key)
+            if cached_advice is None and followup:
+                served = request
+                cached_advice = cache.get(request.cache_key)
+        if cached_advice is not None:
+            print(f"Advice cache: hit ({served.cache_key[:12]}, {served.template} prompt)\n", file=sys.stderr)
+            renderer = make_renderer(args.render)
+            renderer.write(cached_advice)
+            renderer.finish()
+            if not args.no_session and session.source != prepared.c_code:
+                save_session_turn(session, prepared, cached_advice, served.template == 'followup')
+            try_record_call(metrics._replace(template=served.template, cache='hit', prompt_chars=len(served.prompt),
+                                             prompt_tokens_est=estimate_tokens(served.prompt)))
+            return
+        print(f"Advice cache: miss ({request.cache_key[:12]})", file=sys.stderr)
+
+    # 5. Call the Gemini API and stream the response, sending only the suffix if the prefix is cached
+    api_key = get_api_key()
     try:
+        with span('create client'):
+            client = make_client(api_key)
+        cached_prefix = None
+        if not followup:
+            if args.no_context_cache:
+                metrics = metrics._replace(prefix_cache='off')
+            else:
+                context = make_context_cache()
+                with span('context cache'):
+                    cached_prefix, reason = context.ensure(client)
+                print(f"Context cache: {reason}", file=sys.stderr)
+                metrics = metrics._replace(prefix_cache='unavailable')
         print(f"Veryfi Advisor is thinking...\n", file=sys.stderr)
-        
-        client = genai.Client(api_key=api_key)
-        
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                temperature=0.2,
-            )
-        )
-        
-        # 7. Print the Response
-        print(response.text)
-
+        renderer = make_renderer(args.render)
+        answer = None
+        if cached_prefix:
+            metrics = metrics._replace(prompt_chars=len(request.suffix), prompt_tokens_est=estimate_tokens(request.suffix),
+                                       prefix_cache='created' if cached_prefix.created else 'hit')
+            if args.verbose:
+                print(f"[advisor] sending the suffix only: {len(request.suffix)} characters", file=sys.stderr)
+            try:
+                answer = stream_advice(client, request.suffix, renderer, args.verbose, cached_prefix.name)
+            except CachedPrefixFailed as e:
+                if is_rejection(e.error):
+                    context.forget(cached_prefix.name)
+                print(f"Context cache: not accepted ({type(e.error).__name__}), sending the full prompt\n", file=sys.stderr)
+                metrics = metrics._replace(prompt_chars=len(request.prompt), prompt_tokens_est=estimate_tokens(request.prompt),
+                                           prefix_cache='failed')
+        if answer is None:
+            answer = stream_advice(client, request.prompt, renderer, args.verbose)
     except Exception as e:
-        print(f"\nError: An error occurred while contacting the Gemini API: {e}", file=sys.stderr)
+        try_record_call(metrics._replace(error=type(e).__name__))
+        raise AdvisorError(f"An error occurred while contacting the Gemini API: {e}")
+    try_record_call(metrics._replace(
+        ttft_s=answer.first_token_s and round(answer.first_token_s, 3), total_s=round(answer.total_s, 3),
+        input_tokens=answer.input_tokens, output_tokens=answer.output_tokens, cached_tokens=answer.cached_tokens
+    ))
+
+    advice = answer.text
+
+    if not args.no_cache and advice:
+        try:
+            cache.put(request.cache_key, advice)
+        except OSError as e:
+            print(f"Warning: Could not write advice cache: {e}", file=sys.stderr)
+    if not args.no_session and advice:
+        save_session_turn(session, prepared, advice, followup)
+
+def save_session_turn(session: AdviceSession, prepared: PreparedPrompt, advice: str, followup: bool):
+    try:
+        session.record(prepared.c_code, prepared.make_summary, prepared.passed, advice, followup)
+    except OSError as e:
+        print(f"Warning: Could not save the advisor session: {e}", file=sys.stderr)
+
+def main():
+    """Main function to generate and print the advisor's guidance."""
+    if sys.argv[1:2] == ['stats'] and not Path('stats').is_file():
+        from advice_metrics import stats_main
+        stats_main(sys.argv[2:])
+        return
+    parser = argparse.ArgumentParser(description="Get AI-powered advice on a PB152 C file.")
+    parser.add_argument('file', type=Path, nargs='?', help="Path to the C file")
+    parser.add_argument('--all', type=Path, metavar='EXAM_DIR', help="Advise on every task listed in the makefile of EXAM_DIR")
+    parser.add_argument('-k', '--top-k', type=int, default=DEFAULT_TOP_K, help="Maximum number of reference manual sections to include")
+    parser.add_argument('--reference-budget', type=int, default=DEFAULT_TOKEN_BUDGET, help="Token budget for reference manual sections")
+    parser.add_argument('--show-sections', action='store_true', help="Print which reference manual sections were chosen")
+    parser.add_argument('--log-budget', type=int, default=DEFAULT_BYTE_BUDGET, help="Maximum size in bytes of the build log summary sent to the model")
+    parser.add_argument('--no-cache', action='store_true', help="Always ask the model, ignoring and not updating the advice cache")
+    parser.add_argument('--offline', action='store_true', help="Only run the local static pre-checks: no make, no API call")
+    parser.add_argument('--reset', action='store_true', help="Start a new advisor session for the file (send the full context)")
+    parser.add_argument('--no-session', action='store_true', help="Always send the full context and don't update the session")
+    parser.add_argument('--no-context-cache', action='store_true', help="Send the whole prompt instead of referring to the prefix cached by the API")
+    parser.add_argument('--diff-limit', type=int, default=DEFAULT_DIFF_LIMIT, help="Largest diff in bytes sent as a follow-up; larger changes get the full prompt")
+    parser.add_argument('--render', choices=sorted(RENDERERS), default='markdown' if sys.stdout.isatty() else 'plain',
+                        help="How to display the answer (default: markdown on a terminal, plain otherwise)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Report time to first token and total latency")
+    parser.add_argument('--profile', action='store_true', help="Print a timing breakdown of make, prompt preparation and API calls")
+    parser.add_argument('--trace', type=Path, metavar='FILE', help="Also write a Chrome trace (chrome://tracing, Perfetto) to FILE; implies --profile")
+    batch_group = parser.add_argument_group('batch mode (--all)')
+    batch_group.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 2, help="Parallel make builds")
+    batch_group.add_argument('--concurrency', type=int, default=4, help="Maximum simultaneous API requests")
+    batch_group.add_argument('--timeout', type=float, default=120, help="Per-request API timeout in seconds")
+    batch_group.add_argument('--retries', type=int, default=3, help="Retries per API request")
+    batch_group.add_argument('--report', type=Path, help="Also write the combined report to this file")
+    args = parser.parse_args()
+
+    if (args.file is None) == (args.all is None):
+        parser.error("give either a C file or --all EXAM_DIR")
+
+    if args.profile or args.trace:
+        tracing.enable()
+    try:
+        with span('advise'):
+            if args.offline:
+                if args.all is not None:
+                    from advise_batch import read_task_list
+                    precheck_files(read_task_list(args.all.resolve()))
+                else:
+                    if not args.file.is_file():
+                        raise AdvisorError(f"File not found at '{args.file}'")
+                    precheck_files([args.file.resolve()])
+            elif args.all is not None:
+                # Imported here so single-file runs don't pay for asyncio and the process pool
+                from advise_batch import advise_all
+                advise_all(args.all.resolve(), args)
+            else:
+                advise_file(args.file.resolve(), args)
+    except AdvisorError as e:
+        print(f"\nError: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        tracing.finish(args.trace)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+Content-addressed store for finished exams.
+
+Replaces the `exams_finished/examNN <timestamp>` directories. Every archived
+file is stored once as a zlib-compressed blob named by the SHA-256 of its
+content, and each exam gets a small JSON manifest (file names -> blobs, the
+anonymization mapping, timestamps and duration). `index.json` summarizes all
+manifests, so listing and stats read one file, and exam numbers come from a
+counter instead of counting directories.
+
+Layout inside `exams_finished/`:
+
+    objects/ab/abcdef...   compressed blobs
+    manifests/0007.json    one manifest per exam
+    index.json             exam summaries, blob sizes and the next exam number
+
+Run as a script with `--migrate` to import existing `examNN ...` directories.
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import shutil
+import hashlib
+import logging
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+# --- Configuration ---
+ARCHIVE_DIR_NAME = 'exams_finished'
+INDEX_FILE = 'index.json'
+OBJECTS_DIR = 'objects'
+MANIFESTS_DIR = 'manifests'
+RESTORE_DIR_NAME = 'exams_restored'
+DURATION_FILE = 'exam.time.length.txt'
+INDEX_VERSION = 1
+COMPRESSION_LEVEL = 6
+LEGACY_DIR_PATTERN = re.compile(r'^exam(\d+)\b')
+LEGACY_DURATION_PATTERN = re.compile(r'(\d+)h:(\d+)m')
+LEGACY_KEPT_PREFIX = 'not-imported '
+
+
+class ArchiveStoreError(Exception):
+    pass
+
+
+class ExamSummary(NamedTuple):
+    number: int
+    name: str
+    generated_at: Optional[float]
+    archived_at: float
+    duration: Optional[int]
+    files: int
+    bytes: int
+
+
+def blob_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def format_duration(seconds: int) -> str:
+    return f"{seconds // 3600}h:{(seconds % 3600) // 60:02d}m"
+
+
+def exam_name(number: int, generated_at: float) -> str:
+    """The directory-style name the old archive used, e.g. 'exam07 Sat 17.10. 3AM'."""
+    return f"exam{number:02d} {datetime.fromtimestamp(generated_at).strftime('%a %-d.%-m. %-I%p')}"
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class ArchiveStore:
+    """Deduplicated, compressed archive of finished exams in `exams_finished/`."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.index_path = directory / INDEX_FILE
+        self.index = self._load_index()
+
+    def _load_index(self) -> dict:
+        try:
+            with self.index_path.open() as f:
+                index = json.load(f)
+            if index.get('version') == INDEX_VERSION:
+                return index
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            raise ArchiveStoreError(f"Cannot read archive index '{self.index_path}': {e}") from e
+        return {'version': INDEX_VERSION, 'next_number': 1, 'exams': [], 'blobs': {}}
+
+    def save_index(self):
+        _write_atomic(self.index_path, json.dumps(self.index, indent=1).encode('utf-8'))
+
+    # --- Blobs ---
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.directory / OBJECTS_DIR / digest[:2] / digest
+
+    def put_blob(self, data: bytes) -> str:
+        digest = blob_hash(data)
+        if digest not in self.index['blobs'] or not self._blob_path(digest).exists():
+            compressed = zlib.compress(data, COMPRESSION_LEVEL)
+            _write_atomic(self._blob_path(digest), compressed)
+            self.index['blobs'][digest] = [len(data), len(compressed)]
+        return digest
+
+    def get_blob(self, digest: str) -> bytes:
+        try:
+            data = zlib.decompress(self._blob_path(digest).read_bytes())
+        except (OSError, zlib.error) as e:
+            raise ArchiveStoreError(f"Cannot read blob {digest[:12]}: {e}") from e
+        if blob_hash(data) != digest:
+            raise ArchiveStoreError(f"Blob {digest[:12]} is corrupted")
+        return data
+
+    # --- Exams ---
+
+    def _manifest_path(self, number: int) -> Path:
+        return self.directory / MANIFESTS_DIR / f"{number:04d}.json"
+
+    def add_exam(self, files: Dict[str, bytes], mapping: Dict[str, str], generated_at: Optional[float],
+                 archived_at: Optional[float] = None, name: Optional[str] = None) -> ExamSummary:
+        """Stores the files of one exam and writes its manifest and index entry."""
+        archived_at = archived_at if archived_at is not None else time.time()
+        number = self.index['next_number']
+        name = name or exam_name(number, generated_at or archived_at)
+        duration = int(archived_at - generated_at) if generated_at else None
+
+        manifest = {
+            'number': number,
+            'name': name,
+            'generated_at': generated_at,
+            'archived_at': archived_at,
+            'duration': duration,
+            'mapping': mapping,
+            'files': {filename: self.put_blob(data) for filename, data in sorted(files.items())},
+        }
+        _write_atomic(self._manifest_path(number), json.dumps(manifest, indent=1).encode('utf-8'))
+
+        summary = ExamSummary(number, name, generated_at, archived_at, duration,
+                              len(files), sum(len(d) for d in files.values()))
+        self.index['exams'].append(summary._asdict())
+        self.index['next_number'] = number + 1
+        self.save_index()
+        return summary
+
+    def exams(self) -> List[ExamSummary]:
+        return [ExamSummary(**entry) for entry in self.index['exams']]
+
+    def manifest(self, number: int) -> dict:
+        try:
+            with self._manifest_path(number).open() as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise ArchiveStoreError(f"No archived exam number {number}")
+        except (OSError, ValueError) as e:
+            raise ArchiveStoreError(f"Cannot read manifest of exam {number}: {e}") from e
+
+    def restore(self, number: int, dest_dir: Path) -> Path:
+        """Writes the files of an archived exam (and its duration note) into `dest_dir`."""
+        manifest = self.manifest(number)
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        for filename, digest in manifest['files'].items():
+            path = dest_dir / filename
+            if '/' in filename:    # imported from a subdirectory of an old archive directory
+                path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(self.get_blob(digest))
+        if manifest.get('duration') is not None and DURATION_FILE not in manifest['files']:
+            (dest_dir / DURATION_FILE).write_text(
+                f"Exam took {format_duration(manifest['duration'])} from generation to archival.\n"
+            )
+        return dest_dir
+
+    def stats(self) -> Dict[str, int]:
+        blobs = self.index['blobs'].values()
+        return {
+            'exams': len(self.index['exams']),
+            'files': sum(e['files'] for e in self.index['exams']),
+            'logical_bytes': sum(e['bytes'] for e in self.index['exams']),
+            'unique_blobs': len(self.index['blobs']),
+            'unique_bytes': sum(raw for raw, _ in blobs),
+            'stored_bytes': sum(stored for _, stored in blobs),
+        }
+
+    # --- Migration ---
+
+    def legacy_dirs(self) -> List[Path]:
+        """`examNN <timestamp>` directories of the old archive, oldest number first."""
+        if not self.directory.is_dir():
+            return []
+        dirs = [p for p in self.directory.iterdir() if p.is_dir() and LEGACY_DIR_PATTERN.match(p.name)]
+        return sorted(dirs, key=lambda p: (int(LEGACY_DIR_PATTERN.match(p.name).group(1)), p.name))
+
+    def import_legacy_dir(self, legacy_dir: Path) -> ExamSummary:
+        """
+        Imports one old archive directory, subdirectories included, and removes it once every blob
+        reads back intact. A directory with entries that can't be archived (symlinks, sockets, ...)
+        is renamed to 'not-imported <name>' instead, so nothing is deleted that wasn't imported.
+        """
+        files, skipped = {}, []
+        for dirpath, dirnames, filenames in os.walk(legacy_dir):
+            for name in sorted(dirnames + filenames):
+                path = Path(dirpath) / name
+                relative = path.relative_to(legacy_dir).as_posix()
+                if path.is_symlink() or not (path.is_dir() or path.is_file()):
+                    skipped.append(relative)
+                elif path.is_file():
+                    files[relative] = path.read_bytes()
+        archived_at = legacy_dir.stat().st_mtime
+        generated_at = None
+        duration = LEGACY_DURATION_PATTERN.search(files.get(DURATION_FILE, b'').decode('utf-8', 'replace'))
+        if duration:
+            generated_at = archived_at - int(duration.group(1)) * 3600 - int(duration.group(2)) * 60
+
+        summary = self.add_exam(files, {}, generated_at, archived_at, name=legacy_dir.name)
+        manifest = self.manifest(summary.number)
+        for filename, digest in manifest['files'].items():
+            if self.get_blob(digest) != files[filename]:
+                raise ArchiveStoreError(f"Verification of {legacy_dir.name}/{filename} failed")
+        if skipped:
+            kept = legacy_dir.with_name(f"{LEGACY_KEPT_PREFIX}{legacy_dir.name}")
+            os.rename(legacy_dir, kept)
+            logging.warning(f"Kept '{kept.name}': {', '.join(skipped)} could not be archived.")
+        else:
+            shutil.rmtree(legacy_dir)
+        return summary
+
+
+def migrate_legacy_archive(directory: Path) -> int:
+    """Imports every `examNN ...` directory of the archive `directory`. Returns the number imported."""
+    store = ArchiveStore(directory)
+    count = 0
+    for legacy_dir in store.legacy_dirs():
+        try:
+            store.import_legacy_dir(legacy_dir)
+        except OSError as e:
+            raise ArchiveStoreError(f"Cannot import '{legacy_dir}': {e}") from e
+        count += 1
+    return count
+
+
+def open_archive_store(directory: Path) -> ArchiveStore:
+    """
+    Opens the archive in `directory`, importing old archive directories first
+    if there are any. The caller holds the progress store lock.
+    """
+    store = ArchiveStore(directory)
+    if store.legacy_dirs():
+        count = migrate_legacy_archive(directory)
+        logging.info(f"Imported {count} archived exams into the archive store.")
+        store = ArchiveStore(directory)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the pb152tools exam archive.")
+    parser.add_argument('--migrate', action='store_true', help="Import old 'examNN ...' archive directories")
+    parser.add_argument('--root', type=Path, default=Path.home() / 'pb152', help="pb152 root directory")
+    args = parser.parse_args()
+
+    if args.migrate:
+        from progress_store import ProgressStoreError, open_progress_store
+        try:
+            # The lock `exam archive` holds while it adds to the archive
+            with open_progress_store(args.root).lock():
+                count = migrate_legacy_archive(args.root / ARCHIVE_DIR_NAME)
+        except (ArchiveStoreError, ProgressStoreError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        if count:
+            print(f"Imported {count} archived exams into {args.root / ARCHIVE_DIR_NAME}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Parser for the output of `make <task>` in a pb152 directory.
+
+Turns the raw build log (strict clang diagnostics, assert failures from the
+test suite, valgrind reports and framework terminations) into deduplicated
+diagnostics, decides whether the run passed, and renders a compact summary
+that fits a byte budget for the advisor prompt.
+"""
+import re
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional
+
+# --- Configuration ---
+DEFAULT_BYTE_BUDGET = 4000
+
+COMPILER_DIAG = re.compile(
+    r'^(?P<file>[^\s:][^:]*\.(?:c|h|cpp)):(?P<line>\d+):(?:(?P<col>\d+):)?\s*'
+    r'(?P<level>fatal error|error|warning):\s*(?P<message>.*)$'
+)
+LINKER_ERROR = re.compile(r'^(?:.*ld(?:\.lld)?:\s*error:|.*undefined reference to)\s*(?P<message>.*)$')
+# glibc: "prog: file.c:12: main: Assertion `x == 1' failed."
+GLIBC_ASSERT = re.compile(r"^(?:.*?: )?(?P<file>[^\s:]+\.c):(?P<line>\d+): (?P<func>[^:]+): Assertion [`'](?P<expr>.*)' failed\.?$")
+# BSD/macOS/clang style: "Assertion failed: (x == 1), function main, file file.c, line 12."
+BSD_ASSERT = re.compile(r'^Assertion failed: \((?P<expr>.*)\), function (?P<func>\S+), file (?P<file>\S+), line (?P<line>\d+)\.?$')
+# Framework macros: "ASSERT_EQ failed: ...", "file.c:12: assertion failed: ..." (the line starts with the macro)
+GENERIC_ASSERT = re.compile(r'^(?:[^\s:]+\.c:\d+: )?(?:ASSERT\w*|assert(?:ion)?)\b[^:]*\bfail(?:ed|ure)\b.*$', re.IGNORECASE)
+VALGRIND_PREFIX = re.compile(r'^==\d+==\s?')
+VALGRIND_LOST = re.compile(r'(?P<kind>definitely lost|indirectly lost|possibly lost):\s*(?P<bytes>[\d,]+) bytes in (?P<blocks>[\d,]+) blocks')
+VALGRIND_ERROR = re.compile(r'^(?P<message>Invalid (?:read|write|free)\b.*|Conditional jump .*|Use of uninitialised value.*|Syscall param .*|Mismatched free.*|Source and destination overlap.*)$')
+VALGRIND_SUMMARY = re.compile(r'ERROR SUMMARY: (?P<errors>\d+) errors?')
+VALGRIND_LOCATION = re.compile(r'^\s*(?:at|by) 0x[0-9A-Fa-f]+: (?P<func>\S+) \((?P<file>[^:()]+):(?P<line>\d+)\)')
+SYSCALL_LIMIT = re.compile(r'^.*\b(?:syscall limit|too many syscalls|syscalls?)\b.*\b(?:exceeded|reached)\b.*$', re.IGNORECASE)
+SIGNALS = r'Segmentation fault|Bus error|Floating point exception|Illegal instruction|Aborted|Killed|Terminated'
+# bash: "./.helper.sh: line 12: 4242 Segmentation fault      (core dumped) ./p1_a", or the bare signal line
+CRASH = re.compile(rf'^(?:[^:]+: line \d+: +\d+ +(?P<signal>{SIGNALS})(?: +\(core dumped\))?(?: +\S.*)?'
+                   rf'|(?P<bare>{SIGNALS})(?: \(core dumped\))?)$')
+MAKE_ERROR = re.compile(r'^(?:g?make)(?:\[\d+\])?: \*\*\* (?P<message>.*)$')
+# What make prints for a recipe killed by a signal or by timeout(1): "[makefile:9: p1_a] Killed", "... Error 124"
+MAKE_SIGNAL = re.compile(rf'^\[.*\] (?:(?P<signal>{SIGNALS})(?: \(core dumped\))?|Error (?P<code>124|129|1[3-9]\d))$')
+PASS_MARKER = re.compile(r'^\s*OK\s*$')
+
+# Diagnostic kinds, in the order they are shown in the summary
+KIND_TITLES = OrderedDict([
+    ('compile_error', 'Compiler errors'),
+    ('link_error', 'Linker errors'),
+    ('compile_warning', 'Compiler warnings'),
+    ('assert', 'Failed asserts'),
+    ('syscall_limit', 'Syscall limit terminations'),
+    ('crash', 'Crashes and signals'),
+    ('valgrind', 'Valgrind errors'),
+    ('leak', 'Valgrind leak summary'),
+    ('make', 'make errors'),
+])
+FAILURE_KINDS = {'compile_error', 'link_error', 'assert', 'syscall_limit', 'crash', 'valgrind', 'leak', 'make'}
+# Failures reported by the test run itself; only these fail a run that make reports as successful
+RUNTIME_FAILURE_KINDS = {'assert', 'syscall_limit', 'crash', 'valgrind', 'leak'}
+
+
+class Diagnostic(NamedTuple):
+    kind: str
+    message: str
+    file: Optional[str] = None
+    line: Optional[int] = None
+    count: int = 1
+
+    @property
+    def location(self) -> str:
+        if self.file and self.line:
+            return f"{self.file}:{self.line}"
+        return self.file or ''
+
+    def format(self) -> str:
+        loc = f"{self.location}: " if self.location else ''
+        times = f" (x{self.count})" if self.count > 1 else ''
+        return f"{loc}{self.message}{times}"
+
+
+class BuildReport(NamedTuple):
+    diagnostics: List[Diagnostic]
+    returncode: Optional[int]
+    saw_ok: bool
+    raw_lines: List[str]
+
+    @property
+    def passed(self) -> bool:
+        """The build succeeded and no test, valgrind or framework failure was reported."""
+        if self.returncode == 0:
+            return not any(d.kind in RUNTIME_FAILURE_KINDS for d in self.diagnostics)
+        if any(d.kind in FAILURE_KINDS for d in self.diagnostics):
+            return False
+        if self.returncode is not None:
+            return self.returncode == 0
+        return self.saw_ok
+
+    def by_kind(self, kind: str) -> List[Diagnostic]:
+        return [d for d in self.diagnostics if d.kind == kind]
+
+    def summary(self, byte_budget: int = DEFAULT_BYTE_BUDGET) -> str:
+        """A compact, deduplicated description of the run that fits `byte_budget`."""
+        out = [f"Result: {'PASSED' if self.passed else 'FAILED'}"
+               + (f" (make exit code {self.returncode})" if self.returncode else '')]
+        for kind, title in KIND_TITLES.items():
+            diags = self.by_kind(kind)
+            if not diags:
+                continue
+            out.append(f"{title} ({sum(d.count for d in diags)}):")
+            out.extend(f"  {d.format()}" for d in diags)
+
+        text = _truncate_lines(out, byte_budget)
+        remaining = byte_budget - len(text.encode('utf-8'))
+
+        # Fill what is left with the end of the deduplicated raw log for context
+        if remaining > 200 and self.raw_lines:
+            tail = []
+            used = len("\nLog excerpt (deduplicated, last lines):\n")
+            for line in reversed(self.raw_lines):
+                size = len(line.encode('utf-8')) + 3
+                if used + size > remaining:
+                    break
+                tail.append(line)
+                used += size
+            if tail:
+                text += "\nLog excerpt (deduplicated, last lines):\n" + '\n'.join(f"  {l}" for l in reversed(tail))
+        return text
+
+
+def _truncate_lines(lines: List[str], byte_budget: int) -> str:
+    kept = []
+    used = 0
+    for i, line in enumerate(lines):
+        size = len(line.encode('utf-8')) + 1
+        if used + size > byte_budget:
+            kept.append(f"  ... {len(lines) - i} more lines omitted")
+            break
+        kept.append(line)
+        used += size
+    return '\n'.join(kept)
+
+
+def _dedupe_raw(lines: List[str]) -> List[str]:
+    """Collapses repeated lines (ignoring valgrind pids) into 'line (xN)'."""
+    counts = OrderedDict()
+    for line in lines:
+        key = VALGRIND_PREFIX.sub('', line).rstrip()
+        if not key.strip():
+            continue
+        counts[key] = counts.get(key, 0) + 1
+    return [f"{line} (x{n})" if n > 1 else line for line, n in counts.items()]
+
+
+def parse_build_log(stdout: str, stderr: str = '', returncode: Optional[int] = None) -> BuildReport:
+    """Parses the combined output of a `make` run."""
+    found = OrderedDict()
+
+    def add(kind: str, message: str, file: Optional[str] = None, line: Optional[int] = None):
+        key = (kind, message.strip(), file, line)
+        found[key] = found.get(key, 0) + 1
+
+    lines = (stdout + '\n' + stderr).splitlines()
+    saw_ok = any(PASS_MARKER.match(l) for l in stdout.strip().splitlines()[-1:])
+    pending_valgrind: Optional[str] = None
+    valgrind_total = 0
+
+    for raw in lines:
+        is_valgrind = bool(VALGRIND_PREFIX.match(raw))
+        line = VALGRIND_PREFIX.sub('', raw).rstrip()
+        if not line.strip():
+            if pending_valgrind:
+                add('valgrind', pending_valgrind)
+                pending_valgrind = None
+            continue
+
+        if is_valgrind:
+            location = VALGRIND_LOCATION.match(line)
+            if pending_valgrind and location:
+                add('valgrind', pending_valgrind, location.group('file'), int(location.group('line')))
+                pending_valgrind = None
+                continue
+            if pending_valgrind:
+                add('valgrind', pending_valgrind)
+                pending_valgrind = None
+            m = VALGRIND_ERROR.match(line.strip())
+            if m:
+                pending_valgrind = m.group('message')
+                continue
+            m = VALGRIND_LOST.search(line)
+            if m and m.group('bytes') != '0':
+                add('leak', f"{m.group('kind')}: {m.group('bytes')} bytes in {m.group('blocks')} blocks")
+                continue
+            m = VALGRIND_SUMMARY.search(line)
+            if m and m.group('errors') != '0':
+                valgrind_total = max(valgrind_total, int(m.group('errors')))
+            continue
+
+        m = COMPILER_DIAG.match(line)
+        if m:
+            kind = 'compile_warning' if m.group('level') == 'warning' else 'compile_error'
+            add(kind, m.group('message'), m.group('file'), int(m.group('line')))
+            continue
+        m = LINKER_ERROR.match(line)
+        if m:
+            add('link_error', line.strip())
+            continue
+        m = GLIBC_ASSERT.match(line) or BSD_ASSERT.match(line)
+        if m:
+            add('assert', f"{m.group('func')}: assertion `{m.group('expr')}` failed", m.group('file'), int(m.group('line')))
+            continue
+        if SYSCALL_LIMIT.match(line):
+            add('syscall_limit', line.strip())
+            continue
+        if GENERIC_ASSERT.match(line):
+            add('assert', line.strip())
+            continue
+        m = MAKE_ERROR.match(line)
+        if m:
+            signal = MAKE_SIGNAL.match(m.group('message'))
+            if signal and signal.group('signal'):
+                add('crash', signal.group('signal'))
+            elif signal and signal.group('code') == '124':
+                add('crash', "timed out")
+            elif signal and not any(k[0] == 'crash' for k in found):
+                # The shell line naming the signal, if any, came before make's
+                add('crash', f"killed by signal {int(signal.group('code')) - 128}")
+            else:
+                add('make', m.group('message'))
+            continue
+        m = CRASH.match(line.strip())
+        if m:
+            add('crash', m.group('signal') or m.group('bare'))
+            continue
+
+    if pending_valgrind:
+        add('valgrind', pending_valgrind)
+    if valgrind_total and not any(k[0] in ('valgrind', 'leak') for k in found):
+        add('valgrind', f"ERROR SUMMARY: {valgrind_total} errors")
+
+    diagnostics = [
+        Diagnostic(kind, message, file, line, count)
+        for (kind, message, file, line), count in found.items()
+    ]
+    return BuildReport(diagnostics, returncode, saw_ok, _dedupe_raw(lines))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+ccache-style compiler wrapper for exam directories.
+
+The makefile written by `create_dynamic_makefile` prefixes CC/CXX with this
+script. Each compiler invocation is keyed on the preprocessed sources, the
+content of any object inputs, the compiler flags and the hashes of the
+pb152 support files. On a hit the cached artifact is copied to the `-o`
+path and the compiler never runs, so renames by `exam hide`/`exam reveal`
+and the advisor's `touch` no longer force slow rebuilds.
+
+Preprocessed output still contains the source file name (it ends up in
+`assert` messages), so a task compiled as `task_3.c` and as `04.p2_foo.c`
+are two cache entries; toggling between them hits both after the first
+round. Framework objects don't depend on task names and are shared by every
+exam.
+
+Usage: compile_cache.py <real compiler> [compiler arguments...]
+"""
+import os
+import sys
+import shutil
+import hashlib
+import subprocess
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# --- Configuration ---
+CACHE_DIR = Path.home() / 'pb152' / '.cache' / 'objects'
+MAX_CACHE_BYTES = 300 * 1024 * 1024
+SUPPORT_FILES = ['pb152.cpp', 'pb152io.c']
+SOURCE_SUFFIXES = {'.c', '.cc', '.cpp', '.cxx', '.C'}
+INPUT_SUFFIXES = SOURCE_SUFFIXES | {'.o', '.a', '.so'}
+# Flags whose value is the next argument
+FLAGS_WITH_VALUE = {'-o', '-MF', '-MT', '-MQ', '-I', '-D', '-U', '-include', '-isystem', '-x', '-L', '-l'}
+DEPENDENCY_FLAGS = {'-MD', '-MMD', '-M', '-MM', '-MP', '-MG'}
+DISABLE_ENV = 'PB152_NO_CCACHE'
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def parse_args(args: List[str]) -> Tuple[Optional[str], List[str], List[str], Optional[str]]:
+    """Splits compiler arguments into (output, inputs, key flags, dependency file)."""
+    output = None
+    dep_file = None
+    inputs = []
+    flags = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in FLAGS_WITH_VALUE and i + 1 < len(args):
+            value = args[i + 1]
+            if arg == '-o':
+                output = value
+            elif arg == '-MF':
+                dep_file = value
+            elif arg not in ('-MT', '-MQ'):
+                flags += [arg, value]
+            i += 2
+            continue
+        if arg.startswith('-o') and len(arg) > 2:
+            output = arg[2:]
+        elif arg in DEPENDENCY_FLAGS or arg.startswith('-MF'):
+            pass
+        elif not arg.startswith('-') and Path(arg).suffix in INPUT_SUFFIXES:
+            inputs.append(arg)
+        else:
+            flags.append(arg)
+        i += 1
+    return output, inputs, flags, dep_file
+
+
+def preprocess(compiler: List[str], flags: List[str], source: str) -> Optional[bytes]:
+    """Preprocessed text of `source`, or None if the compiler refuses."""
+    pp_flags = [f for f in flags if f not in ('-c', '-S')]
+    try:
+        proc = subprocess.run(compiler + pp_flags + ['-E', source], capture_output=True)
+    except OSError:
+        return None
+    return proc.stdout if proc.returncode == 0 else None
+
+
+def compute_key(compiler: List[str], flags: List[str], inputs: List[str]) -> Optional[str]:
+    h = hashlib.sha256()
+    h.update(' '.join(compiler + flags).encode())
+    for support in SUPPORT_FILES:
+        if os.path.exists(support):
+            h.update(f"{support}:{file_hash(Path(support))}".encode())
+    for name in inputs:
+        if Path(name).suffix in SOURCE_SUFFIXES:
+            data = preprocess(compiler, flags, name)
+            if data is None:
+                return None
+            h.update(hashlib.sha256(data).digest())
+        else:
+            try:
+                h.update(file_hash(Path(name)).encode())
+            except OSError:
+                return None
+    return h.hexdigest()
+
+
+def entry_path(key: str) -> Path:
+    return CACHE_DIR / key[:2] / key
+
+
+def evict():
+    """Removes least recently used entries until the cache fits MAX_CACHE_BYTES."""
+    entries = []
+    for sub in CACHE_DIR.iterdir():
+        if not sub.is_dir():
+            continue
+        for entry in sub.iterdir():
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= MAX_CACHE_BYTES:
+            break
+        entry.unlink(missing_ok=True)
+        total -= size
+
+
+def store(key: str, output: str):
+    path = entry_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    shutil.copy2(output, tmp)
+    os.replace(tmp, path)
+    try:
+        evict()
+    except OSError:
+        pass
+
+
+def restore(key: str, output: str, inputs: List[str], dep_file: Optional[str]) -> bool:
+    path = entry_path(key)
+    if not path.exists():
+        return False
+    tmp = f"{output}.{os.getpid()}.tmp"
+    shutil.copy2(path, tmp)
+    os.replace(tmp, output)
+    os.utime(output)  # newer than its inputs, as if just compiled
+    os.utime(path)    # mark as recently used
+    if dep_file:
+        with open(dep_file, 'w') as f:
+            f.write(f"{output}: {' '.join(inputs)}\n")
+    return True
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Usage: {sys.argv[0]} <compiler> [args...]", file=sys.stderr)
+        sys.exit(2)
+
+    # The compiler itself may be several words (e.g. 'ccache clang')
+    argv = sys.argv[1:]
+    split = next((i for i, a in enumerate(argv) if a.startswith('-') or Path(a).suffix in INPUT_SUFFIXES), len(argv))
+    compiler, args = argv[:max(split, 1)], argv[max(split, 1):]
+
+    output, inputs, flags, dep_file = parse_args(args)
+    cacheable = (
+        output and inputs and not os.environ.get(DISABLE_ENV)
+        and '-E' not in flags and output != '-'
+    )
+    key = compute_key(compiler, flags, inputs) if cacheable else None
+
+    if key and restore(key, output, inputs, dep_file):
+        sys.exit(0)
+
+    proc = subprocess.run(compiler + args)
+    if proc.returncode == 0 and key and os.path.isfile(output):
+        try:
+            store(key, output)
+        except OSError:
+            pass
+    sys.exit(proc.returncode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Provider-side context caching of the advisor's prompt prefix.
+
+Every full advisor prompt starts with the same block: the tutor instructions
+and pb152.process.txt. This registers that block once with the Gemini context
+cache API and remembers the cached content's name in
+~/.pb152tools/cache/context.json, keyed on the hashes of the prefix template
+and the asset file and on the model, so a changed asset gets a new cache. The
+entry lives for `DEFAULT_TTL` seconds; calls then send only the variable
+suffix (the selected reference sections onwards) and refer to the cached prefix.
+
+Whenever caching is not possible (disabled, the prefix below the provider's
+minimum size, the API refusing to create a cache, the cache expired or deleted
+on the server) the advisor sends the full prompt instead. A refusal is
+remembered for `RETRY_AFTER` seconds so later calls don't pay for the attempt.
+"""
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+from advice_cache import cache_key
+
+# --- Configuration ---
+REGISTRY_FILE = Path.home() / '.pb152tools' / 'cache' / 'context.json'
+DEFAULT_TTL = 3600
+RENEW_MARGIN = 120         # a cache expiring sooner than this is replaced, not used
+RETRY_AFTER = 6 * 3600     # after the API refused to create a cache
+MIN_TOKENS = 1024          # smallest content the API caches (Gemini 2.5 Flash)
+
+
+class CachedPrefix(NamedTuple):
+    name: str          # cachedContents/...
+    expires: float
+    created: bool      # registered by this call
+
+
+def file_hash(path: Path) -> str:
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return 'missing'
+
+
+def is_rejection(error: Exception) -> bool:
+    """Whether the API refused the request itself (4xx), as opposed to a network or server problem."""
+    code = getattr(error, 'code', None)
+    return isinstance(code, int) and 400 <= code < 500
+
+
+class ContextCache:
+    """The cached prefix for one model and one version of the prompt assets."""
+
+    def __init__(self, prefix: str, model: str, template: str, assets: Tuple[Path, ...],
+                 ttl: int = DEFAULT_TTL, registry: Path = REGISTRY_FILE):
+        self.prefix = prefix
+        self.model = model
+        self.ttl = ttl
+        self.registry = registry
+        self.key = cache_key(template, *(file_hash(path) for path in assets), model)
+
+    def _load(self) -> dict:
+        try:
+            data = json.loads(self.registry.read_text(encoding='utf-8'))
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, data: dict):
+        self.registry.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.registry.with_name(f"{self.registry.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(data, indent=1), encoding='utf-8')
+        os.replace(tmp_path, self.registry)
+
+    def _update(self, change):
+        data = self._load()
+        change(data)
+        try:
+            self._save(data)
+        except OSError:
+            pass
+
+    def lookup(self) -> Tuple[Optional[CachedPrefix], Optional[str]]:
+        """The registered prefix if it is still usable, else None and why not (None if it can be created)."""
+        data = self._load()
+        now = time.time()
+        entry = data.get('entries', {}).get(self.key)
+        if entry and entry['expires'] - now > RENEW_MARGIN:
+            return CachedPrefix(entry['name'], entry['expires'], False), None
+        refused = data.get('refused', {}).get(self.key)
+        if refused and refused['until'] > now:
+            return None, f"not available: {refused['reason']}"
+        return None, None
+
+    def ensure(self, client) -> Tuple[Optional[CachedPrefix], str]:
+        """The cached prefix, registering it if needed, or None and the reason to send the full prompt."""
+        cached, reason = self.lookup()
+        if cached:
+            return cached, f"using {cached.name}, {(cached.expires - time.time()) / 60:.0f} min left"
+        if reason:
+            return None, reason
+        from reference_index import estimate_tokens
+        if estimate_tokens(self.prefix) < MIN_TOKENS:
+            return None, f"prefix below the {MIN_TOKENS}-token minimum"
+
+        from google.genai import types
+        try:
+            created = client.caches.create(model=self.model, config=types.CreateCachedContentConfig(
+                contents=self.prefix, ttl=f"{self.ttl}s", display_name=f"pb152tools-{self.key[:12]}"
+            ))
+        except Exception as e:
+            if is_rejection(e):
+                reason = str(getattr(e, 'message', None) or e).splitlines()[0][:200]
+                self._update(lambda data: data.setdefault('refused', {}).__setitem__(
+                    self.key, {'until': time.time() + RETRY_AFTER, 'reason': reason}))
+                return None, f"refused: {reason}"
+            return None, f"could not be created ({type(e).__name__})"
+
+        expires = created.expire_time.timestamp() if created.expire_time else time.time() + self.ttl
+        cached = CachedPrefix(created.name, expires, True)
+        stale = []
+
+        def register(data: dict):
+            entries = data.setdefault('entries', {})
+            # Caches of older assets are dropped from the registry (and deleted below)
+            stale.extend(e['name'] for k, e in entries.items() if e.get('model') == self.model and k != self.key)
+            for k in [k for k, e in entries.items() if e.get('model') == self.model or e['expires'] < time.time()]:
+                del entries[k]
+            entries[self.key] = {'name': cached.name, 'model': self.model, 'expires': expires}
+            data.get('refused', {}).pop(self.key, None)
+        self._update(register)
+        for name in stale:
+            try:
+                client.caches.delete(name=name)
+            except Exception:
+                pass
+        return cached, f"registered {cached.name} for {self.ttl // 60} min"
+
+    def forget(self, name: str):
+        """Drops a cached prefix the API no longer accepts."""
+        def drop(data: dict):
+            entries = data.get('entries', {})
+            if entries.get(self.key, {}).get('name') == name:
+                del entries[self.key]
+        self._update(drop)
@@ -0,0 +1,112 @@
+"""
+Change notification for a single directory.
+
+`InotifyWatcher` uses Linux inotify through ctypes, so there is no extra
+dependency. Where inotify is not available (macOS, WSL1 on some mounts,
+network home directories without event support), `PollingWatcher` compares
+file mtimes at a fixed interval. Both report the names of files that were
+written or moved into the directory.
+"""
+import os
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+# --- Configuration ---
+DEFAULT_POLL_INTERVAL = 0.5
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class InotifyWatcher:
+    """Reports files closed after writing, or renamed into the directory (how most editors save)."""
+
+    def __init__(self, directory: Path):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Cannot watch {directory}")
+
+    def wait(self, timeout: float) -> Set[str]:
+        """Names of the files changed within `timeout` seconds (empty if none)."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        names = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Detects changes by comparing the mtime and size of the watched files."""
+
+    def __init__(self, directory: Path, names: Iterable[str], interval: float = DEFAULT_POLL_INTERVAL):
+        self.directory = directory
+        self.names = list(names)
+        self.interval = interval
+        self.stamps = self._snapshot()
+        self.last_poll = time.monotonic()
+
+    def _snapshot(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        stamps = {}
+        for name in self.names:
+            try:
+                st = os.stat(self.directory / name)
+                stamps[name] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                stamps[name] = None
+        return stamps
+
+    def wait(self, timeout: float) -> Set[str]:
+        time.sleep(max(0.0, min(timeout, self.last_poll + self.interval - time.monotonic())))
+        if time.monotonic() - self.last_poll < self.interval:
+            return set()
+        self.last_poll = time.monotonic()
+        current = self._snapshot()
+        changed = {name for name, stamp in current.items() if stamp != self.stamps.get(name) and stamp is not None}
+        self.stamps = current
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(directory: Path, names: Iterable[str], force_polling: bool = False):
+    """An inotify watcher if possible, otherwise a polling one for `names`."""
+    if not force_polling:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directory, names)
@@ -1,23 +1,60 @@
 #!/usr/bin/env python
 import os
 import re
+import sys
 import shutil
-import random
 import json
+import time
+import random
 import logging
 import argparse
+import signal
+import tempfile
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import List, Set, Dict, NamedTuple
+from typing import IO, List, Set, Dict, NamedTuple, Optional
+
+from task_index import MONTH_DIR_PATTERN, SUPPORT_FILES, TaskEntry, TaskIndex, load_task_index
+from progress_store import (
+    OUTCOME_FAILED, OUTCOME_PASSED, PROGRESS_DB_FILE, ProgressStore, ProgressStoreError, open_progress_store,
+)
+from build_log import parse_build_log
+from archive_store import ARCHIVE_DIR_NAME, RESTORE_DIR_NAME, ArchiveStore, ArchiveStoreError, format_duration, open_archive_store
+from scheduler import schedule_tasks
+from search_index import open_search_index, read_hit_text
+from file_watch import PollingWatcher, make_watcher
+import tracing
+from tracing import span
 
 # --- Configuration ---
-MONTH_DIR_PATTERN = re.compile(r'^(0[1-9]|1[0-2])$')
-SUPPORT_FILES = ['pb152.cpp', 'pb152io.c', '.helper.sh']
-PROGRESS_FILE = 'exams.progress.json'
 DEST_DIR_NAME = 'exam'
-ARCHIVE_DIR_NAME = 'exams_finished'
-TEXT_SOURCE_FILE = 'text/pb152.reference.txt'
+TEST_RESULTS_FILE = '.test_results.json'
+TEST_LOG_DIR = '.test_logs'
+DEFAULT_TEST_TIMEOUT = 120
+WATCH_DEBOUNCE = 0.3
+MAKE_NOT_FOUND = "'make' command not found. Is it installed and in your PATH?"
+COMPILE_CACHE_SCRIPT = Path(__file__).resolve().parent / 'compile_cache.py'
+COMPILE_CACHE_BEGIN = '# >>> pb152tools compile cache'
+COMPILE_CACHE_END = '# <<< pb152tools compile cache'
+# Makefile profiles: 'full' is the course pipeline, 'fast' runs the tests without valgrind
+PROFILE_FULL = 'full'
+PROFILE_FAST = 'fast'
+PROFILE_ENV = 'PB152_PROFILE'
+PROFILES_BEGIN = '# >>> pb152tools profiles'
+PROFILES_END = '# <<< pb152tools profiles'
+PROFILE_DEFAULT = re.compile(rf'^{PROFILE_ENV}\s*\?=\s*(\w+)', re.MULTILINE)
+FAST_BIN_DIR = Path(__file__).resolve().parent.parent / 'assets' / 'fast-bin'
+FULL_PASS_MARKER = '{}.full-pass'   # in TEST_LOG_DIR, touched by `make check`
+FAST_PASS_MARKER = '{}.fast-pass'   # in TEST_LOG_DIR, touched by `make fast`
+STAGING_PREFIX = f'.{DEST_DIR_NAME}.staging-'
+COPY_WORKERS = 4
+FICLONE = 0x40049409  # Linux ioctl for reflink (copy-on-write) clones
+PB152_UPDATE_STAMP = '.pb152_update'
+PB152_UPDATE_TTL_ENV = 'PB152TOOLS_PB152_UPDATE_TTL'
+DEFAULT_PB152_UPDATE_TTL = 6 * 3600
+OFFLINE_ENV = 'PB152TOOLS_OFFLINE'
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -44,6 +81,15 @@ class WeekStats(NamedTuple):
     completed: int
     completed_names: List[str]
 
+class TaskTestResult(NamedTuple):
+    filename: str
+    task_id: Optional[str]
+    passed: bool
+    seconds: float
+    detail: str
+    log_path: Path
+    profile: str = PROFILE_FULL
+
 
 def get_root_dir() -> Path:
     """
@@ -85,88 +131,40 @@ def parse_week_range(week_str: str) -> Set[str]:
             except ValueError: pass
     return weeks
 
-def load_processed_paths(path: Path) -> Set[str]:
-    if not path.exists(): return set()
+def get_progress_store(root: Path) -> ProgressStore:
     try:
-        with path.open() as f: return set(json.load(f))
-    except: return set()
+        return open_progress_store(root)
+    except ProgressStoreError as e:
+        logging.error(str(e))
+        logging.error("Fix or remove the file, then try again.")
+        exit(1)
 
-def save_processed_paths(path: Path, paths: Set[str]):
-    try:
-        with path.open('w') as f: json.dump(sorted(list(paths)), f, indent=4)
-    except Exception as e: logging.error(f"Failed to save progress: {e}")
-
-def get_candidates(root: Path, target_weeks: Set[str], include_p: bool, include_r: bool, processed: Set[str]) -> List[Path]:
-    candidates = []
-    prefixes = []
-    if include_p: prefixes.append('p')
-    if include_r: prefixes.append('r')
-    if not prefixes: return []
-
-    pattern_str = r'^(' + '|'.join(prefixes) + r')\d.*\.c$'
-    file_pattern = re.compile(pattern_str, re.IGNORECASE)
-
-    all_items = sorted([p for p in root.iterdir() if p.is_dir()])
-    for week_dir in all_items:
-        if not MONTH_DIR_PATTERN.match(week_dir.name): continue
-        if target_weeks and week_dir.name not in target_weeks: continue
-
-        for file_path in week_dir.iterdir():
-            if file_path.name.endswith('.pristine'): continue
-            if file_pattern.match(file_path.name):
-                rel_str = f"{week_dir.name}/{file_path.name}"
-                if rel_str not in processed:
-                    candidates.append(file_path)
-    return candidates
-
-def show_progress(root_dir: Path, only_p: bool, only_r: bool):
+def get_candidates(index: TaskIndex, target_weeks: Set[str], include_p: bool, include_r: bool, processed: Set[str]) -> List[TaskEntry]:
+    if not include_p and not include_r: return []
+    return [t for t in index.tasks(target_weeks, include_p, include_r) if t.task_id not in processed]
+
+def show_progress(root_dir: Path, store: ProgressStore, only_p: bool, only_r: bool):
     """Displays a table of completed assignments."""
     include_p = not only_r
     include_r = not only_p
     
-    progress_path = root_dir / PROGRESS_FILE
-    completed_set = load_processed_paths(progress_path)
+    completed_set = store.completed_task_ids()
 
     all_stats = []
 
-    week_dirs = sorted([p for p in root_dir.iterdir() if p.is_dir() and MONTH_DIR_PATTERN.match(p.name)])
-
-    for week_dir in week_dirs:
-        week = week_dir.name
-        
-        # Get topic
-        topic = "???"
-        intro_file = week_dir / "00_intro.txt"
-        if intro_file.exists():
-            try:
-                with open(intro_file, 'r', encoding='utf-8') as f:
-                    first_line = f.readline()
-                    # Topic is usually '# <Topic Name>'
-                    if first_line.startswith("#"):
-                        topic = first_line[1:].strip()
-            except Exception: 
-                pass
-        
-        # Get all tasks for this week
-        total_tasks = []
-        if include_p:
-            total_tasks.extend(p for p in week_dir.glob("p*.c") if not p.name.endswith('.pristine'))
-        if include_r:
-            total_tasks.extend(p for p in week_dir.glob("r*.c") if not p.name.endswith('.pristine'))
+    for week_entry in load_task_index(root_dir).week_entries():
+        week = week_entry.week
+        total_tasks = [t for t in week_entry.tasks if (t.kind == 'p' and include_p) or (t.kind == 'r' and include_r)]
 
         if not total_tasks:
             continue
 
         # Check which are completed
-        completed_tasks = []
-        for task_path in total_tasks:
-            task_id = f"{week}/{task_path.name}"
-            if task_id in completed_set:
-                completed_tasks.append(task_path.name)
-        
+        completed_tasks = [t.name for t in total_tasks if t.task_id in completed_set]
+
         all_stats.append(WeekStats(
             week=week,
-            topic=topic,
+            topic=week_entry.topic,
             total=len(total_tasks),
             completed=len(completed_tasks),
             completed_names=sorted(completed_tasks)
@@ -209,22 +207,17 @@ def show_progress(root_dir: Path, only_p: bool, only_r: bool):
     print()
 
 
-def archive_existing_exam(exam_dir: Path, archive_root: Path):
-    if not exam_dir.exists(): return
-    archive_root.mkdir(parents=True, exist_ok=True)
-    if not any(exam_dir.iterdir()): return
-
-    existing = [p for p in archive_root.iterdir() if p.is_dir()]
-    index = len(existing) + 1
-    prefix = f"{index:02d}"
+def close_exam_attempts(exam_dir: Path, store: ProgressStore):
+    """Closes the open attempts in the progress store, using saved test results as outcomes."""
+    outcomes = {
+        r['task_id']: OUTCOME_PASSED if r['passed'] else OUTCOME_FAILED
+        for r in load_test_results(exam_dir).values() if r.get('task_id')
+    }
+    closed = store.archive_open(outcomes=outcomes)
+    if closed: logging.info(f"Marked {closed} tasks of the current exam as done ({len(outcomes)} with test results).")
 
-    makefile_path = exam_dir / 'makefile'
-    mtime = makefile_path.stat().st_mtime if makefile_path.exists() else datetime.now().timestamp()
-    dt_object = datetime.fromtimestamp(mtime)
-
-    timestamp = dt_object.strftime("%a %-d.%-m. %-I%p")
-    dest_dir = archive_root / f"exam{prefix} {timestamp}"
-    
+def read_mapping(exam_dir: Path) -> Dict[str, str]:
+    """Anonymized file name -> task id, from 00_mapping.txt."""
     mapping = {}
     mapping_file = exam_dir / '00_mapping.txt'
     if mapping_file.exists():
@@ -232,11 +225,25 @@ def archive_existing_exam(exam_dir: Path, archive_root: Path):
             with open(mapping_file, 'r') as f:
                 for line in f:
                     if '=' in line:
-                        k, v = line.strip().split('=')
+                        k, v = line.strip().split('=', 1)
                         mapping[k.strip()] = v.strip()
         except Exception as e: logging.warning(f"Could not read mapping file: {e}")
+    return mapping
+
+def archive_existing_exam(exam_dir: Path, archive_root: Path, store: ProgressStore) -> bool:
+    """
+    Archives the exam, closes its attempts and empties the exam directory.
+    Returns False, with the exam and its attempts left as they were, if the archive could not be written.
+    """
+    if not exam_dir.exists() or not any(exam_dir.iterdir()):
+        close_exam_attempts(exam_dir, store)
+        return True
+
+    makefile_path = exam_dir / 'makefile'
+    generated_at = makefile_path.stat().st_mtime if makefile_path.exists() else None
+    mapping = read_mapping(exam_dir)
 
-    files_moved = 0
+    files = {}
     for file_path in exam_dir.glob("*.c"):
         if file_path.name in ['pb152io.c', 'pb152.c'] or file_path.name.startswith('.'): continue
             
@@ -248,76 +255,91 @@ def archive_existing_exam(exam_dir: Path, archive_root: Path):
             target_name = file_path.name
 
         try:
-            dest_dir.mkdir(parents=True, exist_ok=True)
-            shutil.move(str(file_path), str(dest_dir / target_name))
-            files_moved += 1
-        except Exception as e: logging.error(f"Failed to archive {file_path.name}: {e}")
-
-    if files_moved > 0:
-        logging.info(f"Archived {files_moved} assignments to {dest_dir.name}")
-
-        duration = datetime.now() - dt_object
-        total_seconds = int(duration.total_seconds())
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        
-        time_str = f"Exam took {hours}h:{minutes:02d}m from generation to archival."
-        
-        try:
-            with open(dest_dir / 'exam.time.length.txt', 'w') as f:
-                f.write(time_str + "\n")
-        except Exception as e:
-            logging.error(f"Failed to write exam duration file: {e}")
+            files[target_name] = file_path.read_bytes()
+        except OSError as e:
+            logging.error(f"Failed to archive {file_path.name}, leaving '{exam_dir.name}' in place: {e}")
+            return False
 
+    if files:
+        try:
+            with span('store archive', files=len(files)):
+                summary = open_archive_store(archive_root).add_exam(files, mapping, generated_at)
+        except (OSError, ArchiveStoreError) as e:
+            logging.error(f"Failed to archive the exam, leaving '{exam_dir.name}' in place: {e}")
+            return False
+        duration = f" after {format_duration(summary.duration)}" if summary.duration is not None else ""
+        logging.info(f"Archived {len(files)} assignments as {summary.name}{duration}")
+
+    close_exam_attempts(exam_dir, store)
     try:
         shutil.rmtree(exam_dir)
         exam_dir.mkdir(parents=True, exist_ok=True)
-    except Exception as e: logging.error(f"Failed to cleanup exam directory: {e}")
+    except Exception as e:
+        logging.error(f"Failed to cleanup exam directory: {e}")
+        return False
+    return True
 
-def trash_exam_files(exam_dir: Path, progress_path: Path):
+def open_archive(root_dir: Path, archive_root: Path) -> ArchiveStore:
     """
-    Removes the current exam directory and ensures its tasks are not saved in the progress file.
+    The archive store for reading. Old archive directories are imported first,
+    under the progress store lock that archiving also holds.
+    """
+    archive = ArchiveStore(archive_root)
+    if not archive.legacy_dirs():
+        return archive
+    with get_progress_store(root_dir).lock():
+        return open_archive_store(archive_root)
+
+def show_archives(root_dir: Path, archive_root: Path):
+    """Lists archived exams and the space saved by deduplication and compression."""
+    archive = open_archive(root_dir, archive_root)
+    exams = archive.exams()
+    if not exams:
+        logging.info("No archived exams yet.")
+        return
+
+    print(f"\n{Colors.BOLD}{'#':>4} | {'Exam':<24} | {'Files':>5} | {'Duration':>8}{Colors.RESET}")
+    print("-" * 50)
+    for exam in exams:
+        duration = format_duration(exam.duration) if exam.duration is not None else '?'
+        print(f"{exam.number:>4} | {exam.name:<24} | {exam.files:>5} | {duration:>8}")
+    print("-" * 50)
+
+    stats = archive.stats()
+    print(
+        f"{stats['exams']} exams, {stats['files']} files, {stats['logical_bytes'] / 1024:.1f} KiB archived; "
+        f"{stats['unique_blobs']} unique blobs take {stats['stored_bytes'] / 1024:.1f} KiB on disk.\n"
+    )
+
+def restore_archived_exam(root_dir: Path, archive_root: Path, number: int, dest: Optional[Path]):
+    try:
+        archive = open_archive(root_dir, archive_root)
+        name = archive.manifest(number)['name']
+        dest_dir = archive.restore(number, dest or root_dir / RESTORE_DIR_NAME / name)
+    except (OSError, ArchiveStoreError) as e:
+        logging.error(f"Could not restore exam {number}: {e}")
+        sys.exit(1)
+    logging.info(f"Restored {name} to {dest_dir}")
+
+def trash_exam_files(exam_dir: Path, store: ProgressStore):
+    """
+    Removes the current exam directory and ensures its tasks are not saved in the progress store.
     """
     if not exam_dir.exists():
         logging.info("No exam directory found to trash.")
         return
 
-    # Load existing progress
-    processed = load_processed_paths(progress_path)
-    
-    files_to_remove_from_progress = set()
-    mapping_file = exam_dir / '00_mapping.txt'
+    files_to_remove_from_progress = set(exam_task_ids(exam_dir).values())
 
-    if mapping_file.exists():
-        try:
-            with open(mapping_file, 'r') as f:
-                for line in f:
-                    if '=' in line:
-                        _, original_path_str = line.strip().split('=', 1)
-                        files_to_remove_from_progress.add(original_path_str.strip())
-        except Exception as e:
-            logging.warning(f"Could not read mapping file in trash: {e}")
-    else:
-        # Assume revealed or --show generated files (e.g., "04.p1.c")
-        for file_path in exam_dir.glob("*.c"):
-            if file_path.name in SUPPORT_FILES or file_path.name.startswith('.'):
-                continue
-            
-            parts = file_path.name.split('.', 1)
-            # Check if it matches the "week.filename" pattern and the week is valid
-            if len(parts) == 2 and MONTH_DIR_PATTERN.match(parts[0]):
-                files_to_remove_from_progress.add(f"{parts[0]}/{parts[1]}")
-            
     if not files_to_remove_from_progress:
         logging.info("No tracked exam files identified to remove from progress.")
     
-    # Remove files from processed set
-    original_processed_count = len(processed)
+    # Mark the exam's attempts as trashed
     if files_to_remove_from_progress:
-        processed.difference_update(files_to_remove_from_progress)
-        if len(processed) < original_processed_count:
-            save_processed_paths(progress_path, processed)
-            logging.info(f"Removed {original_processed_count - len(processed)} tasks from progress.")
+        with store.lock():
+            removed = store.trash_tasks(sorted(files_to_remove_from_progress))
+        if removed:
+            logging.info(f"Removed {removed} tasks from progress.")
     else:
         logging.info("No changes to progress file needed based on current exam.")
 
@@ -328,16 +350,10 @@ def trash_exam_files(exam_dir: Path, progress_path: Path):
     except OSError as e:
         logging.error(f"Error removing exam directory {exam_dir.name}: {e}")
 
-def generate_intro_joke(root_dir: Path, dest_dir: Path):
-    ref_file = root_dir / TEXT_SOURCE_FILE
-    words = []
-    if ref_file.exists():
-        try:
-            with open(ref_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                words = [w for w in re.findall(r'\w+', content) if len(w) > 2]
-        except Exception: pass
-    
+def generate_intro_joke(index: TaskIndex, dest_dir: Path):
+    words = index.intro_words()
+    index.save()
+
     if not words:
         words = ["void", "int", "char", "struct", "pointer", "segmentation", "fault", 
                  "core", "dump", "buffer", "overflow", "stack", "heap", "malloc", "free"]
@@ -359,21 +375,41 @@ def generate_intro_joke(root_dir: Path, dest_dir: Path):
         logging.info("Generated a very serious 00_intro.txt")
     except Exception as e: logging.warning(f"Failed to generate intro joke: {e}")
 
-def copy_support_files(root: Path, dest_dir: Path) -> Path:
-    weeks = sorted([d for d in root.iterdir() if d.is_dir() and MONTH_DIR_PATTERN.match(d.name)], 
-                   key=lambda x: x.name, reverse=True)
-    best_week = next((w for w in weeks if (w / 'makefile').exists()), None)
-    
-    if not best_week: raise FileNotFoundError("No makefile found in any week directory.")
+def clone_file(src: Path, dst: Path) -> bool:
+    """Reflinks `src` to `dst` on filesystems that support it (btrfs, XFS, ...)."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def copy_task_file(src: Path, dst: Path):
+    """Copies a task or support file into the exam: a copy-on-write clone if possible, else a full copy."""
+    if not clone_file(src, dst):
+        shutil.copy2(src, dst)
+
+def copy_support_files(index: TaskIndex, dest_dir: Path) -> Path:
+    root = index.root
+    makefile_week = index.newest_makefile_week()
+    if not makefile_week: raise FileNotFoundError("No makefile found in any week directory.")
+    best_week = root / makefile_week
+    present = index.weeks[makefile_week].support_files
 
     for filename in SUPPORT_FILES:
         src = best_week / filename
-        if not src.exists(): src = root / filename # Fallback to root
-        if src.exists(): shutil.copy2(src, dest_dir / filename)
+        if filename not in present: src = root / filename # Fallback to root
+        if src.exists(): copy_task_file(src, dest_dir / filename)  # not a hardlink: an edit must not reach the week dir
 
     return best_week / 'makefile'
 
-def create_dynamic_makefile(template_path: Path, dest_dir: Path, active_filenames: List[str]):
+def create_dynamic_makefile(template_path: Path, dest_dir: Path, active_filenames: List[str], fast: Optional[bool] = None):
     active_filenames.sort()
     with open(template_path, 'r') as f: content = f.read()
 
@@ -386,8 +422,112 @@ def create_dynamic_makefile(template_path: Path, dest_dir: Path, active_filename
     else:
         content = f"SRC_P = {files_str}\n" + content
 
+    content = add_compile_cache(content)
+    content = add_profiles(content, fast)
+
     with open(dest_dir / 'makefile', 'w') as f: f.write(content)
 
+def add_compile_cache(content: str) -> str:
+    """
+    Routes CC/CXX through compile_cache.py so unchanged sources are restored
+    from ~/pb152/.cache instead of recompiled. Set PB152_NO_CCACHE=1 to bypass.
+    """
+    content = re.sub(
+        fr'\n?{re.escape(COMPILE_CACHE_BEGIN)}.*?{re.escape(COMPILE_CACHE_END)}\n?', '\n',
+        content, flags=re.DOTALL
+    ).rstrip('\n') + '\n'
+    wrapper = f"{sys.executable} {COMPILE_CACHE_SCRIPT}"
+    return content + (
+        f"\n{COMPILE_CACHE_BEGIN}\n"
+        f"ifndef PB152_NO_CCACHE\n"
+        f"override CC := {wrapper} $(CC)\n"
+        f"override CXX := {wrapper} $(CXX)\n"
+        f"endif\n"
+        f"{COMPILE_CACHE_END}\n"
+    )
+
+def add_profiles(content: str, fast: Optional[bool]) -> str:
+    """
+    Adds the fast and full profiles: in the fast profile a valgrind stand-in
+    comes first in PATH, so the tests run directly. `fast` picks the default
+    profile; None keeps the one already in `content` (for hide/reveal).
+    """
+    if fast is None:
+        match = PROFILE_DEFAULT.search(content)
+        fast = bool(match) and match.group(1) == PROFILE_FAST
+    content = re.sub(
+        fr'\n?{re.escape(PROFILES_BEGIN)}.*?{re.escape(PROFILES_END)}\n?', '\n',
+        content, flags=re.DOTALL
+    ).rstrip('\n') + '\n'
+    tasks = '$(SRC_P:.c=)'
+    return content + (
+        f"\n{PROFILES_BEGIN}\n"
+        f"# make fast / make check: every task without valgrind / with the full pipeline\n"
+        f"# make fast-<task> / make check-<task>: a single task\n"
+        f"{PROFILE_ENV} ?= {PROFILE_FAST if fast else PROFILE_FULL}\n"
+        f"# The PATH from before any profile, so `make check` can drop the stand-in again\n"
+        f"ifndef PB152_BASE_PATH\n"
+        f"export PB152_BASE_PATH := $(PATH)\n"
+        f"endif\n"
+        f"ifeq ($({PROFILE_ENV}),{PROFILE_FAST})\n"
+        f"export PATH := {FAST_BIN_DIR}:$(PB152_BASE_PATH)\n"
+        f"else\n"
+        f"export PATH := $(PB152_BASE_PATH)\n"
+        f"endif\n"
+        f".PHONY: fast check\n"
+        f"fast: $(addprefix fast-,{tasks})\n"
+        f"check: $(addprefix check-,{tasks})\n"
+        f"fast-%:\n"
+        f"\t@$(MAKE) --no-print-directory -B {PROFILE_ENV}={PROFILE_FAST} $*\n"
+        f"\t@mkdir -p {TEST_LOG_DIR} && touch {TEST_LOG_DIR}/{FAST_PASS_MARKER.format('$*')}\n"
+        f"check-%:\n"
+        f"\t@$(MAKE) --no-print-directory -B {PROFILE_ENV}={PROFILE_FULL} $*\n"
+        f"\t@mkdir -p {TEST_LOG_DIR} && touch {TEST_LOG_DIR}/{FULL_PASS_MARKER.format('$*')}\n"
+        f"{PROFILES_END}\n"
+    )
+
+def exam_profile(exam_dir: Path) -> str:
+    """The profile `make <task>` uses in the exam: $PB152_PROFILE, else the makefile's default."""
+    if os.environ.get(PROFILE_ENV) in (PROFILE_FAST, PROFILE_FULL):
+        return os.environ[PROFILE_ENV]
+    try:
+        match = PROFILE_DEFAULT.search((exam_dir / 'makefile').read_text())
+    except OSError:
+        match = None
+    return match.group(1) if match and match.group(1) == PROFILE_FAST else PROFILE_FULL
+
+def tasks_without_full_pass(exam_dir: Path) -> List[str]:
+    """
+    Tasks whose current source has not passed the full profile, from the
+    `exam test`/`exam watch` results and the `make check` markers. Empty if
+    the fast profile was never used, since plain `make` runs are not recorded.
+    """
+    tasks = read_exam_tasks(exam_dir) if exam_dir.exists() else []
+    results = load_test_results(exam_dir)
+    log_dir = exam_dir / TEST_LOG_DIR
+
+    def mtime(path: Path) -> Optional[float]:
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            return None
+
+    used_fast = exam_profile(exam_dir) == PROFILE_FAST or \
+        any(r.get('profile') == PROFILE_FAST for r in results.values()) or \
+        any(log_dir.glob(FAST_PASS_MARKER.format('*')))
+    if not used_fast:
+        return []
+
+    missing = []
+    for filename in tasks:
+        modified = mtime(exam_dir / filename) or 0
+        result = results.get(filename, {})
+        tested = result.get('passed') and result.get('profile', PROFILE_FULL) == PROFILE_FULL and result.get('at', 0) >= modified
+        checked = (mtime(log_dir / FULL_PASS_MARKER.format(Path(filename).stem)) or 0) >= modified
+        if not (tested or checked):
+            missing.append(filename)
+    return missing
+
 def hide_exam_files(exam_dir: Path):
     """Anonymizes revealed files in the exam directory."""
     mapping_file = exam_dir / '00_mapping.txt'
@@ -451,16 +591,10 @@ def reveal_exam_files(exam_dir: Path):
         return
 
     logging.info("Mapping file found. Revealing original filenames...")
-    mapping = {}
+    mapping = read_mapping(exam_dir)
     new_filenames = []
-    try:
-        with open(mapping_file, 'r') as f:
-            for line in f:
-                if '=' in line:
-                    k, v = line.strip().split('=')
-                    mapping[k.strip()] = v.strip()
-    except Exception as e:
-        logging.error(f"Failed to read mapping file: {e}")
+    if not mapping:
+        logging.error("The mapping file has no entries, keeping it and the anonymized names.")
         return
 
     for task_name, original_path_str in mapping.items():
@@ -486,21 +620,361 @@ def reveal_exam_files(exam_dir: Path):
         logging.info("Mapping file removed.")
     except Exception as e: logging.error(f"Failed to remove mapping file: {e}")
 
-def run_pb152_update():
+def exam_task_ids(exam_dir: Path) -> Dict[str, str]:
+    """Maps the C files of the exam to their task ids, from 00_mapping.txt or revealed names."""
+    if (exam_dir / '00_mapping.txt').exists():
+        return read_mapping(exam_dir)
+
+    # Revealed or --show generated files, e.g. "04.p1.c"
+    task_ids = {}
+    for file_path in exam_dir.glob("*.c"):
+        parts = file_path.name.split('.', 1)
+        if len(parts) == 2 and MONTH_DIR_PATTERN.match(parts[0]):
+            task_ids[file_path.name] = f"{parts[0]}/{parts[1]}"
+    return task_ids
+
+def read_exam_tasks(exam_dir: Path) -> List[str]:
+    """The task files of the exam, from SRC_P in the generated makefile or from 00_mapping.txt."""
+    makefile_path = exam_dir / 'makefile'
+    if makefile_path.exists():
+        with open(makefile_path, 'r') as f:
+            match = re.search(r'^SRC_P\s*=(.*)$', f.read(), re.MULTILINE)
+        if match and match.group(1).split():
+            return match.group(1).split()
+    return sorted(exam_task_ids(exam_dir))
+
+def load_test_results(exam_dir: Path) -> Dict[str, dict]:
+    path = exam_dir / TEST_RESULTS_FILE
+    if not path.exists(): return {}
+    try:
+        with path.open() as f: return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable test results: {e}")
+        return {}
+
+def save_test_results(exam_dir: Path, results: List[TaskTestResult]):
+    data = load_test_results(exam_dir)
+    now = time.time()
+    for r in results:
+        data[r.filename] = {'task_id': r.task_id, 'passed': r.passed, 'seconds': round(r.seconds, 3), 'at': now,
+                            'profile': r.profile}
+    try:
+        with (exam_dir / TEST_RESULTS_FILE).open('w') as f: json.dump(data, f, indent=4)
+    except OSError as e:
+        logging.error(f"Failed to save test results: {e}")
+
+def run_task_test(exam_dir: Path, filename: str, task_id: Optional[str], timeout: int, profile: str) -> TaskTestResult:
+    """Builds and runs the tests of a single task with `make <task>` in `profile`, logging to its own file."""
+    target = Path(filename).stem
+    start = time.monotonic()
+    try:
+        proc = subprocess.run(["make", target], cwd=exam_dir, capture_output=True, text=True, timeout=timeout,
+                              env={**os.environ, PROFILE_ENV: profile})
+        stdout, stderr, returncode = proc.stdout, proc.stderr, proc.returncode
+    except subprocess.TimeoutExpired as e:
+        stdout = e.stdout.decode(errors='replace') if isinstance(e.stdout, bytes) else (e.stdout or '')
+        stderr = f"make {target} timed out after {timeout} seconds\n"
+        returncode = -1
+    except FileNotFoundError:
+        stdout, stderr, returncode = '', MAKE_NOT_FOUND + '\n', -1
+    return task_test_result(exam_dir, filename, task_id, stdout, stderr, returncode, time.monotonic() - start, profile)
+
+def task_test_result(exam_dir: Path, filename: str, task_id: Optional[str], stdout: str, stderr: str,
+                     returncode: int, seconds: float, profile: str) -> TaskTestResult:
+    """Writes the output of `make <task>` to its log file and summarizes it."""
+    log_path = exam_dir / TEST_LOG_DIR / f"{Path(filename).stem}.log"
+    log_path.write_text(stdout + stderr)
+    report = parse_build_log(stdout, stderr, returncode)
+    failures = [d for d in report.diagnostics if d.kind != 'compile_warning']
+    detail = failures[0].format() if failures and not report.passed else ''
+    return TaskTestResult(filename, task_id, report.passed, seconds, detail, log_path, profile)
+
+def run_exam_tests(exam_dir: Path, jobs: int, timeout: int, record: bool, profile: Optional[str] = None) -> List[TaskTestResult]:
+    """
+    Builds and tests every task of the exam in parallel and prints a result matrix.
+    The first task runs alone so the shared framework objects are built only once.
+    """
+    if not exam_dir.exists():
+        logging.info("No exam directory found to test.")
+        return []
+    tasks = read_exam_tasks(exam_dir)
+    if not tasks:
+        logging.info("No tasks found in the exam makefile or mapping file.")
+        return []
+    if shutil.which('make') is None:
+        logging.error(MAKE_NOT_FOUND)
+        return []
+
+    (exam_dir / TEST_LOG_DIR).mkdir(exist_ok=True)
+    task_ids = exam_task_ids(exam_dir)
+    profile = profile or exam_profile(exam_dir)
+    logging.info(f"Testing {len(tasks)} tasks with {jobs} parallel jobs ({profile} profile)...")
+
+    def run(filename: str) -> TaskTestResult:
+        return run_task_test(exam_dir, filename, task_ids.get(filename), timeout, profile)
+
+    results = [run(tasks[0])]
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results.extend(pool.map(run, tasks[1:]))
+
+    name_width = max(len('Task'), *(len(r.filename) for r in results))
+    print(f"\n{Colors.BOLD}{'Task':<{name_width}} | {'Result':<6} | {'Time':>7} | Details{Colors.RESET}")
+    print("-" * (name_width + 40))
+    for r in results:
+        status = f"{Colors.GREEN}PASS{Colors.RESET}  " if r.passed else f"{Colors.RED}FAIL{Colors.RESET}  "
+        detail = r.detail if len(r.detail) <= 60 else r.detail[:57] + "..."
+        print(f"{r.filename:<{name_width}} | {status} | {r.seconds:6.1f}s | {detail}")
+    print("-" * (name_width + 40))
+    passed = sum(r.passed for r in results)
+    print(f"{passed}/{len(results)} passed. Logs are in {exam_dir / TEST_LOG_DIR}\n")
+    if profile == PROFILE_FAST:
+        logging.info("Fast profile: valgrind was skipped. Run 'exam test --full' or 'make check' before finishing.")
+
+    if record:
+        save_test_results(exam_dir, results)
+    return results
+
+def run_search(root_dir: Path, archive_root: Path, terms: List[str], limit: int):
+    """Prints the week files and archived solutions that best match `terms`."""
+    start = time.perf_counter()
+    archive = open_archive(root_dir, archive_root)
+    index = open_search_index(root_dir)
+    try:
+        with span('update index'):
+            updated_files = index.update_weeks(load_task_index(root_dir))
+            updated_exams = index.update_archive(archive)
+        with span('query'):
+            hits = index.search(terms, limit)
+    finally:
+        index.close()
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if updated_files or updated_exams:
+        logging.info(f"Search index updated: {updated_files} week files, {updated_exams} archived exams.")
+    if not hits:
+        logging.info(f"No matches for '{' '.join(terms)}'.")
+        return
+
+    print()
+    for rank, hit in enumerate(hits, 1):
+        name = f"{hit.week}/{hit.task}" if hit.week else hit.task
+        where = ', '.join(hit.exams) if hit.exams else f"week {hit.week}"
+        print(f"{Colors.BOLD}{rank:>2}. {name}{Colors.RESET}  [{where}]  score {hit.score:.2f}")
+        text = read_hit_text(hit, root_dir, archive)
+        for line in hit.lines:
+            content = text[line - 1].strip() if line <= len(text) else ''
+            print(f"      {Colors.BLUE}{line:>4}{Colors.RESET}: {content[:100]}")
+    print(f"\n{len(hits)} hits in {elapsed:.0f} ms.\n")
+
+class WatchedRun(NamedTuple):
+    filename: str
+    proc: subprocess.Popen
+    started: float
+    stdout: IO[bytes]
+    stderr: IO[bytes]
+
+def start_task_run(exam_dir: Path, filename: str) -> WatchedRun:
+    """Starts `make <task>` in its own process group, with output going to temporary files."""
+    stdout, stderr = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+    try:
+        proc = subprocess.Popen(["make", Path(filename).stem], cwd=exam_dir, stdout=stdout, stderr=stderr,
+                                start_new_session=True)
+    except FileNotFoundError:
+        stdout.close()
+        stderr.close()
+        raise
+    return WatchedRun(filename, proc, time.monotonic(), stdout, stderr)
+
+def stop_task_run(run: WatchedRun):
+    """Kills a run and everything it started (compiler, tests, valgrind)."""
+    try:
+        os.killpg(run.proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    try:
+        run.proc.wait(timeout=2)
+    except subprocess.TimeoutExpired:
+        os.killpg(run.proc.pid, signal.SIGKILL)
+        run.proc.wait()
+
+def finish_task_run(exam_dir: Path, run: WatchedRun, task_id: Optional[str], returncode: Optional[int], profile: str) -> TaskTestResult:
+    """Reads the output of a finished (or, with `returncode` None, timed out) run and logs it."""
+    seconds = time.monotonic() - run.started
+    run.stdout.seek(0)
+    run.stderr.seek(0)
+    stdout = run.stdout.read().decode(errors='replace')
+    stderr = run.stderr.read().decode(errors='replace')
+    run.stdout.close()
+    run.stderr.close()
+    if returncode is None:
+        stderr = f"make {Path(run.filename).stem} timed out after {seconds:.0f} seconds\n"
+        returncode = -1
+    return task_test_result(exam_dir, run.filename, task_id, stdout, stderr, returncode, seconds, profile)
+
+def format_watch_status(tasks: List[str], status: Dict[str, bool], current: Optional[WatchedRun], queued: Dict[str, float]) -> str:
+    parts = []
+    for filename in tasks:
+        name = Path(filename).stem
+        if current and current.filename == filename:
+            parts.append(f"{Colors.BLUE}{name} running {time.monotonic() - current.started:.0f}s{Colors.RESET}")
+        elif filename in queued:
+            parts.append(f"{name} queued")
+        elif filename not in status:
+            parts.append(f"{name} -")
+        elif status[filename]:
+            parts.append(f"{Colors.GREEN}{name} PASS{Colors.RESET}")
+        else:
+            parts.append(f"{Colors.RED}{name} FAIL{Colors.RESET}")
+    return " | ".join(parts)
+
+def watch_exam(exam_dir: Path, timeout: int, debounce: float, force_polling: bool, record: bool):
+    """
+    Rebuilds and tests a task whenever its file is saved. Saves are debounced,
+    a run for a file that is saved again is cancelled and restarted, and other
+    saved files wait in a queue. A status line shows the state of every task.
+    """
+    tasks = read_exam_tasks(exam_dir) if exam_dir.exists() else []
+    if not tasks:
+        logging.info("No tasks found in the current exam.")
+        return
+    if shutil.which('make') is None:
+        logging.error(MAKE_NOT_FOUND)
+        return
+    (exam_dir / TEST_LOG_DIR).mkdir(exist_ok=True)
+    task_ids = exam_task_ids(exam_dir)
+    profile = exam_profile(exam_dir)
+    status = {name: bool(r.get('passed')) for name, r in load_test_results(exam_dir).items()}
+
+    watcher = make_watcher(exam_dir, tasks, force_polling)
+    mode = 'polling' if isinstance(watcher, PollingWatcher) else 'inotify'
+    logging.info(f"Watching {len(tasks)} tasks in {exam_dir} ({mode}, {profile} profile). Save a file to test it, Ctrl-C to stop.")
+
+    tty = sys.stdout.isatty()
+    queued: Dict[str, float] = {}   # filename -> time of its last save
+    current: Optional[WatchedRun] = None
+    last_line = None
+
+    def show(message: Optional[str] = None):
+        nonlocal last_line
+        line = format_watch_status(tasks, status, current, queued)
+        if message:
+            print(("\r\033[K" if tty else "") + message)
+            last_line = None
+        if tty:
+            print(f"\r\033[K{line}", end='', flush=True)
+        elif line != last_line:
+            print(line, flush=True)
+        last_line = line
+
+    try:
+        show()
+        while True:
+            for name in watcher.wait(0.1 if current or queued else 0.5):
+                if name not in tasks:
+                    continue
+                queued[name] = time.monotonic()
+                if current and current.filename == name:
+                    # A newer save makes the running build stale
+                    stop_task_run(current)
+                    current.stdout.close()
+                    current.stderr.close()
+                    current = None
+
+            now = time.monotonic()
+            if current:
+                returncode = current.proc.poll()
+                timed_out = returncode is None and now - current.started > timeout
+                if timed_out:
+                    stop_task_run(current)
+                if returncode is not None or timed_out:
+                    result = finish_task_run(exam_dir, current, task_ids.get(current.filename), returncode, profile)
+                    status[current.filename] = result.passed
+                    current = None
+                    if record:
+                        save_test_results(exam_dir, [result])
+                    verdict = f"{Colors.GREEN}PASS{Colors.RESET}" if result.passed else f"{Colors.RED}FAIL{Colors.RESET}"
+                    detail = f"  {result.detail}" if result.detail else ''
+                    show(f"{datetime.now():%H:%M:%S} {result.filename} {verdict} {result.seconds:.1f}s{detail}")
+                    continue
+
+            if not current:
+                due = [name for name, saved in queued.items() if now - saved >= debounce]
+                if due:
+                    filename = min(due, key=queued.get)
+                    del queued[filename]
+                    try:
+                        current = start_task_run(exam_dir, filename)
+                    except FileNotFoundError:
+                        if tty:
+                            print()
+                        logging.error(MAKE_NOT_FOUND)
+                        return
+            show()
+    except KeyboardInterrupt:
+        if current:
+            stop_task_run(current)
+        if tty:
+            print()
+    finally:
+        watcher.close()
+
+def run_pb152_update(root_dir: Path) -> bool:
     """
     Runs the 'pb152 update' command interactively, allowing the user to enter
-    credentials if needed.
+    credentials if needed. Records the time of a successful update.
     """
     logging.info("Running pb152 update. You may be asked to log in.")
     try:
         # Note: We do NOT capture output. This lets the command run in the foreground
         # and use the terminal for interactive input (like a password).
         # The command also needs to be run from the ~/pb152 directory.
-        pb152_dir = Path.home() / 'pb152'
-        subprocess.run("pb152 update", shell=True, check=True, cwd=pb152_dir)
-        logging.info("pb152 update finished.")
+        subprocess.run(["pb152", "update"], check=True, cwd=root_dir)
     except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        logging.warning(f"'pb152 update' failed: {e}. Continuing without update.")
+        logging.warning(f"'pb152 update' failed: {e}. Continuing with the cached task list.")
+        return False
+    logging.info("pb152 update finished.")
+    try:
+        (root_dir / PB152_UPDATE_STAMP).touch()
+    except OSError as e:
+        logging.warning(f"Could not record the update time: {e}")
+    return True
+
+def pb152_update_ttl() -> float:
+    value = os.environ.get(PB152_UPDATE_TTL_ENV)
+    if not value:
+        return DEFAULT_PB152_UPDATE_TTL
+    try:
+        return float(value)
+    except ValueError:
+        logging.warning(f"Ignoring invalid {PB152_UPDATE_TTL_ENV}={value!r}.")
+        return DEFAULT_PB152_UPDATE_TTL
+
+def update_if_stale(root_dir: Path, args: argparse.Namespace):
+    """Runs 'pb152 update' unless disabled or the last successful update is recent enough."""
+    if args.no_update:
+        logging.info("Skipping pb152 update (--no-update).")
+        return
+    if os.environ.get(OFFLINE_ENV):
+        logging.info(f"Skipping pb152 update ({OFFLINE_ENV} is set).")
+        return
+    try:
+        age = time.time() - (root_dir / PB152_UPDATE_STAMP).stat().st_mtime
+    except OSError:
+        age = None
+    ttl = pb152_update_ttl()
+    if age is not None and 0 <= age < ttl:
+        logging.info(f"Course files were updated {int(age // 60)} min ago, skipping pb152 update "
+                     f"(window {ttl / 3600:g} h, see {PB152_UPDATE_TTL_ENV}).")
+        return
+    run_pb152_update(root_dir)
+
+def prefetch(root_dir: Path):
+    """Updates the course files and the task index ahead of the next exam."""
+    with span('pb152 update'):
+        run_pb152_update(root_dir)
+    with span('task index'):
+        index = load_task_index(root_dir)
+    logging.info(f"Task index ready: {len(index.tasks())} tasks.")
 
 
 def run_roulette(root_dir: Path, args: argparse.Namespace):
@@ -509,19 +983,30 @@ def run_roulette(root_dir: Path, args: argparse.Namespace):
     """
     logging.info("Running roulette...")
 
-    progress_path = root_dir / PROGRESS_FILE
-    processed = set()
-    if not args.ignore_progress:
-        processed = load_processed_paths(progress_path)
-        logging.info(f"Loaded {len(processed)} completed tasks from progress file.")
-    else:
-        logging.info("Ignoring progress file as requested.")
-
     target_weeks = parse_week_range(args.weeks)
     include_p = not args.only_r
     include_r = not args.only_p
 
-    candidates = get_candidates(root_dir, target_weeks, include_p, include_r, processed)
+    if args.schedule:
+        store = get_progress_store(root_dir)
+        tasks = load_task_index(root_dir).tasks(target_weeks, include_p, include_r)
+        selected = schedule_tasks(tasks, store.history(), args.num)
+        if not selected:
+            logging.info("No eligible files found based on your criteria.")
+            return
+        logging.info(f"Scheduled {len(selected)} tasks:")
+        for task in selected:
+            print(f"  -> {task.task_id}")
+        return
+
+    processed = set()
+    if not args.ignore_progress:
+        processed = get_progress_store(root_dir).completed_task_ids()
+        logging.info(f"Loaded {len(processed)} completed tasks from progress store.")
+    else:
+        logging.info("Ignoring progress store as requested.")
+
+    candidates = get_candidates(load_task_index(root_dir), target_weeks, include_p, include_r, processed)
     
     if not candidates:
         logging.info("No eligible files found based on your criteria.")
@@ -531,33 +1016,195 @@ def run_roulette(root_dir: Path, args: argparse.Namespace):
     selected = random.sample(candidates, count)
 
     logging.info(f"Selected {len(selected)} tasks:")
-    for task_path in selected:
-        print(f"  -> {task_path.parent.name}/{task_path.name}")
+    for task in selected:
+        print(f"  -> {task.task_id}")
+
+
+def materialize_exam(index: TaskIndex, selected: List[TaskEntry], dest_dir: Path, show: bool, fast: bool = False) -> List[str]:
+    """
+    Writes the exam files for `selected` into `dest_dir`: support files, intro,
+    task copies (in a small thread pool), mapping and makefile.
+    Returns the ids of the tasks that were copied.
+    """
+    with span('support files'):
+        makefile_template = copy_support_files(index, dest_dir)
+    with span('intro'):
+        generate_intro_joke(index, dest_dir)
+
+    if show:
+        dest_names = [f"{task.week}.{task.name}" for task in selected]
+    else:
+        dest_names = [f"task_{idx + 1}.c" for idx in range(len(selected))]
+
+    def copy(item):
+        task, dest_name = item
+        try:
+            with span('copy task', task=task.task_id):
+                copy_task_file(task.source_path(index.root), dest_dir / dest_name)
+            return None
+        except Exception as e:
+            return e
+
+    with span('copy tasks', count=len(selected)), ThreadPoolExecutor(max_workers=COPY_WORKERS) as pool:
+        errors = list(pool.map(tracing.propagate(copy), zip(selected, dest_names)))
+
+    copied_ids = []
+    final_filenames = []
+    mapping_lines = []
+    for task, dest_name, error in zip(selected, dest_names, errors):
+        if error:
+            logging.error(f"Error copying {task.task_id}: {error}")
+            continue
+        final_filenames.append(dest_name)
+        copied_ids.append(task.task_id)
+        if not show:
+            mapping_lines.append(f"{dest_name} = {task.task_id}")
+        log_type = "pristine" if task.pristine else "standard"
+        logging.info(f"Copied {log_type}: {task.task_id} -> {dest_name}")
+
+    if mapping_lines:
+        with open(dest_dir / '00_mapping.txt', 'w') as f:
+            f.write("\n".join(mapping_lines) + "\n")
+
+    with span('makefile'):
+        create_dynamic_makefile(makefile_template, dest_dir, final_filenames, fast)
+    return copied_ids
+
+
+def generate_exam(root_dir: Path, store: ProgressStore, args: argparse.Namespace):
+    """
+    Selects unprocessed tasks and materializes a new exam, archiving the previous one.
+    Callers must hold the progress store lock.
+    """
+    dest_dir = root_dir / DEST_DIR_NAME
+    archive_dir = root_dir / ARCHIVE_DIR_NAME
+
+    # Note: argparse naming conflict. We need to distinguish flags for exam-gen from progress.
+    # The main parser flags are used here.
+    include_p_exam = not args.only_r
+    include_r_exam = not args.only_p
+    
+    logging.info(f"Root: {root_dir}")
+    
+    target_weeks = parse_week_range(args.weeks)
+    with span('task index'):
+        index = load_task_index(root_dir)
+
+    if args.schedule:
+        # Close the exam in progress first, so its tasks are scheduled with their new outcomes
+        with span('close attempts'):
+            close_exam_attempts(dest_dir, store)
+        with span('schedule tasks'):
+            tasks = index.tasks(target_weeks, include_p_exam, include_r_exam)
+            selected = schedule_tasks(tasks, store.history(), args.num)
+        if not selected:
+            logging.info("No eligible files found based on your criteria.")
+            return
+    else:
+        with span('select candidates'):
+            processed = store.completed_task_ids()
+            candidates = get_candidates(index, target_weeks, include_p_exam, include_r_exam, processed)
+            count = min(args.num, len(candidates))
+
+        if count == 0:
+            logging.info("No new eligible files found. You are done!")
+            return
+
+        selected = random.sample(candidates, count)
+
+    logging.info(f"Selected {len(selected)} tasks.")
+
+    # The exam is built in a staging directory next to it and only swapped in once complete,
+    # so a failure never leaves a half-built exam behind.
+    for stale in root_dir.glob(f"{STAGING_PREFIX}*"):
+        shutil.rmtree(stale, ignore_errors=True)
+    staging_dir = root_dir / f"{STAGING_PREFIX}{os.getpid()}"
+    staging_dir.mkdir()
+
+    try:
+        with span('materialize'):
+            new_task_ids = materialize_exam(index, selected, staging_dir, args.show, args.fast)
+    except Exception as e:
+        logging.error(f"Error building the exam: {e}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return
+
+    with span('archive previous exam'):
+        archived = archive_existing_exam(dest_dir, archive_dir, store)
+    if not archived:
+        logging.error("The previous exam could not be archived, so no new exam was generated.")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return
+    try:
+        with span('swap in'):
+            os.replace(staging_dir, dest_dir)
+    except OSError as e:
+        logging.error(f"Could not move the new exam into place: {e}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return
+
+    with span('record progress'):
+        store.record_generated(new_task_ids, exam_id=datetime.now().strftime("%Y%m%d-%H%M%S"))
+    logging.info(f"Exam generated in '{dest_dir.name}'.")
 
 
 def main():
     parser = argparse.ArgumentParser(description="Generate a mock PB152 exam.")
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
+
+    # --profile/--trace are accepted before or after the subcommand; SUPPRESS keeps a subcommand
+    # from resetting what was given before it
+    timing = argparse.ArgumentParser(add_help=False)
+    timing.add_argument('--profile', action='store_true', default=argparse.SUPPRESS, help="Print a timing breakdown of the command's phases")
+    timing.add_argument('--trace', type=Path, metavar='FILE', default=argparse.SUPPRESS, help="Also write a Chrome trace (chrome://tracing, Perfetto) to FILE; implies --profile")
     
     # Existing subparsers
-    subparsers.add_parser('reveal', help='Reveal anonymized file names in the current exam')
-    subparsers.add_parser('archive', help='Archive last exam')
-    subparsers.add_parser('hide', help='Anonymize file names in the current exam')
-    subparsers.add_parser('trash', help='Remove current exam without archiving and untrack its tasks')
-    subparsers.add_parser('done', help='Alias for archive') # Explicitly add 'done' as a subparser
+    subparsers.add_parser('reveal', parents=[timing], help='Reveal anonymized file names in the current exam')
+    subparsers.add_parser('archive', parents=[timing], help='Archive last exam')
+    subparsers.add_parser('hide', parents=[timing], help='Anonymize file names in the current exam')
+    subparsers.add_parser('trash', parents=[timing], help='Remove current exam without archiving and untrack its tasks')
+    subparsers.add_parser('done', parents=[timing], help='Alias for archive') # Explicitly add 'done' as a subparser
+    subparsers.add_parser('prefetch', parents=[timing], help='Run pb152 update and refresh the task index ahead of time')
+
+    # 'archives' subparser
+    archives_parser = subparsers.add_parser('archives', parents=[timing], help='List, or restore, archived exams')
+    archives_parser.add_argument('restore', nargs='?', type=int, metavar='NUMBER', help="Restore the archived exam with this number")
+    archives_parser.add_argument('--to', type=Path, help=f"Directory to restore into (default: ~/pb152/{RESTORE_DIR_NAME}/<exam name>)")
+
+    # 'search' subparser
+    search_parser = subparsers.add_parser('search', parents=[timing], help='Search week tasks and archived solutions')
+    search_parser.add_argument('terms', nargs='+', help="Identifiers or words to look for, e.g. 'recv poll'")
+    search_parser.add_argument('-n', '--num', type=int, default=10, help="Number of hits to show")
+
+    # 'test' subparser
+    test_parser = subparsers.add_parser('test', parents=[timing], help='Build and test all tasks of the current exam in parallel')
+    test_parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 2, help="Number of tasks tested in parallel")
+    test_parser.add_argument('--timeout', type=int, default=DEFAULT_TEST_TIMEOUT, help="Timeout per task in seconds")
+    test_parser.add_argument('--no-record', action='store_true', help="Don't keep the results for the progress store on archival")
+    test_profile = test_parser.add_mutually_exclusive_group()
+    test_profile.add_argument('--fast', dest='test_profile', action='store_const', const=PROFILE_FAST, help="Run the tests without valgrind")
+    test_profile.add_argument('--full', dest='test_profile', action='store_const', const=PROFILE_FULL, help="Run the full pipeline, valgrind included")
+
+    # 'watch' subparser
+    watch_parser = subparsers.add_parser('watch', parents=[timing], help='Rebuild and test each task of the current exam when it is saved')
+    watch_parser.add_argument('--timeout', type=int, default=DEFAULT_TEST_TIMEOUT, help="Timeout per run in seconds")
+    watch_parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE, help="Seconds to wait after a save before building")
+    watch_parser.add_argument('--poll', action='store_true', help="Poll for changes instead of using inotify")
+    watch_parser.add_argument('--no-record', action='store_true', help="Don't keep the results for the progress store on archival")
 
     # New 'progress' subparser
-    progress_parser = subparsers.add_parser('progress', help='Show assignment completion progress')
+    progress_parser = subparsers.add_parser('progress', parents=[timing], help='Show assignment completion progress')
     progress_parser.add_argument('-p', '--only-p', action='store_true', help="Show only P assignments")
     progress_parser.add_argument('-r', '--only-r', action='store_true', help="Show only R assignments")
     
     # 'roulette' subparser
-    roulette_parser = subparsers.add_parser('roulette', help='Randomly select tasks without creating an exam.')
+    roulette_parser = subparsers.add_parser('roulette', parents=[timing], help='Randomly select tasks without creating an exam.')
     roulette_parser.add_argument('-n', '--num', type=int, default=5, help="Number of files to select")
     roulette_parser.add_argument('-w', '--weeks', type=str, default="all", help="Weeks filter (e.g., '04-08,11')")
     roulette_parser.add_argument('-p', '--only-p', action='store_true', help="Only select P assignments")
     roulette_parser.add_argument('-r', '--only-r', action='store_true', help="Only select R assignments")
     roulette_parser.add_argument('-i', '--ignore-progress', action='store_true', help="Ignore progress file (select from all tasks)")
+    roulette_parser.add_argument('--schedule', action='store_true', help="Spaced repetition: weight all tasks by past outcomes and age")
 
     # Main parser arguments
     parser.add_argument('-n', '--num', type=int, default=5, help="Number of files")
@@ -565,9 +1212,23 @@ def main():
     parser.add_argument('-p', '--only-p', action='store_true', help="Only P assignments for exam generation")
     parser.add_argument('-r', '--only-r', action='store_true', help="Only R assignments for exam generation")
     parser.add_argument('-s', '--show', action='store_true', help="Show true filenames in exam (no anonymization)")
+    parser.add_argument('--schedule', action='store_true', help="Spaced repetition: weight all tasks by past outcomes and age instead of skipping done ones")
+    parser.add_argument('--no-update', action='store_true', help="Don't run pb152 update before generating the exam")
+    parser.add_argument('--fast', action='store_true', help="Make 'make <task>' skip valgrind by default ('make check' runs everything)")
+    parser.add_argument('--profile', action='store_true', help="Print a timing breakdown of the command's phases")
+    parser.add_argument('--trace', type=Path, metavar='FILE', help="Also write a Chrome trace (chrome://tracing, Perfetto) to FILE; implies --profile")
     
     args = parser.parse_args()
 
+    if args.profile or args.trace:
+        tracing.enable()
+    try:
+        with span(f"exam {args.command or 'generate'}"):
+            run_command(args)
+    finally:
+        tracing.finish(args.trace)
+
+def run_command(args: argparse.Namespace):
     root_dir = get_root_dir()
     dest_dir = root_dir / DEST_DIR_NAME
     archive_dir = root_dir / ARCHIVE_DIR_NAME
@@ -580,88 +1241,59 @@ def main():
         hide_exam_files(dest_dir)
         return
     if args.command == 'trash':
-        trash_exam_files(dest_dir, root_dir / PROGRESS_FILE)
+        trash_exam_files(dest_dir, get_progress_store(root_dir))
         return
     if args.command == 'archive' or args.command == 'done': # Handle 'archive' and 'done' alias
-        archive_existing_exam(dest_dir, archive_dir)
+        unchecked = tasks_without_full_pass(dest_dir)
+        if unchecked:
+            logging.warning(f"Not passed with the full profile (valgrind) since the last change: {', '.join(unchecked)}. "
+                            f"Memory errors and leaks in these tasks would fail the real exam.")
+        store = get_progress_store(root_dir)
+        with store.lock():
+            archived = archive_existing_exam(dest_dir, archive_dir, store)
+        if not archived:
+            sys.exit(1)
+        return
+    if args.command == 'archives':
+        try:
+            if args.restore is not None:
+                restore_archived_exam(root_dir, archive_dir, args.restore, args.to)
+            else:
+                show_archives(root_dir, archive_dir)
+        except ArchiveStoreError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        return
+    if args.command == 'prefetch':
+        prefetch(root_dir)
+        return
+    if args.command == 'search':
+        try:
+            run_search(root_dir, archive_dir, args.terms, args.num)
+        except ArchiveStoreError as e:
+            logging.error(str(e))
+            sys.exit(1)
         return
     if args.command == 'progress':
-        show_progress(root_dir, args.only_p, args.only_r)
+        show_progress(root_dir, get_progress_store(root_dir), args.only_p, args.only_r)
         return
     if args.command == 'roulette':
         run_roulette(root_dir, args)
         return
-
-    # --- Default Action: Exam Generation ---
-    run_pb152_update()
-
-    # Note: argparse naming conflict. We need to distinguish flags for exam-gen from progress.
-    # The main parser flags are used here.
-    include_p_exam = not args.only_r
-    include_r_exam = not args.only_p
-    
-    logging.info(f"Root: {root_dir}")
-    
-    progress_path = root_dir / PROGRESS_FILE
-    processed = load_processed_paths(progress_path)
-    target_weeks = parse_week_range(args.weeks)
-
-    candidates = get_candidates(root_dir, target_weeks, include_p_exam, include_r_exam, processed)
-    count = min(args.num, len(candidates))
-    
-    if count == 0:
-        logging.info("No new eligible files found. You are done!")
+    if args.command == 'watch':
+        watch_exam(dest_dir, args.timeout, args.debounce, args.poll, not args.no_record)
         return
-
-    archive_existing_exam(dest_dir, archive_dir)
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    selected = random.sample(candidates, count)
-    logging.info(f"Selected {len(selected)} tasks.")
-
-    try:
-        makefile_template = copy_support_files(root_dir, dest_dir)
-    except Exception as e:
-        logging.error(f"Error copying support files: {e}")
+    if args.command == 'test':
+        run_exam_tests(dest_dir, args.jobs, args.timeout, not args.no_record, args.test_profile)
         return
 
-    generate_intro_joke(root_dir, dest_dir)
-
-    newly_processed_ids = set()
-    final_filenames = []
-    mapping_lines = []
-
-    for idx, src_path in enumerate(selected):
-        try:
-            week = src_path.parent.name
-            pristine_path = src_path.with_suffix(src_path.suffix + '.pristine')
-            final_src = pristine_path if pristine_path.exists() else src_path
-            
-            original_basename = src_path.name
-            
-            if not args.show:
-                dest_name = f"task_{idx + 1}.c"
-                mapping_lines.append(f"{dest_name} = {week}/{original_basename}")
-            else:
-                dest_name = f"{week}.{original_basename}"
-
-            shutil.copy2(final_src, dest_dir / dest_name)
-            
-            final_filenames.append(dest_name)
-            newly_processed_ids.add(f"{week}/{original_basename}")
-            
-            log_type = "pristine" if pristine_path.exists() else "standard"
-            logging.info(f"Copied {log_type}: {week}/{original_basename} -> {dest_name}")
-
-        except Exception as e:
-            logging.error(f"Error copying {src_path}: {e}")
-
-    if not args.show and mapping_lines:
-        with open(dest_dir / '00_mapping.txt', 'w') as f:
-            f.write("\n".join(mapping_lines) + "\n")
+    # --- Default Action: Exam Generation ---
+    with span('pb152 update'):
+        update_if_stale(root_dir, args)
 
-    create_dynamic_makefile(makefile_template, dest_dir, final_filenames)
-    save_processed_paths(progress_path, processed.union(newly_processed_ids))
-    logging.info(f"Exam generated in '{dest_dir.name}'.")
+    store = get_progress_store(root_dir)
+    with store.lock():
+        generate_exam(root_dir, store, args)
 
 if __name__ == "__main__":
     main()
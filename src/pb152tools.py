@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+"""
+Single entry point for the Python side of pb152tools.
+
+The launcher script calls this with the subcommand name. Subcommand modules
+are imported only once they are selected, so fast commands like
+`exam progress` never pay for the advisor's SDK imports.
+"""
+import sys
+import importlib
+
+# Subcommand name -> module in src/ exposing a `main()` function
+COMMANDS = {
+    'exam': 'mock',
+    'advise': 'advisor',
+    'format': 'format_practice',
+    'profile': 'syscall_profile',
+}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print(f"Usage: {sys.argv[0]} {{{','.join(COMMANDS)}}} [options]", file=sys.stderr)
+        sys.exit(1)
+
+    command = sys.argv[1]
+    # Make argparse in the subcommand report 'pb152tools <command>' as its program name
+    sys.argv = [f"pb152tools {command}"] + sys.argv[2:]
+    module = importlib.import_module(COMMANDS[command])
+    module.main()
+
+
+if __name__ == "__main__":
+    main()
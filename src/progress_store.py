@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+"""
+SQLite-backed progress store for mock exams.
+
+Replaces the old `exams.progress.json` set. Every task handed out in an exam
+is recorded as an attempt row, so generating, archiving or trashing an exam
+only touches the rows of that exam instead of rewriting the whole file.
+Writers take an advisory lock so two terminals running `exam` at once
+cannot hand out the same tasks.
+
+Run as a script with `--migrate` to import an existing `exams.progress.json`.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows, locking becomes a no-op.
+    fcntl = None
+
+# --- Configuration ---
+PROGRESS_DB_FILE = 'exams.progress.db'
+LEGACY_PROGRESS_FILE = 'exams.progress.json'
+LOCK_FILE = 'exams.progress.lock'
+SCHEMA_VERSION = 1
+
+# Attempt outcomes. An attempt without an outcome belongs to the exam that is
+# currently in progress.
+OUTCOME_DONE = 'done'
+OUTCOME_PASSED = 'passed'
+OUTCOME_FAILED = 'failed'
+OUTCOME_TRASHED = 'trashed'
+OUTCOME_MIGRATED = 'migrated'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    exam_id TEXT,
+    generated_at REAL,
+    archived_at REAL,
+    outcome TEXT
+);
+CREATE INDEX IF NOT EXISTS attempts_task_id ON attempts (task_id);
+CREATE INDEX IF NOT EXISTS attempts_open ON attempts (outcome) WHERE outcome IS NULL;
+"""
+
+
+class Attempt(NamedTuple):
+    id: int
+    task_id: str
+    exam_id: Optional[str]
+    generated_at: Optional[float]
+    archived_at: Optional[float]
+    outcome: Optional[str]
+
+
+class ProgressStoreError(Exception):
+    pass
+
+
+class ProgressStore:
+    """Attempt history for the tasks in a pb152 root."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock_path = path.with_name(LOCK_FILE)
+        try:
+            self.conn = sqlite3.connect(str(path), timeout=10)
+            with self.conn:
+                self.conn.executescript(SCHEMA)
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        except sqlite3.DatabaseError as e:
+            raise ProgressStoreError(f"Cannot open progress store '{path}': {e}") from e
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """Holds an exclusive advisory lock for a read-modify-write sequence."""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # --- Queries ---
+
+    def completed_task_ids(self) -> Set[str]:
+        """Tasks that were handed out in an exam and not trashed afterwards."""
+        rows = self.conn.execute(
+            "SELECT DISTINCT task_id FROM attempts WHERE outcome IS NULL OR outcome != ?",
+            (OUTCOME_TRASHED,)
+        )
+        return {row[0] for row in rows}
+
+    def attempts(self, task_id: Optional[str] = None) -> List[Attempt]:
+        if task_id is None:
+            rows = self.conn.execute("SELECT * FROM attempts ORDER BY id")
+        else:
+            rows = self.conn.execute("SELECT * FROM attempts WHERE task_id = ? ORDER BY id", (task_id,))
+        return [Attempt(*row) for row in rows]
+
+    def history(self) -> Dict[str, List[Attempt]]:
+        """All attempts grouped by task id, oldest first."""
+        result: Dict[str, List[Attempt]] = {}
+        for attempt in self.attempts():
+            result.setdefault(attempt.task_id, []).append(attempt)
+        return result
+
+    def open_attempts(self) -> List[Attempt]:
+        rows = self.conn.execute("SELECT * FROM attempts WHERE outcome IS NULL ORDER BY id")
+        return [Attempt(*row) for row in rows]
+
+    # --- Updates ---
+
+    def record_generated(self, task_ids: Iterable[str], exam_id: str, generated_at: Optional[float] = None):
+        """Inserts one open attempt per task of a freshly generated exam."""
+        generated_at = generated_at if generated_at is not None else time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO attempts (task_id, exam_id, generated_at) VALUES (?, ?, ?)",
+                [(task_id, exam_id, generated_at) for task_id in task_ids]
+            )
+
+    def archive_open(self, archived_at: Optional[float] = None, outcome: str = OUTCOME_DONE,
+                     outcomes: Optional[Dict[str, str]] = None) -> int:
+        """
+        Closes the attempts of the exam in progress. `outcomes` overrides the
+        outcome of individual tasks (e.g. test results). Returns the number of
+        rows changed.
+        """
+        archived_at = archived_at if archived_at is not None else time.time()
+        changed = 0
+        with self.conn:
+            for task_id, task_outcome in (outcomes or {}).items():
+                cur = self.conn.execute(
+                    "UPDATE attempts SET archived_at = ?, outcome = ? WHERE outcome IS NULL AND task_id = ?",
+                    (archived_at, task_outcome, task_id)
+                )
+                changed += cur.rowcount
+            cur = self.conn.execute(
+                "UPDATE attempts SET archived_at = ?, outcome = ? WHERE outcome IS NULL",
+                (archived_at, outcome)
+            )
+            changed += cur.rowcount
+        return changed
+
+    def trash_tasks(self, task_ids: Iterable[str]) -> int:
+        """
+        Marks the given tasks as trashed so they become eligible again.
+        Open attempts are preferred; if there are none (e.g. the task was only
+        known from the migrated JSON file), every remaining attempt is trashed.
+        """
+        task_ids = list(task_ids)
+        if not task_ids:
+            return 0
+        placeholders = ','.join('?' * len(task_ids))
+        now = time.time()
+        with self.conn:
+            cur = self.conn.execute(
+                f"UPDATE attempts SET archived_at = ?, outcome = ? "
+                f"WHERE outcome IS NULL AND task_id IN ({placeholders})",
+                (now, OUTCOME_TRASHED, *task_ids)
+            )
+            changed = cur.rowcount
+            if changed == 0:
+                cur = self.conn.execute(
+                    f"UPDATE attempts SET outcome = ? "
+                    f"WHERE outcome != ? AND task_id IN ({placeholders})",
+                    (OUTCOME_TRASHED, OUTCOME_TRASHED, *task_ids)
+                )
+                changed = cur.rowcount
+        return changed
+
+
+# --- Migration ---
+
+def migrate_legacy_progress(root: Path) -> int:
+    """
+    Imports `exams.progress.json` into the SQLite store once and renames the
+    JSON file to `.bak`. Returns the number of imported tasks.
+    """
+    json_path = root / LEGACY_PROGRESS_FILE
+    db_path = root / PROGRESS_DB_FILE
+    if not json_path.exists():
+        return 0
+
+    try:
+        with json_path.open() as f:
+            task_ids = json.load(f)
+        if not isinstance(task_ids, list) or not all(isinstance(t, str) for t in task_ids):
+            raise ValueError("expected a list of task paths")
+    except (OSError, ValueError) as e:
+        raise ProgressStoreError(f"Cannot migrate '{json_path}': {e}") from e
+
+    store = ProgressStore(db_path)
+    try:
+        with store.lock():
+            known = {a.task_id for a in store.attempts()}
+            new_ids = sorted(set(task_ids) - known)
+            mtime = json_path.stat().st_mtime
+            with store.conn:
+                store.conn.executemany(
+                    "INSERT INTO attempts (task_id, exam_id, generated_at, archived_at, outcome) "
+                    "VALUES (?, NULL, NULL, ?, ?)",
+                    [(task_id, mtime, OUTCOME_MIGRATED) for task_id in new_ids]
+                )
+            os.replace(json_path, json_path.with_name(json_path.name + '.bak'))
+    finally:
+        store.close()
+    return len(new_ids)
+
+
+def open_progress_store(root: Path) -> ProgressStore:
+    """Opens the progress store of `root`, migrating the legacy JSON file first if needed."""
+    if (root / LEGACY_PROGRESS_FILE).exists():
+        count = migrate_legacy_progress(root)
+        logging.info(f"Migrated {count} tasks from {LEGACY_PROGRESS_FILE} to {PROGRESS_DB_FILE}.")
+    return ProgressStore(root / PROGRESS_DB_FILE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the pb152tools exam progress store.")
+    parser.add_argument('--migrate', action='store_true', help=f"Import {LEGACY_PROGRESS_FILE} into {PROGRESS_DB_FILE}")
+    parser.add_argument('--root', type=Path, default=Path.home() / 'pb152', help="pb152 root directory")
+    args = parser.parse_args()
+
+    if args.migrate:
+        if not (args.root / LEGACY_PROGRESS_FILE).exists():
+            return
+        try:
+            count = migrate_legacy_progress(args.root)
+        except ProgressStoreError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Migrated {count} tasks to {args.root / PROGRESS_DB_FILE}")
+
+
+if __name__ == "__main__":
+    main()
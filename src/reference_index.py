@@ -0,0 +1,146 @@
+"""
+Section retrieval over the course reference manual.
+
+`pb152.reference.compressed.txt` is split on its `# N. Topic` headings and
+ranked with BM25 against the functions, constants and headers used by the
+student's C file and the identifiers that appear in the `make` output. Only
+the best sections that fit the token budget are sent to the model.
+"""
+import re
+import math
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+# --- Configuration ---
+SECTION_HEADING = re.compile(r'^# (\d+)\. (.+)$', re.MULTILINE)
+IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+CALL = re.compile(r'\b([A-Za-z_][A-Za-z0-9_]*)\s*\(')
+CONSTANT = re.compile(r'\b([A-Z][A-Z0-9]*_[A-Z0-9_]+)\b')
+INCLUDE = re.compile(r'#\s*include\s*[<"]([^>"]+)[>"]')
+CHARS_PER_TOKEN = 4
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+DEFAULT_TOP_K = 3
+DEFAULT_TOKEN_BUDGET = 1000
+
+STOPWORDS = {
+    # C keywords and very common test framework / libc names
+    'if', 'else', 'for', 'while', 'do', 'switch', 'case', 'return', 'sizeof',
+    'int', 'char', 'void', 'const', 'struct', 'static', 'unsigned', 'long',
+    'main', 'assert', 'printf', 'fprintf', 'strcmp', 'strlen', 'memset',
+    # English filler from the manual
+    'the', 'and', 'are', 'is', 'to', 'of', 'in', 'it', 'be', 'on', 'or',
+    'an', 'as', 'by', 'use', 'can', 'you', 'not', 'with', 'that', 'this',
+    'summary', 'notes', 'cautions', 'system', 'calls', 'library', 'functions',
+}
+
+
+class Section(NamedTuple):
+    number: int
+    title: str
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text)
+
+
+class RankedSection(NamedTuple):
+    section: Section
+    score: float
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in (w.lower() for w in IDENTIFIER.findall(text)) if len(t) > 1 and t not in STOPWORDS]
+
+
+def split_sections(reference: str) -> List[Section]:
+    """Splits the manual into its numbered top-level sections."""
+    matches = list(SECTION_HEADING.finditer(reference))
+    sections = []
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(reference)
+        sections.append(Section(int(m.group(1)), m.group(2).strip(), reference[m.start():end].strip()))
+    return sections
+
+
+def build_query(c_code: str, make_output: str) -> Counter:
+    """
+    Extracts the terms worth looking up: called functions, `UPPER_CASE`
+    constants and header names from the C file, plus identifiers from the
+    build log. Calls and constants are what ties code to a manual section,
+    so they count double.
+    """
+    query = Counter()
+    for name in CALL.findall(c_code) + CONSTANT.findall(c_code):
+        for token in tokenize(name):
+            query[token] += 2
+    for header in INCLUDE.findall(c_code):
+        for token in tokenize(Path(header).stem):
+            query[token] += 1
+    for token in tokenize(make_output):
+        query[token] += 1
+    return query
+
+
+class ReferenceIndex:
+    """BM25 index over the sections of the reference manual."""
+
+    def __init__(self, sections: List[Section]):
+        self.sections = sections
+        self.doc_terms = [Counter(tokenize(s.text)) for s in sections]
+        lengths = [sum(terms.values()) for terms in self.doc_terms]
+        self.doc_lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        doc_freq: Dict[str, int] = Counter()
+        for terms in self.doc_terms:
+            doc_freq.update(terms.keys())
+        n = len(sections)
+        self.idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in doc_freq.items()}
+
+    @classmethod
+    def from_file(cls, path: Path) -> 'ReferenceIndex':
+        return cls(split_sections(path.read_text(encoding='utf-8')))
+
+    def rank(self, query: Counter) -> List[RankedSection]:
+        ranked = []
+        for section, terms, length in zip(self.sections, self.doc_terms, self.doc_lengths):
+            score = 0.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.avg_length) if self.avg_length else BM25_K1
+            for term, weight in query.items():
+                tf = terms.get(term)
+                if not tf:
+                    continue
+                score += weight * self.idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+            if score > 0:
+                ranked.append(RankedSection(section, score))
+        ranked.sort(key=lambda r: r.score, reverse=True)
+        return ranked
+
+    def select(self, query: Counter, top_k: int = DEFAULT_TOP_K,
+               token_budget: int = DEFAULT_TOKEN_BUDGET) -> List[RankedSection]:
+        """The best `top_k` sections whose combined size stays within `token_budget`."""
+        chosen = []
+        used = 0
+        for ranked in self.rank(query):
+            if len(chosen) >= top_k:
+                break
+            if used + ranked.section.tokens > token_budget:
+                continue
+            chosen.append(ranked)
+            used += ranked.section.tokens
+        # Keep the manual's order so the prompt reads naturally
+        chosen.sort(key=lambda r: r.section.number)
+        return chosen
+
+
+def format_sections(chosen: List[RankedSection]) -> str:
+    if not chosen:
+        return "No reference section matched this task."
+    return "\n\n".join(r.section.text for r in chosen)
@@ -0,0 +1,163 @@
+"""
+Spaced-repetition task selection for `exam --schedule` and `exam roulette --schedule`.
+
+Instead of excluding every task that was ever handed out, each task gets a
+weight from its attempt history in the progress store:
+
+- never attempted tasks get NEW_WEIGHT,
+- a failed last attempt makes a task likely to come back, more so as it ages,
+- passed tasks come back once their interval (doubling with every pass in a
+  row) has elapsed,
+- long exams (generation to archival) add a little weight to their tasks.
+
+Tasks are drawn without replacement from per-week Fenwick trees, and every
+draw goes to one of the weeks with the fewest picks so far, so a selection
+spreads over the weeks chosen with `--weeks`.
+"""
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+from progress_store import OUTCOME_FAILED, OUTCOME_PASSED, OUTCOME_TRASHED, Attempt
+from task_index import TaskEntry
+
+# --- Configuration ---
+NEW_WEIGHT = 3.0
+FAILED_WEIGHT = 4.0
+PASSED_WEIGHT = 1.0
+DONE_WEIGHT = 1.0          # archived without test results, or migrated
+BASE_INTERVAL_DAYS = 2.0
+MIN_WEIGHT = 0.02
+LONG_EXAM_SECONDS = 3 * 3600
+DAY = 24 * 3600
+
+
+class FenwickTree:
+    """Prefix sums over weights with O(log n) updates and weighted draws."""
+
+    def __init__(self, weights: Sequence[float]):
+        self.size = len(weights)
+        self.tree = [0.0] * (self.size + 1)
+        self.weights = [0.0] * self.size
+        for i, w in enumerate(weights):
+            self.update(i, w)
+
+    def update(self, i: int, weight: float):
+        delta = weight - self.weights[i]
+        self.weights[i] = weight
+        j = i + 1
+        while j <= self.size:
+            self.tree[j] += delta
+            j += j & -j
+
+    @property
+    def total(self) -> float:
+        s = 0.0
+        j = self.size
+        while j > 0:
+            s += self.tree[j]
+            j -= j & -j
+        return s
+
+    def find(self, target: float) -> int:
+        """The index whose cumulative weight range contains `target` (0 <= target < total)."""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= target:
+                target -= self.tree[nxt]
+                pos = nxt
+            step >>= 1
+        return min(pos, self.size - 1)
+
+    def draw(self, rng: random.Random) -> Optional[int]:
+        """Draws an index proportionally to its weight and removes it."""
+        total = self.total
+        if total <= 0:
+            # The tree's sum may have drifted below a few live weights; trust the weights
+            total = sum(self.weights)
+            if total <= 0:
+                return None
+        i = self.find(rng.random() * total)
+        if self.weights[i] <= 0:
+            # Float drift landed on an already removed slot: take the nearest live one after it, else before it
+            after = (j for j in range(i + 1, self.size) if self.weights[j] > 0)
+            before = (j for j in range(i - 1, -1, -1) if self.weights[j] > 0)
+            i = next(after, next(before, None))
+            if i is None:
+                return None
+        self.update(i, 0.0)
+        return i
+
+
+def task_weight(attempts: List[Attempt], now: float) -> float:
+    """Selection weight of a task from its (chronological) attempt history."""
+    attempts = [a for a in attempts if a.outcome != OUTCOME_TRASHED]
+    if not attempts:
+        return NEW_WEIGHT
+    if any(a.outcome is None for a in attempts):
+        return 0.0  # part of the exam in progress
+
+    last = attempts[-1]
+    last_time = last.archived_at or last.generated_at or now
+    age_days = max(0.0, (now - last_time) / DAY)
+
+    if last.outcome == OUTCOME_FAILED:
+        weight = FAILED_WEIGHT * (1 + min(age_days, 7) / 7)
+    else:
+        streak = 0
+        for a in reversed(attempts):
+            if a.outcome == OUTCOME_FAILED:
+                break
+            streak += 1
+        interval = BASE_INTERVAL_DAYS * 2 ** (streak - 1)
+        base = PASSED_WEIGHT if last.outcome == OUTCOME_PASSED else DONE_WEIGHT
+        weight = base * min(4.0, age_days / interval)
+
+    if last.generated_at and last.archived_at:
+        spent = last.archived_at - last.generated_at
+        weight *= 1 + 0.5 * min(1.0, max(0.0, spent) / LONG_EXAM_SECONDS)
+
+    return max(MIN_WEIGHT, weight)
+
+
+def schedule_tasks(tasks: List[TaskEntry], history: Dict[str, List[Attempt]], count: int,
+                   now: Optional[float] = None, rng: Optional[random.Random] = None) -> List[TaskEntry]:
+    """Draws up to `count` tasks, weighted by history and spread evenly across weeks."""
+    now = now if now is not None else time.time()
+    rng = rng or random.Random()
+
+    by_week: Dict[str, List[TaskEntry]] = defaultdict(list)
+    for task in tasks:
+        by_week[task.week].append(task)
+
+    trees = {
+        week: FenwickTree([task_weight(history.get(t.task_id, []), now) for t in week_tasks])
+        for week, week_tasks in by_week.items()
+    }
+    picks = {week: 0 for week in trees}
+    selected = []
+
+    while len(selected) < count:
+        live = [w for w, tree in trees.items() if tree.total > 0]
+        if not live:
+            break
+        fewest = min(picks[w] for w in live)
+        eligible = [w for w in live if picks[w] == fewest]
+        week_totals = [trees[w].total for w in eligible]
+        target = rng.random() * sum(week_totals)
+        for week, total in zip(eligible, week_totals):
+            if target < total:
+                break
+            target -= total
+        i = trees[week].draw(rng)
+        if i is None:
+            # draw() only gives up when no task of the week has weight left; the total was float residue
+            del trees[week]
+            continue
+        selected.append(by_week[week][i])
+        picks[week] += 1
+
+    return selected
@@ -0,0 +1,254 @@
+"""
+Full-text search over the week task files and archived exam solutions.
+
+`exams.search.db` (SQLite, next to the progress store) holds an inverted
+index from terms to the files and line numbers they occur on. Terms are the
+lower-cased C identifiers of the code and its comments, plus the parts of
+snake_case names, so `recv`, `sock_fd` and `fd` all find `recv(sock_fd, ...)`.
+
+The index is brought up to date before every search: week files are only
+re-read when their mtime or size changed (and only re-indexed when their
+content hash changed), and archived exams are immutable blobs, so only exams
+archived since the last search are added. Hits are ranked with BM25.
+"""
+import json
+import math
+import sqlite3
+import hashlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from archive_store import ArchiveStore, ArchiveStoreError
+from reference_index import BM25_B, BM25_K1, IDENTIFIER
+from task_index import MONTH_DIR_PATTERN, TaskIndex
+
+# --- Configuration ---
+SEARCH_DB_FILE = 'exams.search.db'
+SCHEMA_VERSION = 1
+DEFAULT_LIMIT = 10
+MAX_LINES_PER_HIT = 3
+
+STOPWORDS = {
+    'if', 'else', 'for', 'while', 'do', 'switch', 'case', 'break', 'continue', 'return',
+    'int', 'char', 'void', 'const', 'struct', 'static', 'unsigned', 'long', 'short',
+    'include', 'define', 'sizeof', 'the', 'and', 'is', 'to', 'of', 'in', 'it', 'a',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    stamp TEXT,
+    content_hash TEXT,
+    week TEXT,
+    task TEXT,
+    exams TEXT NOT NULL DEFAULT '[]',
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    lines TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS postings_term ON postings (term);
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+CREATE TABLE IF NOT EXISTS indexed_exams (
+    number INTEGER PRIMARY KEY
+);
+"""
+
+
+class SearchHit(NamedTuple):
+    key: str
+    week: Optional[str]
+    task: str
+    exams: List[str]
+    score: float
+    lines: List[int]
+
+
+def tokenize_line(line: str) -> List[str]:
+    terms = []
+    for word in IDENTIFIER.findall(line):
+        word = word.lower()
+        parts = [word] + ([p for p in word.split('_') if p] if '_' in word.strip('_') else [])
+        terms.extend(t for t in parts if len(t) > 1 and t not in STOPWORDS)
+    return terms
+
+
+def index_text(text: str) -> Dict[str, List[int]]:
+    """Term -> line numbers (1-based) it occurs on."""
+    lines: Dict[str, List[int]] = defaultdict(list)
+    for number, line in enumerate(text.splitlines(), 1):
+        for term in set(tokenize_line(line)):
+            lines[term].append(number)
+    return lines
+
+
+def split_archived_name(filename: str) -> Tuple[Optional[str], str]:
+    """'03.p2_b.c' -> ('03', 'p2_b.c'); anonymized names have no week."""
+    week, _, task = filename.partition('.')
+    if task and MONTH_DIR_PATTERN.match(week):
+        return week, task
+    return None, filename
+
+
+class SearchIndex:
+    """Inverted index of week task files and archived solutions."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.conn = sqlite3.connect(str(path), timeout=10)
+        with self.conn:
+            if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                self.conn.executescript(
+                    "DROP TABLE IF EXISTS docs; DROP TABLE IF EXISTS postings; DROP TABLE IF EXISTS indexed_exams;"
+                )
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        self.conn.close()
+
+    # --- Updates ---
+
+    def _add_doc(self, key: str, stamp: Optional[str], content_hash: str, week: Optional[str],
+                 task: str, exams: List[str], text: str):
+        terms = index_text(text)
+        cur = self.conn.execute(
+            "INSERT INTO docs (key, stamp, content_hash, week, task, exams, length) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, stamp, content_hash, week, task, json.dumps(exams), sum(len(l) for l in terms.values()))
+        )
+        self.conn.executemany(
+            "INSERT INTO postings (term, doc_id, tf, lines) VALUES (?, ?, ?, ?)",
+            [(term, cur.lastrowid, len(lines), json.dumps(lines)) for term, lines in terms.items()]
+        )
+
+    def _remove_doc(self, doc_id: int):
+        self.conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+        self.conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+
+    def update_weeks(self, task_index: TaskIndex) -> int:
+        """Re-indexes week task files whose mtime/size and content changed. Returns the number re-indexed."""
+        known = {
+            key: (doc_id, stamp, content_hash)
+            for doc_id, key, stamp, content_hash in self.conn.execute(
+                "SELECT id, key, stamp, content_hash FROM docs WHERE key LIKE 'week:%'"
+            )
+        }
+        changed = 0
+        seen: Set[str] = set()
+        with self.conn:
+            for task in task_index.tasks():
+                key = f"week:{task.task_id}"
+                seen.add(key)
+                path = task.path(task_index.root)
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                stamp = f"{st.st_mtime_ns}:{st.st_size}"
+                old = known.get(key)
+                if old and old[1] == stamp:
+                    continue
+                try:
+                    data = path.read_bytes()
+                except OSError:
+                    continue
+                content_hash = hashlib.sha256(data).hexdigest()
+                if old and old[2] == content_hash:
+                    self.conn.execute("UPDATE docs SET stamp = ? WHERE id = ?", (stamp, old[0]))
+                    continue
+                if old:
+                    self._remove_doc(old[0])
+                self._add_doc(key, stamp, content_hash, task.week, task.name, [], data.decode('utf-8', 'replace'))
+                changed += 1
+            for key in known.keys() - seen:
+                self._remove_doc(known[key][0])
+                changed += 1
+        return changed
+
+    def update_archive(self, archive: ArchiveStore) -> int:
+        """Indexes exams archived since the last update. Returns the number of new exams."""
+        indexed = {row[0] for row in self.conn.execute("SELECT number FROM indexed_exams")}
+        new_exams = [e for e in archive.exams() if e.number not in indexed]
+        with self.conn:
+            for exam in new_exams:
+                try:
+                    files = archive.manifest(exam.number)['files']
+                except ArchiveStoreError:
+                    continue
+                for filename, digest in files.items():
+                    if not filename.endswith('.c'):
+                        continue
+                    key = f"archive:{digest}"
+                    row = self.conn.execute("SELECT id, exams FROM docs WHERE key = ?", (key,)).fetchone()
+                    if row:
+                        exams = json.loads(row[1])
+                        if exam.name not in exams:
+                            self.conn.execute("UPDATE docs SET exams = ? WHERE id = ?",
+                                              (json.dumps(exams + [exam.name]), row[0]))
+                        continue
+                    try:
+                        text = archive.get_blob(digest).decode('utf-8', 'replace')
+                    except ArchiveStoreError:
+                        continue
+                    week, task = split_archived_name(filename)
+                    self._add_doc(key, None, digest, week, task, [exam.name], text)
+                self.conn.execute("INSERT INTO indexed_exams (number) VALUES (?)", (exam.number,))
+        return len(new_exams)
+
+    # --- Queries ---
+
+    def search(self, query: Iterable[str], limit: int = DEFAULT_LIMIT) -> List[SearchHit]:
+        terms = sorted({t for word in query for t in tokenize_line(word)})
+        if not terms:
+            return []
+        n_docs, avg_length = self.conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+        if not n_docs:
+            return []
+        avg_length = avg_length or 1.0
+
+        scores: Dict[int, float] = defaultdict(float)
+        hit_lines: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        for term in terms:
+            rows = self.conn.execute(
+                "SELECT p.doc_id, p.tf, p.lines, d.length FROM postings p JOIN docs d ON d.id = p.doc_id WHERE p.term = ?",
+                (term,)
+            ).fetchall()
+            if not rows:
+                continue
+            idf = math.log(1 + (n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            for doc_id, tf, lines, length in rows:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+                for line in json.loads(lines):
+                    hit_lines[doc_id][line] += 1
+
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        hits = []
+        for doc_id, score in best:
+            key, week, task, exams = self.conn.execute(
+                "SELECT key, week, task, exams FROM docs WHERE id = ?", (doc_id,)
+            ).fetchone()
+            # Lines matching the most distinct query terms first, then in file order
+            lines = sorted(hit_lines[doc_id].items(), key=lambda item: (-item[1], item[0]))
+            hits.append(SearchHit(key, week, task, json.loads(exams), score,
+                                  sorted(line for line, _ in lines[:MAX_LINES_PER_HIT])))
+        return hits
+
+
+def read_hit_text(hit: SearchHit, root: Path, archive: ArchiveStore) -> List[str]:
+    """The lines of the file a hit refers to."""
+    try:
+        if hit.key.startswith('week:'):
+            return (root / hit.key[len('week:'):]).read_text(encoding='utf-8', errors='replace').splitlines()
+        return archive.get_blob(hit.key[len('archive:'):]).decode('utf-8', 'replace').splitlines()
+    except (OSError, ArchiveStoreError):
+        return []
+
+
+def open_search_index(root: Path) -> SearchIndex:
+    return SearchIndex(root / SEARCH_DB_FILE)
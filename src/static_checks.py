@@ -0,0 +1,391 @@
+"""
+Offline pre-checks of a task's C source, run before the advisor asks the model.
+
+Most failures in the course come from a few mechanical mistakes that are
+visible in the source alone (see assets/pb152.process.txt and the reference
+manual): unchecked `write`/`send` results, treating a short `read` as end of
+file, descriptors that are never closed, `recv` buffers without the extra byte
+that reveals an oversized datagram, and syscalls in loops that run into the
+framework's limit of 1024 syscalls per execution.
+
+The checks work on the source with comments and string literals blanked out
+and find function and loop bodies by matching braces, instead of parsing C.
+They take milliseconds and can report false positives.
+"""
+import re
+import bisect
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# --- Configuration ---
+SYSCALL_LIMIT = 1024
+WRITE_CALLS = {'write', 'send', 'sendto'}
+READ_CALLS = {'read', 'recv', 'recvfrom'}
+RECV_CALLS = {'recv', 'recvfrom'}
+FD_OPENERS = {'open', 'openat', 'creat', 'socket', 'accept', 'dup'}
+# Calls that cost a syscall each time; stdio (printf, fputs, ...) is buffered and left out
+LOOP_SYSCALLS = READ_CALLS | WRITE_CALLS | FD_OPENERS | {
+    'pread', 'pwrite', 'dprintf', 'close', 'lseek', 'fstat', 'stat', 'fsync', 'pipe', 'dup2', 'connect', 'bind',
+}
+BYTE_CALLS = {'read', 'write', 'pread', 'pwrite'}
+BYTE_SIZED = {'1', 'sizeof(char)', 'sizeofchar'}
+KEYWORDS = {'if', 'for', 'while', 'do', 'switch', 'return', 'sizeof', 'else', 'case'}
+
+COMMENT_OR_LITERAL = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+CALL = re.compile(r'\b(?P<name>[A-Za-z_]\w*)\s*\(')
+LOOP_KEYWORD = re.compile(r'\b(?:for|while|do)\b')
+ASSIGNED_TO = re.compile(r'(?P<var>[A-Za-z_]\w*)\s*=\s*(?:\(\s*)*$')
+FUNCTION_HEAD = re.compile(r'(?P<name>[A-Za-z_]\w*)\s*\([^;{}]*\)\s*$')
+ERROR_ONLY_CHECK = re.compile(r'^\s*(?:==\s*-\s*1|<\s*0|<=\s*-\s*1)\b')
+
+# Rule id -> title, in the order findings are grouped in the summary
+RULE_TITLES = OrderedDict([
+    ('unchecked-write', 'Unchecked writes'),
+    ('partial-write', 'Partial writes not handled'),
+    ('short-read', 'Short reads treated as end of file'),
+    ('missing-close', 'Descriptors never closed'),
+    ('recv-buffer', 'recv buffers without room to detect oversized datagrams'),
+    ('syscall-loop', f'Syscalls in loops (limit: {SYSCALL_LIMIT} per execution)'),
+])
+
+
+class Finding(NamedTuple):
+    rule: str
+    line: int
+    message: str
+    severity: str = 'warning'   # 'warning' or 'note'
+
+    def format(self, filename: str = '') -> str:
+        loc = f"{filename}:{self.line}" if filename else f"line {self.line}"
+        return f"{loc}: {self.severity}: {self.message} [{self.rule}]"
+
+
+class Call(NamedTuple):
+    name: str
+    start: int       # offset of the name
+    open: int        # offset of '('
+    close: int       # offset of the matching ')'
+    args: List[str]  # with whitespace removed
+
+    @property
+    def count(self) -> str:
+        """The byte count argument of read/write/recv/send."""
+        return self.args[2] if len(self.args) > 2 else ''
+
+
+class Source:
+    """C source with comments and literals blanked, plus the function, loop and call structure."""
+
+    def __init__(self, code: str):
+        self.text = COMMENT_OR_LITERAL.sub(_blank, code)
+        self.line_starts = [0] + [m.end() for m in re.finditer(r'\n', self.text)]
+        self.calls = self._find_calls()
+        self.functions = self._find_functions()
+        self.loops = self._find_loops()
+
+    def line_of(self, pos: int) -> int:
+        return bisect.bisect_right(self.line_starts, pos)
+
+    def loop_depth(self, pos: int) -> int:
+        return sum(1 for start, end in self.loops if start <= pos < end)
+
+    def function_at(self, pos: int) -> Optional[Tuple[str, int, int]]:
+        for name, start, end in self.functions:
+            if start <= pos < end:
+                return name, start, end
+        return None
+
+    def _find_calls(self) -> List[Call]:
+        calls = []
+        for m in CALL.finditer(self.text):
+            name = m.group('name')
+            if name in KEYWORDS:
+                continue
+            open_pos = m.end() - 1
+            close = _matching(self.text, open_pos)
+            if close < 0:
+                continue
+            args = [re.sub(r'\s+', '', a) for a in _split_args(self.text[open_pos + 1:close])]
+            calls.append(Call(name, m.start(), open_pos, close, args))
+        return calls
+
+    def _find_functions(self) -> List[Tuple[str, int, int]]:
+        functions = []
+        depth = 0
+        statement_start = 0
+        for i, c in enumerate(self.text):
+            if c == '{':
+                if depth == 0:
+                    head = FUNCTION_HEAD.search(self.text[statement_start:i])
+                    end = _matching(self.text, i)
+                    if head and end > 0:
+                        functions.append((head.group('name'), i, end + 1))
+                depth += 1
+            elif c == '}':
+                depth = max(0, depth - 1)
+                if depth == 0:
+                    statement_start = i + 1
+            elif c == ';' and depth == 0:
+                statement_start = i + 1
+        return functions
+
+    def _find_loops(self) -> List[Tuple[int, int]]:
+        """(start, end) offsets of every loop, header included, since the condition runs per iteration too."""
+        loops = []
+        for m in LOOP_KEYWORD.finditer(self.text):
+            pos = m.end()
+            if m.group() != 'do':
+                pos = _skip_space(self.text, pos)
+                if pos >= len(self.text) or self.text[pos] != '(':
+                    continue
+                pos = _matching(self.text, pos)
+                if pos < 0:
+                    continue
+                pos += 1
+            body = _skip_space(self.text, pos)
+            if body >= len(self.text) or self.text[body] == ';':
+                continue   # the `while (...);` of a do-while, or an empty loop
+            if self.text[body] == '{':
+                end = _matching(self.text, body)
+            else:
+                end = _statement_end(self.text, body)
+            if end > 0:
+                loops.append((m.start(), end + 1))
+        return loops
+
+
+def _blank(match: re.Match) -> str:
+    """Blanks a comment or literal, keeping newlines (for line numbers) and the quotes."""
+    text = match.group()
+    blanked = re.sub(r'[^\n]', ' ', text)
+    if text[0] in '"\'':
+        blanked = text[0] + blanked[1:-1] + text[-1]
+    return blanked
+
+def _matching(text: str, pos: int) -> int:
+    """Offset of the bracket closing the one at `pos`, or -1."""
+    pairs = {'(': ')', '{': '}', '[': ']'}
+    opening, closing = text[pos], pairs[text[pos]]
+    depth = 0
+    for i in range(pos, len(text)):
+        if text[i] == opening:
+            depth += 1
+        elif text[i] == closing:
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+def _skip_space(text: str, pos: int) -> int:
+    while pos < len(text) and text[pos].isspace():
+        pos += 1
+    return pos
+
+def _statement_end(text: str, pos: int) -> int:
+    """Offset of the ';' ending the statement at `pos` (a braceless loop body)."""
+    depth = 0
+    for i in range(pos, len(text)):
+        if text[i] in '({[':
+            depth += 1
+        elif text[i] in ')}]':
+            depth -= 1
+        elif text[i] == ';' and depth <= 0:
+            return i
+    return -1
+
+def _split_args(text: str) -> List[str]:
+    args, depth, current = [], 0, []
+    for c in text:
+        if c in '({[':
+            depth += 1
+        elif c in ')}]':
+            depth -= 1
+        if c == ',' and depth == 0:
+            args.append(''.join(current))
+            current = []
+        else:
+            current.append(c)
+    if ''.join(current).strip():
+        args.append(''.join(current))
+    return args
+
+def _result_ignored(src: Source, call: Call) -> bool:
+    """The call is a statement of its own, e.g. `write( fd, buf, n );` or `(void) write(...)`."""
+    before = src.text[:call.start].rstrip()
+    before = re.sub(r'\(\s*void\s*\)$', '', before).rstrip()
+    after = src.text[call.close + 1:].lstrip()
+    return after.startswith(';') and (not before or before[-1] in ';{}' or before.endswith('else')
+                                      or (before[-1] == ')' and _is_control_head(src.text, before)))
+
+def _is_control_head(text: str, before: str) -> bool:
+    """`before` ends with the header of an if/for/while, so the call is its braceless body."""
+    depth = 0
+    for i in range(len(before) - 1, -1, -1):
+        if before[i] == ')':
+            depth += 1
+        elif before[i] == '(':
+            depth -= 1
+            if depth == 0:
+                return re.search(r'\b(?:if|for|while)\s*$', before[:i]) is not None
+    return False
+
+def _assigned_var(src: Source, call: Call) -> Optional[str]:
+    """The variable the call's result is assigned to (`fd = open(...)`, `if ( ( n = read(...) ) < 0 )`)."""
+    m = ASSIGNED_TO.search(src.text[max(0, call.start - 80):call.start])
+    return m.group('var') if m else None
+
+
+# --- Rules ---
+
+def check_writes(src: Source) -> List[Finding]:
+    findings = []
+    for call in src.calls:
+        if call.name not in WRITE_CALLS:
+            continue
+        if _result_ignored(src, call):
+            findings.append(Finding('unchecked-write', src.line_of(call.start),
+                                    f"the result of {call.name}() is ignored; check for -1 and for a partial "
+                                    f"write (fewer bytes than requested), which counts as an error in this course"))
+        elif call.name == 'write' and ERROR_ONLY_CHECK.match(src.text[call.close + 1:call.close + 20]):
+            findings.append(Finding('partial-write', src.line_of(call.start),
+                                    f"only -1 is checked after write(); a return value smaller than "
+                                    f"{call.count or 'the requested size'} (a partial write) should be treated as an error too",
+                                    'note'))
+    return findings
+
+def check_short_reads(src: Source) -> List[Finding]:
+    findings = []
+    for call in src.calls:
+        if call.name != 'read' or not call.count:
+            continue
+        size = re.escape(call.count)
+        compared = rf'\s*(?:<|!=)\s*\(?{size}\)?(?![\w\[])'
+        after = re.sub(r'\s+', '', src.text[call.close + 1:call.close + 80])
+        line = None
+        if re.match(compared.replace(r'\s*', ''), after):
+            line = src.line_of(call.start)
+        else:
+            var = _assigned_var(src, call)
+            function = src.function_at(call.start)
+            if var and function:
+                body = src.text[call.close:function[2]]
+                m = re.search(rf'\b{re.escape(var)}{compared}', body)
+                if m:
+                    line = src.line_of(call.close + m.start())
+        if line is not None:
+            findings.append(Finding('short-read', line,
+                                    f"the result of read() is compared with the requested size ({call.count}); "
+                                    f"reading fewer bytes is not end of file (only 0 is), so read the rest in a loop"))
+    return findings
+
+def check_closes(src: Source) -> List[Finding]:
+    findings = []
+    for call in src.calls:
+        function = src.function_at(call.start)
+        if not function:
+            continue
+        name, _, end = function
+        rest = src.text[call.close:end]
+        if call.name in FD_OPENERS:
+            var = _assigned_var(src, call)
+            if not var or _released(rest, var):
+                continue
+            findings.append(Finding('missing-close', src.line_of(call.start),
+                                    f"the descriptor '{var}' from {call.name}() is never closed in {name}(); "
+                                    f"close every descriptor you open, including on error paths"))
+        elif call.name == 'pipe' and call.args and re.fullmatch(r'\w+', call.args[0]):
+            ends = [i for i in (0, 1) if not _released(rest, rf'{call.args[0]}\s*\[\s*{i}\s*\]', pattern=True)]
+            if ends and not re.search(rf'\b{call.args[0]}\s*\)', rest):
+                findings.append(Finding('missing-close', src.line_of(call.start),
+                                        f"{' and '.join(f'{call.args[0]}[{i}]' for i in ends)} of the pipe "
+                                        f"{'is' if len(ends) == 1 else 'are'} never closed in {name}(); unused pipe ends keep readers from seeing end of file"))
+    return findings
+
+def _released(text: str, var: str, pattern: bool = False) -> bool:
+    """The descriptor is closed, returned or handed over to another function or variable."""
+    v = var if pattern else rf'\b{re.escape(var)}\b'
+    if re.search(rf'\bclose\s*\(\s*{v}\s*\)|\breturn\s*\(?\s*{v}|[^=!<>]=\s*{v}\s*[;,)]', text):
+        return True
+    # Passed to a helper (not a syscall), which may close it or keep it
+    for m in re.finditer(rf'\b(?P<func>[A-Za-z_]\w*)\s*\([^;]*?{v}', text):
+        if m.group('func') not in LOOP_SYSCALLS and m.group('func') not in KEYWORDS:
+            return True
+    return False
+
+def check_recv_buffers(src: Source) -> List[Finding]:
+    if 'SOCK_STREAM' in src.text and 'SOCK_DGRAM' not in src.text:
+        return []
+    findings = []
+    for call in src.calls:
+        if call.name not in RECV_CALLS or len(call.args) < 3:
+            continue
+        size = call.count
+        if '+1' in size:
+            continue
+        buffer = call.args[1].lstrip('&')
+        m = re.fullmatch(r'sizeof\(?(?P<buf>\w+)\)?', size)
+        if m:
+            function = src.function_at(call.start)
+            scope = src.text[function[1] if function else 0:call.start]
+            # The closest declaration before the call: a local, or failing that a global
+            decls = list(re.finditer(rf'\b{re.escape(m.group("buf"))}\s*\[(?P<size>[^\]]*)\]', scope)) or \
+                list(re.finditer(rf'\b{re.escape(m.group("buf"))}\s*\[(?P<size>[^\]]*)\]', src.text[:call.start]))
+            decl = decls[-1] if decls else None
+            if not decl or '+1' in re.sub(r'\s+', '', decl.group('size')):
+                continue
+            size = re.sub(r'\s+', '', decl.group('size'))
+        findings.append(Finding('recv-buffer', src.line_of(call.start),
+                                f"{call.name}() into '{buffer}' accepts exactly {size} bytes, so a longer datagram "
+                                f"is silently truncated; use a buffer (and length) one byte larger than the largest "
+                                f"valid datagram and treat a full buffer as an error"))
+    return findings
+
+def check_loop_syscalls(src: Source) -> List[Finding]:
+    findings = []
+    noted_loops = set()
+    for call in src.calls:
+        if call.name not in LOOP_SYSCALLS:
+            continue
+        depth = src.loop_depth(call.start)
+        if depth == 0:
+            continue
+        line = src.line_of(call.start)
+        # One datagram per send/recv is inherent, so only streams are checked for byte-sized calls
+        if call.name in BYTE_CALLS and call.count in BYTE_SIZED:
+            findings.append(Finding('syscall-loop', line,
+                                    f"{call.name}() moves one byte per call inside a loop; every byte costs one of "
+                                    f"the {SYSCALL_LIMIT} syscalls, so use a larger buffer and process it in memory"))
+        elif depth > 1:
+            findings.append(Finding('syscall-loop', line,
+                                    f"{call.name}() inside nested loops; the number of calls multiplies with the "
+                                    f"input size and can reach the limit of {SYSCALL_LIMIT} syscalls"))
+        elif call.name in WRITE_CALLS | {'dprintf'}:
+            loop = min((l for l in src.loops if l[0] <= call.start < l[1]), key=lambda l: l[1] - l[0])
+            if loop not in noted_loops:
+                noted_loops.add(loop)
+                findings.append(Finding('syscall-loop', line,
+                                        f"{call.name}() once per loop iteration; if the loop runs per item, "
+                                        f"collect the output in a buffer and write it in one call", 'note'))
+    return findings
+
+RULES = [check_writes, check_short_reads, check_closes, check_recv_buffers, check_loop_syscalls]
+
+
+def check_source(code: str) -> List[Finding]:
+    """Runs every rule on a C source and returns the findings ordered by line."""
+    src = Source(code)
+    seen: Dict[Tuple[str, int], Finding] = {}
+    for rule in RULES:
+        for finding in rule(src):
+            seen.setdefault((finding.rule, finding.line), finding)
+    return sorted(seen.values(), key=lambda f: (f.line, f.rule))
+
+def format_findings(findings: List[Finding], filename: str = '') -> str:
+    """The findings grouped by rule, one per line; empty if there are none."""
+    out = []
+    for rule, title in RULE_TITLES.items():
+        group = [f for f in findings if f.rule == rule]
+        if group:
+            out.append(f"{title} ({len(group)}):")
+            out.extend(f"  {f.format(filename)}" for f in group)
+    return '\n'.join(out)
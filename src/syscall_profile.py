@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+"""
+Syscall budget profiler: `pb152tools profile <task.c>`.
+
+The pb152 framework terminates a test program after 1024 syscalls. This
+builds the task with `make`, then runs its binary twice: under ptrace, which
+counts every syscall of each process (like `strace -c -f`), and with
+assets/syscount.c preloaded, which records the call stack of each call
+through the libc wrappers to show which source lines made them. Where ptrace
+is not permitted only the wrapper counts are shown, as a lower bound. Every
+run is recorded in ~/pb152/exams.syscalls.json to show whether batching reads
+or writes helped.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import struct
+import hashlib
+import argparse
+import subprocess
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from static_checks import SYSCALL_LIMIT
+
+# --- Configuration ---
+SCRIPT_DIR = Path(__file__).parent.resolve()
+SHIM_SOURCE = SCRIPT_DIR.parent / 'assets' / 'syscount.c'
+ROOT_DIR = Path.home() / 'pb152'
+SHIM_CACHE_DIR = ROOT_DIR / '.cache'
+HISTORY_FILE = ROOT_DIR / 'exams.syscalls.json'
+HISTORY_PER_TASK = 20
+SYSCOUNT_DIR_ENV = 'PB152_SYSCOUNT_DIR'
+MAKE_TIMEOUT = 60
+RUN_TIMEOUT = 30
+WARN_RATIO = 0.8
+METHOD_PTRACE = 'ptrace'        # every syscall of each process
+METHOD_WRAPPERS = 'wrappers'    # only calls through the preloaded libc wrappers
+
+# Layout of the table written by syscount.c
+TABLE_MAGIC = b'PBSYSC1\0'
+TABLE_HEADER = struct.Struct('<8siiII')     # magic, pid, ppid, total, dropped
+TABLE_ENTRY = struct.Struct('<16sII8Q')     # name, count, nframes, frames
+ELF_TYPE_EXEC = 2
+
+
+class ProfileError(Exception):
+    pass
+
+
+class Mapping(NamedTuple):
+    start: int
+    end: int
+    offset: int
+    path: str
+
+
+class CallSite(NamedTuple):
+    name: str
+    count: int
+    frames: Tuple[int, ...]
+
+
+class ProcessCounts(NamedTuple):
+    pid: int
+    ppid: int
+    total: int
+    dropped: int
+    sites: List[CallSite]
+    maps: List[Mapping]
+
+
+class ProfileRun(NamedTuple):
+    returncode: Optional[int]   # None if the run timed out
+    seconds: float
+    processes: List[ProcessCounts]
+
+
+class TracedProcess(NamedTuple):
+    pid: int
+    ppid: int
+    total: int      # every syscall of the process and its threads, as the kernel saw them
+
+
+class TraceRun(NamedTuple):
+    returncode: Optional[int]
+    seconds: float
+    processes: List[TracedProcess]
+
+
+# --- Building and running ---
+
+def build_shim() -> Path:
+    """Compiles the counter library, cached by the hash of its source."""
+    try:
+        source = SHIM_SOURCE.read_bytes()
+    except OSError as e:
+        raise ProfileError(f"Cannot read {SHIM_SOURCE}: {e}")
+    shim = SHIM_CACHE_DIR / f"syscount-{hashlib.sha256(source).hexdigest()[:12]}.so"
+    if shim.exists():
+        return shim
+
+    SHIM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = shim.with_suffix(f'.{os.getpid()}.tmp')
+    cc = os.environ.get('CC', 'cc')
+    try:
+        proc = subprocess.run([cc, '-shared', '-fPIC', '-O2', '-o', str(tmp), str(SHIM_SOURCE), '-ldl'],
+                              capture_output=True, text=True)
+    except FileNotFoundError:
+        raise ProfileError(f"C compiler '{cc}' not found (set CC to use another one)")
+    if proc.returncode != 0:
+        tmp.unlink(missing_ok=True)
+        raise ProfileError(f"Cannot build the syscall counter:\n{proc.stderr}")
+    os.replace(tmp, shim)
+    return shim
+
+def build_task(c_file: Path) -> Tuple[int, str]:
+    """Runs `make <task>`, which builds the binary (and runs the tests once)."""
+    try:
+        proc = subprocess.run(["make", c_file.stem], cwd=c_file.parent, capture_output=True, text=True,
+                              timeout=MAKE_TIMEOUT)
+    except FileNotFoundError:
+        raise ProfileError("'make' command not found. Is it installed and in your PATH?")
+    except subprocess.TimeoutExpired:
+        raise ProfileError(f"'make {c_file.stem}' timed out after {MAKE_TIMEOUT} seconds.")
+    return proc.returncode, proc.stdout + proc.stderr
+
+def run_profiled(binary: Path, shim: Path, timeout: int) -> ProfileRun:
+    """Runs the task binary with the counter preloaded and collects the tables of all its processes."""
+    with tempfile.TemporaryDirectory(prefix='pb152-syscount-') as out_dir:
+        env = dict(os.environ)
+        env['LD_PRELOAD'] = ' '.join(filter(None, [str(shim), env.get('LD_PRELOAD')]))
+        env[SYSCOUNT_DIR_ENV] = out_dir
+        start = time.monotonic()
+        proc = subprocess.Popen([str(binary)], cwd=binary.parent, env=env, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        try:
+            returncode = proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(proc.pid, signal.SIGKILL)
+            proc.wait()
+            returncode = None
+        seconds = time.monotonic() - start
+        processes = [read_table(p) for p in sorted(Path(out_dir).glob('*.bin'))]
+    return ProfileRun(returncode, seconds, [p for p in processes if p is not None])
+
+# --- Counting every syscall (ptrace) ---
+#
+# The preloaded counter only sees calls through the libc wrappers it replaces, not
+# the writes inside stdio, malloc's mmap/brk or the dynamic loader. The totals that
+# decide whether the framework kills a test come from a second run under ptrace,
+# which stops the process at every syscall entry, like `strace -c -f`.
+
+PTRACE_TRACEME = 0
+PTRACE_SYSCALL = 24
+PTRACE_SETOPTIONS = 0x4200
+PTRACE_GETEVENTMSG = 0x4201
+PTRACE_O_TRACESYSGOOD = 0x1
+PTRACE_O_TRACEFORK = 0x2
+PTRACE_O_TRACEVFORK = 0x4
+PTRACE_O_TRACECLONE = 0x8
+PTRACE_O_TRACEEXEC = 0x10
+PTRACE_O_EXITKILL = 0x100000
+PTRACE_EVENT_FORK, PTRACE_EVENT_VFORK, PTRACE_EVENT_CLONE = 1, 2, 3
+WAIT_ALL = 0x40000000    # __WALL: also wait for threads
+
+def _libc_ptrace():
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.ptrace.argtypes = [ctypes.c_long, ctypes.c_long, ctypes.c_void_p, ctypes.c_void_p]
+    libc.ptrace.restype = ctypes.c_long
+    return libc.ptrace, ctypes
+
+def _thread_group(tid: int) -> int:
+    try:
+        with open(f"/proc/{tid}/status") as f:
+            for line in f:
+                if line.startswith('Tgid:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return tid
+
+def trace_syscalls(binary: Path, timeout: int) -> Optional[TraceRun]:
+    """Runs the binary under ptrace and counts the syscalls of each process; None if tracing is not permitted."""
+    ptrace, ctypes = _libc_ptrace()
+
+    def trace_me():
+        if ptrace(PTRACE_TRACEME, 0, None, None) != 0:
+            os._exit(126)
+
+    start = time.monotonic()
+    try:
+        proc = subprocess.Popen([str(binary)], cwd=binary.parent, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                start_new_session=True, preexec_fn=trace_me)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    # The child stops with SIGTRAP after execve; anything else means tracing didn't take
+    _, status = os.waitpid(proc.pid, WAIT_ALL)
+    if not os.WIFSTOPPED(status) or os.WSTOPSIG(status) != signal.SIGTRAP:
+        proc.returncode = os.waitstatus_to_exitcode(status) if not os.WIFSTOPPED(status) else None
+        if proc.returncode is None:
+            os.killpg(proc.pid, signal.SIGKILL)
+        return None
+    options = (PTRACE_O_TRACESYSGOOD | PTRACE_O_TRACEFORK | PTRACE_O_TRACEVFORK | PTRACE_O_TRACECLONE
+               | PTRACE_O_TRACEEXEC | PTRACE_O_EXITKILL)
+    ptrace(PTRACE_SETOPTIONS, proc.pid, None, options)
+
+    timed_out = threading.Event()
+    def kill():
+        timed_out.set()
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    timer = threading.Timer(timeout, kill)
+    timer.start()
+
+    owner = {proc.pid: proc.pid}        # thread -> process it belongs to
+    parent = {proc.pid: os.getpid()}
+    in_syscall = defaultdict(bool)
+    counts: Dict[int, int] = defaultdict(int)
+    message = ctypes.c_ulong()
+    returncode = None
+    ptrace(PTRACE_SYSCALL, proc.pid, None, None)
+    try:
+        while True:
+            try:
+                tid, status = os.waitpid(-1, WAIT_ALL)
+            except ChildProcessError:
+                break
+            if os.WIFEXITED(status) or os.WIFSIGNALED(status):
+                if tid == proc.pid:
+                    returncode = os.waitstatus_to_exitcode(status)
+                continue
+            if not os.WIFSTOPPED(status):
+                continue
+            sig, event = os.WSTOPSIG(status), status >> 16
+            inject = 0
+            if sig == signal.SIGTRAP | 0x80:
+                in_syscall[tid] = not in_syscall[tid]
+                if in_syscall[tid]:
+                    counts[owner.setdefault(tid, tid)] += 1
+            elif sig == signal.SIGTRAP and event in (PTRACE_EVENT_FORK, PTRACE_EVENT_VFORK, PTRACE_EVENT_CLONE):
+                ptrace(PTRACE_GETEVENTMSG, tid, None, ctypes.byref(message))
+                child = message.value
+                process = owner.setdefault(tid, tid)
+                owner[child] = process if event == PTRACE_EVENT_CLONE else child
+                if event != PTRACE_EVENT_CLONE:
+                    parent[child] = process
+            elif sig == signal.SIGTRAP and event:
+                pass                             # exec
+            elif sig == signal.SIGSTOP and tid not in in_syscall:
+                in_syscall[tid] = False          # the first stop of a new child
+                owner.setdefault(tid, _thread_group(tid))
+            else:
+                inject = sig
+            ptrace(PTRACE_SYSCALL, tid, None, inject)
+    finally:
+        timer.cancel()
+        proc.returncode = returncode if returncode is not None else -signal.SIGKILL
+    seconds = time.monotonic() - start
+    processes = [TracedProcess(pid, parent.get(pid, 0), counts[pid])
+                 for pid in sorted(set(owner.values())) if pid in counts]
+    return TraceRun(None if timed_out.is_set() else returncode, seconds, processes)
+
+def read_table(path: Path) -> Optional[ProcessCounts]:
+    data = path.read_bytes()
+    if len(data) < TABLE_HEADER.size:
+        return None
+    magic, pid, ppid, total, dropped = TABLE_HEADER.unpack_from(data, 0)
+    if magic != TABLE_MAGIC:
+        return None
+    sites = []
+    for offset in range(TABLE_HEADER.size, len(data) - TABLE_ENTRY.size + 1, TABLE_ENTRY.size):
+        name, count, nframes, *frames = TABLE_ENTRY.unpack_from(data, offset)
+        if name[0] and count:
+            sites.append(CallSite(name.rstrip(b'\0').decode(), count, tuple(frames[:nframes])))
+    return ProcessCounts(pid, ppid, total, dropped, sites, read_maps(path.with_suffix('.maps')))
+
+def read_maps(path: Path) -> List[Mapping]:
+    maps = []
+    try:
+        lines = path.read_text().splitlines()
+    except OSError:
+        return maps
+    for line in lines:
+        parts = line.split(maxsplit=5)
+        if len(parts) == 6 and parts[5].startswith('/'):
+            start, end = (int(x, 16) for x in parts[0].split('-'))
+            maps.append(Mapping(start, end, int(parts[2], 16), parts[5]))
+    return maps
+
+
+# --- Resolving call sites ---
+
+def _elf_type(path: str, cache: Dict[str, int]) -> int:
+    if path not in cache:
+        try:
+            with open(path, 'rb') as f:
+                cache[path] = int.from_bytes(f.read(18)[16:18], 'little')
+        except OSError:
+            cache[path] = 0
+    return cache[path]
+
+def _file_address(maps: List[Mapping], address: int, elf_types: Dict[str, int]) -> Optional[Tuple[str, int]]:
+    """The module and the address within it, as addr2line expects it."""
+    for m in maps:
+        if m.start <= address < m.end:
+            # Return addresses point after the call; -1 lands on the calling line
+            if _elf_type(m.path, elf_types) == ELF_TYPE_EXEC:
+                return m.path, address - 1
+            return m.path, address - (m.start - m.offset) - 1
+    return None
+
+def resolve_locations(addresses: Dict[str, set]) -> Dict[Tuple[str, int], Tuple[str, str, int]]:
+    """(module, address) -> (function, file, line), using addr2line."""
+    resolved = {}
+    for module, addrs in addresses.items():
+        addrs = sorted(addrs)
+        try:
+            proc = subprocess.run(['addr2line', '-f', '-C', '-e', module, *(hex(a) for a in addrs)],
+                                  capture_output=True, text=True, timeout=30)
+        except (FileNotFoundError, subprocess.TimeoutExpired):
+            break
+        lines = proc.stdout.splitlines()
+        for addr, function, location in zip(addrs, lines[0::2], lines[1::2]):
+            file, _, line = location.rpartition(':')
+            line = line.split()[0] if line else '0'
+            resolved[(module, addr)] = (function, file, int(line) if line.isdigit() else 0)
+    return resolved
+
+def attribute_sites(run: ProfileRun, source_name: str, shim: Path) -> Dict[Tuple[str, str], Dict[int, int]]:
+    """
+    Groups the counts by (call, location) -> {pid: count}. The location is the
+    first frame in the task's source file, or else the first frame outside the
+    counter and libc (e.g. the framework's own I/O).
+    """
+    elf_types: Dict[str, int] = {}
+    candidates: Dict[Tuple[int, CallSite], List[Tuple[str, int]]] = {}
+    wanted = defaultdict(set)
+    for process in run.processes:
+        for site in process.sites:
+            frames = []
+            for address in site.frames:
+                located = _file_address(process.maps, address, elf_types)
+                if located and located[0] != str(shim) and '/libc.so' not in located[0] and '/libc-' not in located[0]:
+                    frames.append(located)
+                    wanted[located[0]].add(located[1])
+            candidates[(process.pid, site)] = frames
+    resolved = resolve_locations(wanted)
+
+    grouped: Dict[Tuple[str, str], Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+    for (pid, site), frames in candidates.items():
+        label = 'unknown'
+        described = [(f, resolved.get(f)) for f in frames]
+        in_source = [(f, r) for f, r in described if r and Path(r[1]).name == source_name]
+        chosen = in_source[0] if in_source else next(((f, r) for f, r in described if r and r[2]), None)
+        if chosen:
+            function, file, line = chosen[1]
+            label = f"{Path(file).name}:{line} ({function})"
+        elif frames:
+            label = f"{Path(frames[0][0]).name}+{frames[0][1]:#x}"
+        grouped[(site.name, label)][pid] += site.count
+    return grouped
+
+
+# --- History ---
+
+def load_history() -> Dict[str, List[dict]]:
+    try:
+        return json.loads(HISTORY_FILE.read_text())
+    except (OSError, ValueError):
+        return {}
+
+def run_method(traced: Optional[TraceRun]) -> str:
+    return METHOD_PTRACE if traced else METHOD_WRAPPERS
+
+def run_totals(run: ProfileRun, traced: Optional[TraceRun]) -> Tuple[int, int]:
+    """Max per process and total: whole-process counts when traced, libc wrapper calls otherwise."""
+    counts = [p.total for p in (traced.processes if traced else run.processes)]
+    return max(counts, default=0), sum(counts)
+
+def record_run(c_file: Path, run: ProfileRun, traced: Optional[TraceRun]) -> List[dict]:
+    """Appends the run to the task's history and returns the earlier runs."""
+    history = load_history()
+    key = str(c_file.resolve())
+    runs = history.get(key, [])
+    earlier = list(runs)
+    most, total = run_totals(run, traced)
+    runs.append({
+        'time': time.time(),
+        'source': hashlib.sha256(c_file.read_bytes()).hexdigest()[:12],
+        'returncode': (traced or run).returncode,
+        'method': run_method(traced),
+        'max': most,
+        'total': total,
+        'processes': len((traced or run).processes),
+    })
+    history[key] = runs[-HISTORY_PER_TASK:]
+    HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = HISTORY_FILE.with_suffix('.tmp')
+    tmp.write_text(json.dumps(history, indent=1))
+    os.replace(tmp, HISTORY_FILE)
+    return earlier
+
+
+# --- Reporting ---
+
+def budget_bar(count: int, width: int = 30) -> str:
+    filled = min(width, round(width * count / SYSCALL_LIMIT))
+    return '[' + '#' * filled + '.' * (width - filled) + ']'
+
+def print_report(c_file: Path, run: ProfileRun, traced: Optional[TraceRun],
+                 grouped: Dict[Tuple[str, str], Dict[int, int]], earlier: List[dict], top: int):
+    timing = traced or run
+    status = 'timed out' if timing.returncode is None else f"exit code {timing.returncode}"
+    print(f"\nSyscalls of {c_file.name} ({status}, {timing.seconds:.2f}s); limit {SYSCALL_LIMIT} per execution")
+
+    if traced and traced.processes:
+        pids = {p.pid for p in traced.processes}
+        print(f"\n{'Process':<22} {'Syscalls':>8}  {'Budget':>6}")
+        for p in traced.processes:
+            role = 'main' if p.ppid not in pids else f"child of {p.ppid}"
+            ratio = p.total / SYSCALL_LIMIT
+            flag = '  OVER THE LIMIT' if p.total >= SYSCALL_LIMIT else ('  close to the limit' if ratio >= WARN_RATIO else '')
+            print(f"{f'{p.pid} ({role})':<22} {p.total:>8}  {ratio:>6.0%} {budget_bar(p.total)}{flag}")
+    elif run.processes:
+        # Without ptrace there is no whole-process count, so no budget is claimed
+        print("\nptrace is not permitted here, so only calls through the libc wrappers were counted; "
+              "stdio, malloc and the dynamic loader add more. The real totals are higher.")
+        pids = {p.pid for p in run.processes}
+        print(f"\n{'Process':<22} {'libc calls':>10}")
+        for p in sorted(run.processes, key=lambda p: p.pid):
+            role = 'main' if p.ppid not in pids else f"child of {p.ppid}"
+            print(f"{f'{p.pid} ({role})':<22} {f'>= {p.total}':>10}")
+    else:
+        print("  No counts were recorded (is the binary statically linked?)")
+        return
+
+    if grouped:
+        print("\nCall sites (libc wrapper calls only, from a run with the counter preloaded; "
+              "syscalls inside stdio, malloc and the loader are not attributed):")
+        print(f"{'Call':<10} {'Count':>7} {'Max/proc':>8}  Location")
+        rows = sorted(grouped.items(), key=lambda item: -sum(item[1].values()))
+        for (name, label), per_pid in rows[:top]:
+            print(f"{name:<10} {sum(per_pid.values()):>7} {max(per_pid.values()):>8}  {label}")
+        if len(rows) > top:
+            print(f"... {len(rows) - top} more call sites (use --top)")
+
+    method = run_method(traced)
+    earlier = [r for r in earlier if r.get('method', METHOD_WRAPPERS) == method]
+    if earlier:
+        print(f"\nEarlier runs of this file (max per process / total{'' if traced else ', libc calls'}):")
+        for r in earlier[-5:]:
+            when = datetime.fromtimestamp(r['time']).strftime('%Y-%m-%d %H:%M')
+            state = 'timeout' if r['returncode'] is None else f"exit {r['returncode']}"
+            print(f"  {when}  {r['max']:>5} / {r['total']:<6} {state:<8} source {r['source']}")
+        current, total = run_totals(run, traced)
+        change = current - earlier[-1]['max']
+        print(f"  now               {current:>5} / {total:<6} "
+              f"({'+' if change > 0 else ''}{change} since the last run)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the syscalls of a task's tests against the 1024-syscall limit.")
+    parser.add_argument('file', type=Path, help="Path to the task's C file")
+    parser.add_argument('--timeout', type=int, default=RUN_TIMEOUT, help="Timeout for the test run in seconds")
+    parser.add_argument('--top', type=int, default=15, help="Number of call sites to show")
+    parser.add_argument('--no-build', action='store_true', help="Profile the existing binary without running make")
+    parser.add_argument('--no-history', action='store_true', help="Don't record this run")
+    args = parser.parse_args()
+
+    c_file = args.file.resolve()
+    try:
+        if not c_file.is_file():
+            raise ProfileError(f"File not found at '{args.file}'")
+        shim = build_shim()
+        if not args.no_build:
+            print(f"Running 'make {c_file.stem}' in {c_file.parent}...", file=sys.stderr)
+            returncode, output = build_task(c_file)
+            if returncode != 0:
+                print(output.rstrip()[-2000:], file=sys.stderr)
+                print(f"(make exited with {returncode}; profiling the binary anyway)", file=sys.stderr)
+        binary = c_file.with_suffix('')
+        if not os.access(binary, os.X_OK):
+            raise ProfileError(f"No executable '{binary.name}' next to {c_file.name}; did 'make {c_file.stem}' build it?")
+
+        traced = trace_syscalls(binary, args.timeout)
+        run = run_profiled(binary, shim, args.timeout)
+        grouped = attribute_sites(run, c_file.name, shim)
+        earlier = load_history().get(str(c_file), []) if args.no_history else record_run(c_file, run, traced)
+        print_report(c_file, run, traced, grouped, earlier, args.top)
+    except ProfileError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
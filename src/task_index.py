@@ -0,0 +1,255 @@
+"""
+Persistent index of the tasks in ~/pb152.
+
+Walking every week directory, checking every `.pristine` sibling and reading
+every `00_intro.txt` is slow on networked home directories. The index keeps
+that information in `exams.index.json` next to the progress file and only
+rescans week directories whose mtime changed since the last run.
+"""
+import os
+import re
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set
+
+# --- Configuration ---
+INDEX_FILE = 'exams.index.json'
+INDEX_VERSION = 2    # 2: intro words keep duplicates, as the generator samples from them
+MONTH_DIR_PATTERN = re.compile(r'^(0[1-9]|1[0-2])$')
+TASK_FILE_PATTERN = re.compile(r'^([pr])\d.*\.c$', re.IGNORECASE)
+SUPPORT_FILES = ['pb152.cpp', 'pb152io.c', '.helper.sh']
+INTRO_FILE = '00_intro.txt'
+TEXT_SOURCE_FILE = 'text/pb152.reference.txt'
+
+
+class TaskEntry(NamedTuple):
+    week: str
+    name: str
+    kind: str       # 'p' or 'r'
+    pristine: bool  # a `<name>.pristine` sibling exists
+
+    @property
+    def task_id(self) -> str:
+        """The identifier used in the progress file, e.g. '04/p1_host.c'."""
+        return f"{self.week}/{self.name}"
+
+    def path(self, root: Path) -> Path:
+        return root / self.week / self.name
+
+    def source_path(self, root: Path) -> Path:
+        """The file an exam should be generated from (pristine if available)."""
+        name = self.name + '.pristine' if self.pristine else self.name
+        return root / self.week / name
+
+
+class WeekEntry(NamedTuple):
+    week: str
+    mtime: float
+    topic: str
+    has_makefile: bool
+    support_files: List[str]
+    tasks: List[TaskEntry]
+
+
+def _scan_week(week_dir: Path, mtime: float) -> WeekEntry:
+    """Reads a single week directory from disk."""
+    names = set()
+    with os.scandir(week_dir) as it:
+        for entry in it:
+            names.add(entry.name)
+
+    topic = "???"
+    if INTRO_FILE in names:
+        try:
+            with open(week_dir / INTRO_FILE, 'r', encoding='utf-8') as f:
+                first_line = f.readline()
+                # Topic is usually '# <Topic Name>'
+                if first_line.startswith("#"):
+                    topic = first_line[1:].strip()
+        except Exception:
+            pass
+
+    tasks = []
+    for name in sorted(names):
+        match = TASK_FILE_PATTERN.match(name)
+        if not match:
+            continue
+        tasks.append(TaskEntry(
+            week=week_dir.name,
+            name=name,
+            kind=match.group(1).lower(),
+            pristine=(name + '.pristine') in names,
+        ))
+
+    return WeekEntry(
+        week=week_dir.name,
+        mtime=mtime,
+        topic=topic,
+        has_makefile='makefile' in names,
+        support_files=[f for f in SUPPORT_FILES if f in names],
+        tasks=tasks,
+    )
+
+
+class TaskIndex:
+    """Cached view of the week directories of a pb152 root."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.path = root / INDEX_FILE
+        self.root_mtime: Optional[float] = None
+        self.week_names: List[str] = []
+        self.weeks: Dict[str, WeekEntry] = {}
+        self.words_mtime: Optional[float] = None
+        self.words: List[str] = []
+        self.dirty = False
+
+    # --- Persistence ---
+
+    def _load(self):
+        try:
+            with self.path.open() as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+            return
+        try:
+            self.root_mtime = data['root_mtime']
+            self.week_names = list(data['week_names'])
+            for week, w in data['weeks'].items():
+                self.weeks[week] = WeekEntry(
+                    week=week,
+                    mtime=w['mtime'],
+                    topic=w['topic'],
+                    has_makefile=w['has_makefile'],
+                    support_files=list(w['support_files']),
+                    tasks=[TaskEntry(week, t[0], t[1], bool(t[2])) for t in w['tasks']],
+                )
+            self.words_mtime = data.get('words_mtime')
+            self.words = list(data.get('words', []))
+        except (KeyError, TypeError, IndexError):
+            logging.debug("Task index is malformed, rebuilding.")
+            self.root_mtime = None
+            self.week_names = []
+            self.weeks = {}
+
+    def save(self):
+        """Writes the index back to disk if anything changed."""
+        if not self.dirty:
+            return
+        data = {
+            'version': INDEX_VERSION,
+            'root_mtime': self.root_mtime,
+            'week_names': self.week_names,
+            'weeks': {
+                week: {
+                    'mtime': w.mtime,
+                    'topic': w.topic,
+                    'has_makefile': w.has_makefile,
+                    'support_files': w.support_files,
+                    'tasks': [[t.name, t.kind, int(t.pristine)] for t in w.tasks],
+                }
+                for week, w in self.weeks.items()
+            },
+            'words_mtime': self.words_mtime,
+            'words': self.words,
+        }
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            with tmp_path.open('w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as e:
+            logging.debug(f"Could not save task index: {e}")
+
+    # --- Refresh ---
+
+    def refresh(self):
+        """Rescans the root listing and every week directory whose mtime changed."""
+        root_mtime = self.root.stat().st_mtime
+        if root_mtime != self.root_mtime:
+            with os.scandir(self.root) as it:
+                week_names = sorted(
+                    e.name for e in it
+                    if MONTH_DIR_PATTERN.match(e.name) and e.is_dir()
+                )
+            self.root_mtime = root_mtime
+            self.week_names = week_names
+            self.dirty = True
+
+        for week in list(self.weeks):
+            if week not in self.week_names:
+                del self.weeks[week]
+                self.dirty = True
+
+        for week in self.week_names:
+            week_dir = self.root / week
+            try:
+                mtime = week_dir.stat().st_mtime
+            except OSError:
+                self.weeks.pop(week, None)
+                self.dirty = True
+                continue
+            cached = self.weeks.get(week)
+            if cached is not None and cached.mtime == mtime:
+                continue
+            logging.debug(f"Rescanning week {week}")
+            self.weeks[week] = _scan_week(week_dir, mtime)
+            self.dirty = True
+
+    # --- Queries ---
+
+    def week_entries(self, target_weeks: Optional[Set[str]] = None) -> List[WeekEntry]:
+        return [
+            self.weeks[w] for w in self.week_names
+            if w in self.weeks and (not target_weeks or w in target_weeks)
+        ]
+
+    def tasks(self, target_weeks: Optional[Set[str]] = None,
+              include_p: bool = True, include_r: bool = True) -> List[TaskEntry]:
+        kinds = set()
+        if include_p: kinds.add('p')
+        if include_r: kinds.add('r')
+        return [
+            t for w in self.week_entries(target_weeks)
+            for t in w.tasks if t.kind in kinds
+        ]
+
+    def newest_makefile_week(self) -> Optional[str]:
+        """The latest week directory that contains a makefile template."""
+        for week in reversed(self.week_names):
+            entry = self.weeks.get(week)
+            if entry is not None and entry.has_makefile:
+                return week
+        return None
+
+    def intro_words(self) -> List[str]:
+        """Words from the course reference text, cached by the file's mtime."""
+        ref_file = self.root / TEXT_SOURCE_FILE
+        try:
+            mtime = ref_file.stat().st_mtime
+        except OSError:
+            return []
+        if mtime != self.words_mtime:
+            try:
+                with open(ref_file, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                words = [w for w in re.findall(r'\w+', content) if len(w) > 2]
+            except Exception:
+                words = []
+            self.words = words
+            self.words_mtime = mtime
+            self.dirty = True
+        return self.words
+
+
+def load_task_index(root: Path) -> TaskIndex:
+    """Loads the cached index for `root`, refreshes stale weeks and saves it."""
+    index = TaskIndex(root)
+    index._load()
+    index.refresh()
+    index.save()
+    return index
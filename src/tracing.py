@@ -0,0 +1,147 @@
+"""
+Lightweight span tracing for `--profile`.
+
+    with span('copy tasks', count=5):
+        ...
+
+While tracing is disabled (the default) `span()` returns a shared no-op
+context manager, so instrumented code pays one global lookup and a function
+call per span. `enable()` starts recording; `print_summary()` prints a
+timing tree and `write_chrome_trace()` writes the spans as Chrome trace
+events, which chrome://tracing and https://ui.perfetto.dev can open.
+"""
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, TextIO
+
+_NULL_SPAN = nullcontext()
+_tracer: Optional['Tracer'] = None
+# Nesting depth; a context variable so asyncio tasks and threads each get their own
+_depth = contextvars.ContextVar('span_depth', default=0)
+
+
+class Span(NamedTuple):
+    name: str
+    start: float     # seconds since the tracer was enabled
+    duration: float
+    depth: int
+    thread: int
+    args: dict
+
+
+class _ActiveSpan:
+    def __init__(self, tracer: 'Tracer', name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.depth = _depth.get()
+        self.token = _depth.set(self.depth + 1)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        _depth.reset(self.token)
+        self.tracer._record(Span(self.name, self.start - self.tracer.origin, end - self.start,
+                                 self.depth, threading.get_ident(), self.args))
+        return False
+
+
+class Tracer:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def _record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+
+def enable():
+    """Starts recording spans."""
+    global _tracer
+    _tracer = Tracer()
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def span(name: str, **args):
+    """A context manager timing the enclosed block as `name` (no-op unless tracing is enabled)."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _ActiveSpan(_tracer, name, args)
+
+
+def propagate(func: Callable) -> Callable:
+    """Wraps `func` so spans it opens in worker threads nest under the caller's current span."""
+    if _tracer is None:
+        return func
+    depth = _depth.get()
+
+    def wrapper(*args, **kwargs):
+        token = _depth.set(depth)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _depth.reset(token)
+    return wrapper
+
+
+def spans() -> List[Span]:
+    return sorted(_tracer.spans, key=lambda s: s.start) if _tracer else []
+
+
+def print_summary(file: TextIO = sys.stderr):
+    """Prints every span as an indented tree, with threads other than the main one marked."""
+    recorded = spans()
+    if not recorded:
+        return
+    main_thread = threading.main_thread().ident
+    width = max(len(s.name) + 2 * s.depth for s in recorded)
+    print(f"\n{'Phase':<{width}}  {'Start':>8}  {'Time':>9}", file=file)
+    print("-" * (width + 21), file=file)
+    for s in recorded:
+        label = '  ' * s.depth + s.name
+        thread = '' if s.thread == main_thread else '  [worker]'
+        print(f"{label:<{width}}  {s.start * 1000:6.1f}ms  {s.duration * 1000:7.2f}ms{thread}", file=file)
+    total = max(s.start + s.duration for s in recorded)
+    print("-" * (width + 21), file=file)
+    print(f"{'total':<{width}}  {'':>8}  {total * 1000:7.2f}ms\n", file=file)
+
+
+def write_chrome_trace(path: Path):
+    """Writes the spans in the Chrome trace event format."""
+    pid = os.getpid()
+    events = [
+        {
+            'name': s.name, 'ph': 'X', 'pid': pid, 'tid': s.thread,
+            'ts': round(s.start * 1e6, 3), 'dur': round(s.duration * 1e6, 3),
+            'args': {k: str(v) for k, v in s.args.items()},
+        }
+        for s in spans()
+    ]
+    path.write_text(json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}), encoding='utf-8')
+
+
+def finish(trace_path: Optional[Path], file: TextIO = sys.stderr):
+    """Prints the summary and writes the trace file, if tracing is enabled."""
+    if _tracer is None:
+        return
+    print_summary(file)
+    if trace_path:
+        try:
+            write_chrome_trace(trace_path)
+            print(f"Trace written to {trace_path}", file=file)
+        except OSError as e:
+            print(f"Could not write trace file: {e}", file=file)